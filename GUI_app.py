@@ -7,8 +7,11 @@ from PIL import Image
 from PIL import ImageTk
 
 from fpsManager import FpsManager
+from frame_encoder import FrameEncoder
+from games.sprite_cache import SpriteCache, sprites
 from game_controller import GameController
 from matrix_controller import MatrixController
+from timer import DeadlineSleeper
 
 
 class GUIapp:
@@ -97,7 +100,7 @@ class GUIapp:
         if self._data_updated:
             self._data_updated = False
             # Create image from numpy array
-            im = Image.fromarray(self.matrix_controller.displayed_data)
+            im = Image.fromarray(self.matrix_controller.get_rgb_data())
             im = im.resize((self.canvas_dims[0], self.canvas_dims[1]))
             self.photo = ImageTk.PhotoImage(image=im)
             self.canvas.create_image(0, 0, image=self.photo, anchor=tkinter.NW)
@@ -117,15 +120,64 @@ class GUIapp:
         self.master.after(sleep_time, self._refresh_gui)
 
     def update_gui_fps(self):
-        self.gui_fps_var.set("GUI fps={}".format(self.gui_fps.current_fps))
+        gui_string = "GUI fps={}".format(self.gui_fps.current_fps)
+        clock = self.matrix_controller.clock
+        if clock is not None:
+            gui_string += "\nGame: skipped frames={skipped frames} dropped steps={dropped steps}".format(
+                **clock.stats()
+            )
+        gui_string += "\n" + self._format_stage_timers(
+            {name: (timer.average, timer.maximum) for name, timer in self.matrix_controller.stage_timers.items()}
+        )
+        self.gui_fps_var.set(gui_string)
 
     def update_bus_fps(self):
         fps_string = ""
         for bus in self.matrix_controller.board_buses:
-            fps_string += "{0} {LED update.current_fps} {Sensor poll.current_fps}\
-             {Sensor response.current_fps}\n".format(bus.serial_connection.name, **bus.fps)
+            # Bus may run in another process - only it's status snapshot is available
+            status = bus.status()
+            fps_string += "{0} {LED update} {Sensor poll} {Sensor response}\n".format(status["name"], **status["fps"])
+            fps_string += "slots: pong={pong}us sensor={sensor_data}us info={info}us headroom={headroom:.0%}\n".format(
+                **status["timing"]
+            )
+            fps_string += "overruns={overruns} dirty={dirty tiles}/{boards} deferred={deferred tiles}\n".format(
+                **status
+            )
+            fps_string += "frames: sent={frames sent} dropped={frames dropped}\n".format(**status)
+            fps_string += self._format_stage_timers(status["stage timers"]) + "\n"
+            fps_string += self._format_overshoot(status["silence waits"]) + "\n"
+        if FrameEncoder.tile_cache is not None:
+            fps_string += "tile cache: hits={} misses={}\n".format(
+                FrameEncoder.tile_cache.hits, FrameEncoder.tile_cache.misses
+            )
+        if SpriteCache.max_size > 0:
+            fps_string += "sprite cache: hits={} misses={} evicted={} ({:.0%})\n".format(
+                sprites.hits, sprites.misses, sprites.evictions, sprites.hit_rate
+            )
         self.bus_fps_var.set(fps_string)
 
+    @staticmethod
+    def _format_stage_timers(stage_timers):
+        """
+        @param stage_timers: dictionary of stage name -> (average, maximum) time in seconds
+        """
+        return " ".join(
+            "{}={:.1f}/{:.1f}ms".format(name, average * 1000, maximum * 1000)
+            for name, (average, maximum) in stage_timers.items()
+        )
+
+    @staticmethod
+    def _format_overshoot(silence_waits):
+        """
+        @param silence_waits: DeadlineSleeper snapshot
+        """
+        last_bound = DeadlineSleeper.histogram_bins[-1]
+        bins = " ".join(
+            "<{}:{}".format(bound, count) if bound is not None else ">{}:{}".format(last_bound, count)
+            for bound, count in silence_waits["histogram"]
+        )
+        return "silence overshoot(us): {} max={:.0f}".format(bins, silence_waits["max overshoot"] * 1000000)
+
     def update_sensor_fps(self):
         fps_string = ""
         for bus in self.matrix_controller.board_buses:
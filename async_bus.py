@@ -0,0 +1,217 @@
+__author__ = 'Mark Laane'
+
+import asyncio
+import concurrent.futures
+import io
+import logging
+import threading
+import time
+
+from board_bus import BoardBus
+
+
+class BusEventLoop():
+    """
+    Event loop thread shared by all asynchronous buses. Started by the first bus and stopped by the last one.
+    """
+    _lock = threading.Lock()
+    _loop = None
+    _thread = None
+    _users = 0
+
+    @staticmethod
+    def acquire():
+        """
+        @return: running event loop
+        """
+        with BusEventLoop._lock:
+            if BusEventLoop._loop is None:
+                # Selector loop everywhere - proactor loop (Windows default) has no add_reader
+                BusEventLoop._loop = asyncio.SelectorEventLoop()
+                BusEventLoop._thread = threading.Thread(
+                    target=BusEventLoop._loop.run_forever, name="Bus Loop", daemon=True
+                )
+                BusEventLoop._thread.start()
+            BusEventLoop._users += 1
+            return BusEventLoop._loop
+
+    @staticmethod
+    def release():
+        """
+        Stops the loop when no bus uses it anymore
+        """
+        with BusEventLoop._lock:
+            BusEventLoop._users -= 1
+            if BusEventLoop._users == 0:
+                BusEventLoop._loop.call_soon_threadsafe(BusEventLoop._loop.stop)
+                BusEventLoop._thread.join()
+                BusEventLoop._loop.close()
+                BusEventLoop._loop = BusEventLoop._thread = None
+
+
+class AsyncBoardBus(BoardBus):
+    """
+    BoardBus running in the shared event loop instead of it's own threads (same interface as BoardBus).
+
+    Serial port is read when it's file descriptor becomes readable, silence windows are waited with event loop timers
+    and responses are processed from an asyncio queue. N buses cost one thread instead of 3N and stopping does not
+    wait for poll timeouts.
+    """
+    poll_period = 0.0005  # How often (seconds) port is read if it has no file descriptor (simulator, Windows)
+
+    def __init__(self, serial_connection, frames, channel_order=(0, 1, 2)):
+        """
+        Args: see BoardBus
+        """
+        super().__init__(serial_connection, frames, channel_order)
+        self.threads = []  # Everything is done in the event loop
+        self.name = "{} Async".format(self.serial_connection.name)
+
+        self._loop = None
+        self._task = None  # concurrent.futures.Future of the bus coroutine
+        self._wake_up = None  # asyncio.Event - scheduler got a job or bus is stopping
+        self._received = None  # asyncio.Queue of responses (None ends processing)
+        self._reader_fd = None  # File descriptor watched by event loop
+        self._poll_handle = None  # Timer of the next port poll (if port has no file descriptor)
+
+    def start(self):
+        self._stop_flag = False
+        self._loop = BusEventLoop.acquire()
+        self._task = asyncio.run_coroutine_threadsafe(self._run(), self._loop)
+
+    def join(self, timeout=None):
+        """
+        Stops the bus and waits until boards are turned off
+        """
+        self.stop()
+        if self._task is None:
+            return
+        try:
+            self._task.result(timeout)
+        except concurrent.futures.TimeoutError:
+            logging.warning("{} did not stop in time".format(self.name))
+            return
+        except Exception:
+            logging.exception("{} stopped with an error".format(self.name))
+        finally:
+            if self._task.done():
+                self._task = None
+                self._loop = None
+                BusEventLoop.release()
+
+    def stop(self):
+        self._stop_flag = True
+        loop = self._loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self._wake)
+
+    def refresh_leds(self, deadline=None):
+        self._set_refresh_deadline(deadline)
+        if not self._frame_published.is_set():
+            # Requests made before the encoding is done are merged into it
+            self._frame_published.set()
+            loop = self._loop
+            if loop is not None:
+                loop.call_soon_threadsafe(self._encode_published)
+
+    def _encode_published(self):
+        self._frame_published.clear()
+        if not self._stop_flag:
+            self._encode_latest()
+
+    def _wake(self):
+        if self._wake_up is not None:
+            self._wake_up.set()
+
+    async def _run(self):
+        logging.debug(self.serial_connection.name + " asynchronous bus started")
+        self._wake_up = asyncio.Event()
+        self._received = asyncio.Queue()
+        loop = self._loop
+        self.scheduler.on_job = lambda: loop.call_soon_threadsafe(self._wake)
+        if self._frame_published.is_set():
+            self._encode_published()  # Refresh requested before start
+        self._start_reading()
+        try:
+            await asyncio.gather(self._send(), self._process())
+        finally:
+            self._stop_reading()
+            self.scheduler.on_job = None
+        logging.debug(self.serial_connection.name + " asynchronous bus stopped")
+
+    async def _send(self):
+        """
+        Waits until bus is silent, then asks scheduler for the next job and executes it (see _run_sending_thread)
+        """
+        while not self._stop_flag:
+            self._wake_up.clear()  # Before waiting for silence - wake ups meanwhile are not lost
+            await self._silence()
+
+            job = self.scheduler.next(timeout=0)
+            if job is None:
+                await self._wake_up.wait()
+                continue
+
+            try:
+                job.function(*job.args)
+            except Exception:
+                logging.exception("{} job {} failed".format(self.name, job.function.__name__))
+
+            if not self.first_ping_is_complete and job.function == self._ping:
+                await self._silence()
+                self.first_ping_is_complete = True
+                logging.debug("Initial ping is complete")
+
+        try:
+            await self._silence()
+            self._turn_off_boards()
+        finally:
+            self._received.put_nowait(None)  # Ends processing
+
+    async def _silence(self):
+        delay = self.silence_until - time.perf_counter()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self.silence_until - time.perf_counter()
+
+    async def _process(self):
+        while True:
+            response = await self._received.get()
+            if response is None:
+                break
+            self._process_response(response)
+
+    def _start_reading(self):
+        self.serial_connection.timeout = 0  # Non-blocking reads
+        try:
+            fd = self.serial_connection.fileno()
+            self._loop.add_reader(fd, self._read)
+        except (AttributeError, OSError, ValueError, NotImplementedError, io.UnsupportedOperation):
+            # No selectable file descriptor - poll the port instead
+            self._poll_handle = self._loop.call_later(AsyncBoardBus.poll_period, self._poll)
+        else:
+            self._reader_fd = fd
+
+    def _stop_reading(self):
+        if self._reader_fd is not None:
+            self._loop.remove_reader(self._reader_fd)
+            self._reader_fd = None
+        if self._poll_handle is not None:
+            self._poll_handle.cancel()
+            self._poll_handle = None
+
+    def _poll(self):
+        self._read()
+        self._poll_handle = self._loop.call_later(AsyncBoardBus.poll_period, self._poll)
+
+    def _read(self):
+        """
+        Reads everything received and queues parsed responses (see _run_receiving_thread)
+        """
+        received_data = self.serial_connection.read(self.serial_connection.inWaiting() or 1)
+        if not received_data:
+            return
+        received_at = time.perf_counter()
+        for response in self._parser.feed(received_data):
+            self.timing.observe(response, self._slot_index(response), received_at)
+            self._received.put_nowait(response)
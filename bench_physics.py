@@ -0,0 +1,284 @@
+"""
+Micro-benchmark of game physics (step + collisions).
+
+Runs the same brick breaker scene with the old geometry classes (dict-backed, velocity as speed and heading) and
+with the game elements (games.game_elements_library Ball and Paddle on the games.physics core, velocity as vx and vy).
+Both sides use their own collide_ball_to_paddle and wall collisions, bricks bounce balls the way Breaker does.
+Scene: balls bouncing in a 100x100 field with walls, a paddle and 24 bricks (bricks are not removed).
+Before timing, both scenes are stepped side by side and every step has to move the balls the same way (up to
+rounding - legacy balls are synced to the new ones after each step, so bounces do not magnify rounding errors).
+Usage:
+    python bench_physics.py [balls] [steps]
+"""
+__author__ = 'Mark Laane'
+
+import math
+import random
+import sys
+import timeit
+
+from games.game_elements_library import Ball, Paddle, collide_ball_to_paddle
+from games.physics import Rectangle, collide_to_left_wall, collide_to_right_wall, collide_to_top_wall, \
+    collide_to_bottom_wall
+
+
+class LegacyRectangle():
+    """
+    Rectangle that was used in games before games.physics
+    """
+
+    def __init__(self, left, top, width, height):
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+
+    @property
+    def right(self):
+        return self.left + self.width
+
+    @property
+    def bottom(self):
+        return self.top + self.height
+
+    @property
+    def center_x(self):
+        return self.left + self.width / 2
+
+    @property
+    def center_y(self):
+        return self.top + self.height / 2
+
+    def intersects(self, other):
+        return not (
+            self.bottom <= other.top or
+            self.top >= other.bottom or
+            self.left >= other.right or
+            self.right <= other.left
+        )
+
+    def intersection(self, other):
+        if self.intersects(other):
+            left = max(self.left, other.left)
+            right = min(self.right, other.right)
+            bottom = min(self.bottom, other.bottom)
+            top = max(self.top, other.top)
+            return LegacyRectangle(left, top, right - left, bottom - top)
+        else:
+            return None
+
+    def union(self, other):
+        left = min(self.left, other.left)
+        right = max(self.right, other.right)
+        bottom = max(self.bottom, other.bottom)
+        top = min(self.top, other.top)
+        return LegacyRectangle(left, top, right - left, bottom - top)
+
+
+class LegacyBall():
+    """
+    Ball (Circle + Moving) that was used in games before games.physics
+    """
+
+    def __init__(self, center_x, center_y, radius, speed, heading):
+        self.center_x = center_x
+        self.center_y = center_y
+        self.radius = radius
+        self.speed = speed
+        self.heading = heading
+
+    @property
+    def left(self):
+        return self.center_x - self.radius
+
+    @left.setter
+    def left(self, value):
+        self.center_x = value + self.radius
+
+    @property
+    def right(self):
+        return self.center_x + self.radius
+
+    @right.setter
+    def right(self, value):
+        self.center_x = value - self.radius
+
+    @property
+    def top(self):
+        return self.center_y - self.radius
+
+    @top.setter
+    def top(self, value):
+        self.center_y = value + self.radius
+
+    @property
+    def bottom(self):
+        return self.center_y + self.radius
+
+    @bottom.setter
+    def bottom(self, value):
+        self.center_y = value - self.radius
+
+    @property
+    def bounding_box(self):
+        return LegacyRectangle(self.left, self.top, self.radius * 2, self.radius * 2)
+
+    @property
+    def speed_x(self):
+        return self.speed * math.cos(self.heading)
+
+    @speed_x.setter
+    def speed_x(self, x_speed):
+        self.speed = (x_speed ** 2 + self.speed_y ** 2) ** 0.5
+        self.heading = math.atan2(self.speed_y, x_speed)
+
+    @property
+    def speed_y(self):
+        return self.speed * math.sin(self.heading)
+
+    @speed_y.setter
+    def speed_y(self, y_speed):
+        self.speed = (y_speed ** 2 + self.speed_x ** 2) ** 0.5
+        self.heading = math.atan2(y_speed, self.speed_x)
+
+    def step(self):
+        last_bounding_box = self.bounding_box
+        self.center_x += self.speed_x
+        self.center_y += self.speed_y
+        return last_bounding_box.union(self.bounding_box)
+
+
+def legacy_collide_ball_to_paddle(ball, paddle):
+    """
+    collide_ball_to_paddle that was used in games before games.physics (paddle is not flipped)
+    """
+    heading_delta = 0.1
+    if paddle.intersection(ball):
+        ball.bottom = paddle.top
+        ball.speed_y = -abs(ball.speed_y)
+
+        if ball.center_x < (paddle.left + paddle.width / 4):
+            ball.heading -= heading_delta
+        elif (paddle.right - paddle.width / 4) < ball.center_x:
+            ball.heading += heading_delta
+
+
+def legacy_step(balls, paddle, bricks, size):
+    for ball in balls:
+        ball.step()
+        legacy_collide_ball_to_paddle(ball, paddle)
+        if ball.left <= 0:
+            ball.speed_x = abs(ball.speed_x)
+            ball.left = 0 - ball.left
+        if ball.right >= size:
+            ball.speed_x = -abs(ball.speed_x)
+            ball.right = 2 * size - ball.right
+        if ball.top <= 0:
+            ball.speed_y = abs(ball.speed_y)
+            ball.top = 0 - ball.top
+        if ball.bottom >= size:
+            ball.speed_y = -abs(ball.speed_y)
+            ball.bottom = 2 * size - ball.bottom
+        for brick in bricks:
+            intersection = brick.intersection(ball)
+            if intersection is not None:
+                if intersection.width > intersection.height:
+                    ball.speed_y = math.copysign(ball.speed_y, ball.center_y - brick.center_y)
+                else:
+                    ball.speed_x = math.copysign(ball.speed_x, ball.center_x - brick.center_x)
+
+
+def step(balls, paddle, bricks, size):
+    for ball in balls:
+        ball.step()
+        collide_ball_to_paddle(ball, paddle)
+        collide_to_left_wall(ball)
+        collide_to_right_wall(ball, size)
+        collide_to_top_wall(ball)
+        collide_to_bottom_wall(ball, size)
+        for brick in bricks:
+            if brick.intersects(ball):
+                if brick.overlap_width(ball) > brick.overlap_height(ball):
+                    ball.vy = math.copysign(ball.vy, ball.center_y - brick.center_y)
+                else:
+                    ball.vx = math.copysign(ball.vx, ball.center_x - brick.center_x)
+
+
+def create_scene(rectangle_class, create_paddle, create_ball, number_of_balls, size=100):
+    """
+    @param create_paddle: function(left, top) returning paddle
+    @param create_ball: function(center_x, center_y, speed, heading) returning ball
+    """
+    random.seed(0)
+    paddle = create_paddle(38, size - 4)
+    bricks = [rectangle_class(8 + x * 14, 15 + y * 6, 14, 6) for y in range(4) for x in range(6)]
+    balls = [
+        create_ball(random.uniform(5, size - 5), random.uniform(45, size - 10), 1.0, random.uniform(0, 2 * math.pi))
+        for _ in range(number_of_balls)
+    ]
+    return balls, paddle, bricks, size
+
+
+def check_same_motion(legacy_scene, scene, steps, tolerance=1e-9):
+    """
+    Steps both scenes side by side and checks that balls end up at the same position with the same velocity.
+
+    @return: biggest difference found
+    """
+    biggest_difference = 0.0
+    for i in range(steps):
+        legacy_step(*legacy_scene)
+        step(*scene)
+        for legacy_ball, ball in zip(legacy_scene[0], scene[0]):
+            difference = max(
+                abs(legacy_ball.center_x - ball.center_x), abs(legacy_ball.center_y - ball.center_y),
+                abs(legacy_ball.speed_x - ball.vx), abs(legacy_ball.speed_y - ball.vy)
+            )
+            assert difference <= tolerance, "Step {}: balls differ by {}".format(i, difference)
+            biggest_difference = max(biggest_difference, difference)
+            legacy_ball.center_x, legacy_ball.center_y = ball.center_x, ball.center_y
+            legacy_ball.speed, legacy_ball.heading = ball.speed, ball.heading
+    return biggest_difference
+
+
+def main():
+    number_of_balls = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    steps = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    def create_legacy_scene():
+        return create_scene(
+            LegacyRectangle,
+            lambda left, top: LegacyRectangle(left, top, Paddle.default_width, Paddle.default_height),
+            lambda center_x, center_y, speed, heading: LegacyBall(
+                center_x, center_y, Ball.default_radius, speed, heading
+            ),
+            number_of_balls
+        )
+
+    difference = check_same_motion(create_legacy_scene(), create_scene(Rectangle, Paddle, Ball, number_of_balls), steps)
+    print("balls move the same way (biggest difference in a step: {:.1e})".format(difference))
+
+    legacy_scene = create_legacy_scene()
+    scene = create_scene(Rectangle, Paddle, Ball, number_of_balls)
+
+    def run_legacy():
+        for _ in range(steps):
+            legacy_step(*legacy_scene)
+
+    def run():
+        for _ in range(steps):
+            step(*scene)
+
+    repeat = 5
+    legacy_time = min(timeit.repeat(run_legacy, number=1, repeat=repeat))
+    new_time = min(timeit.repeat(run, number=1, repeat=repeat))
+    ball_steps = number_of_balls * steps
+    print("{} balls, {} steps, {} bricks".format(number_of_balls, steps, len(scene[2])))
+    print("legacy classes: {:8.2f} ms ({:8.0f} ball steps/s)".format(legacy_time * 1000, ball_steps / legacy_time))
+    print("game elements:  {:8.2f} ms ({:8.0f} ball steps/s)".format(new_time * 1000, ball_steps / new_time))
+    print("speedup: {:.1f}x".format(legacy_time / new_time))
+
+
+
+if __name__ == '__main__':
+    main()
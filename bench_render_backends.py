@@ -0,0 +1,106 @@
+"""
+Benchmark of render backends.
+
+Runs every game for a number of frames and measures per-frame draw time with Cairo and with NumpyContext
+(see MatrixController.render_backend). Both backends get the same game (same random seed and button presses).
+Usage:
+    python bench_render_backends.py [frames] [width] [height]
+    (width and height in boards, default 10 x 10)
+"""
+__author__ = 'Mark Laane'
+
+import random
+import sys
+import time
+
+import numpy
+import cairocffi as cairo
+
+from board_bus import BoardBus
+from game_controller import GameController
+from games import Breaker, Pong
+from games.sprite_cache import sprites
+from numpy_context import NumpyContext, NumpySurface
+
+
+def create_context(backend, width, height):
+    """
+    @return: drawing context of given backend on top of a new frame buffer, surface of it
+    """
+    stride = cairo.ImageSurface.format_stride_for_width(cairo.FORMAT_ARGB32, width)
+    frame = numpy.zeros((height, stride // 4, 4), dtype=numpy.uint8)
+    if backend == "numpy":
+        surface = NumpySurface(frame, width, height)
+        return NumpyContext(surface), surface
+    surface = cairo.ImageSurface.create_for_data(memoryview(frame), cairo.FORMAT_ARGB32, width, height, stride)
+    return cairo.Context(surface), surface
+
+
+def press_button(game, dimensions):
+    """
+    Presses a random button the way GameController connects them
+    """
+    column = random.randrange(dimensions[0])
+    if isinstance(game, Pong):
+        game.button_pressed(random.choice((1, 2)), column)
+    elif isinstance(game, Breaker):
+        game.button_pressed(column)
+    elif hasattr(game, "button_pressed"):
+        board_id, _, _ = random.choice(BoardBus.board_assignment)
+        game.button_pressed(board_id)
+
+
+def run(mode, backend, frames, dimensions):
+    """
+    @return: draw times (seconds) of all frames, None if game can not be drawn with the backend
+    """
+    random.seed(0)
+    sprites.clear()
+    width, height = dimensions[0] * 10, dimensions[1] * 10
+    game = GameController.create_game(mode, (width, height), dimensions)
+    if backend == "numpy" and game.requires_cairo:
+        return None
+    context, surface = create_context(backend, width, height)
+    draw_times = []
+    for i in range(frames):
+        if i % 10 == 0:
+            press_button(game, dimensions)
+        game.step()
+        start = time.perf_counter()
+        if game.interpolates:
+            game.draw(context, 0.0)
+        else:
+            game.draw(context)
+        surface.flush()
+        draw_times.append(time.perf_counter() - start)
+    return draw_times
+
+
+def format_times(draw_times):
+    return "{:6.3f}/{:6.3f}".format(sum(draw_times) / len(draw_times) * 1000, max(draw_times) * 1000)
+
+
+def main():
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    dimensions = (int(sys.argv[2]), int(sys.argv[3])) if len(sys.argv) > 3 else (10, 10)
+    for y in range(dimensions[1]):
+        for x in range(dimensions[0]):
+            BoardBus.add_assignation(128 + dimensions[0] * y + x, x, y)
+
+    print("{} frames on {}x{} pixels, draw time per frame (ms):".format(frames, dimensions[0] * 10, dimensions[1] * 10))
+    print("{:26} {:>15} {:>15} {:>8}".format("game", "cairo avg/max", "numpy avg/max", "speedup"))
+    for mode in GameController.Mode:
+        if mode in (GameController.Mode.show, GameController.Mode.video):
+            continue  # Not drawn (compiled show, pixels written straight to frame)
+        cairo_times = run(mode, "cairo", frames, dimensions)
+        numpy_times = run(mode, "numpy", frames, dimensions)
+        if numpy_times is None:
+            print("{:26} {:>15} {:>15}".format(mode.name, format_times(cairo_times), "(needs Cairo)"))
+            continue
+        print("{:26} {:>15} {:>15} {:>7.1f}x".format(
+            mode.name, format_times(cairo_times), format_times(numpy_times), sum(cairo_times) / sum(numpy_times)
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Micro-benchmark of bus response parsing.
+
+Feeds bus traffic through the old byte-by-byte parser and through ResponseParser.
+Usage:
+    python bench_response_parser.py [capture.bin]
+If capture file (raw bytes read from serial port) is not given, traffic of a 100 board bus is generated:
+one LED refresh with sensor poll (echo) followed by sensor responses of all boards.
+"""
+__author__ = 'Mark Laane'
+
+import random
+import sys
+import timeit
+
+from ledBoard import Board, BROADCAST_ADDRESS
+from response_parser import ResponseParser
+
+
+def legacy_parse(chunks):
+    """
+    Parser that was used in BoardBus receiving thread before ResponseParser
+    """
+    responses = []
+    ignoring_serial_echo = False
+    ignored_buffer = ""
+    current_response = {}
+    for received_data in chunks:
+        for received_byte in received_data:
+            received_char = chr(received_byte)
+
+            if received_char == '<':
+                ignoring_serial_echo = True
+            if ignoring_serial_echo:
+                ignored_buffer += received_char
+                if received_char == '>':
+                    ignoring_serial_echo = False
+                    ignored_buffer = ""
+                continue
+
+            if 128 <= received_byte < 255:
+                current_response = dict()
+                current_response['id'] = received_byte
+            elif received_byte in Board.command_codes:
+                current_response['code'] = Board.Command(received_byte)
+                responses.append(current_response)
+                current_response = {}
+            else:
+                try:
+                    current_response['data'] += received_char
+                except KeyError:
+                    current_response['data'] = received_char
+    return responses
+
+
+def parse(chunks):
+    parser = ResponseParser()
+    responses = []
+    for received_data in chunks:
+        responses += parser.feed(received_data)
+    return responses
+
+
+def generate_traffic(number_of_boards=100, frames=20):
+    """
+    Generates bus traffic as it would be read from serial port (echo of master's commands + responses)
+    """
+    traffic = bytearray()
+    broadcast = Board(BROADCAST_ADDRESS, None)
+    boards = [Board(128 + i, None) for i in range(number_of_boards)]
+    for _ in range(frames):
+        for board in boards:
+            led_data = bytes(random.randrange(64, 128) for _ in range(150))
+            board.encode_command(Board.Command.send_led_data, led_data, traffic)
+        traffic += b"<" + bytes(325) + b">"
+        broadcast.encode_command(Board.Command.request_sensor, output=traffic)
+        for board in boards:
+            traffic.append(board.id)
+            traffic += str(random.randrange(0, 1024)).encode()
+            traffic.append(Board.Command.sensor_data.value)
+    return bytes(traffic)
+
+
+def split_to_chunks(traffic, chunk_size=64):
+    """
+    Splits traffic to chunks like USB-UART bridge delivers them
+    """
+    return [traffic[i:i + chunk_size] for i in range(0, len(traffic), chunk_size)]
+
+
+def main():
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "rb") as capture:
+            traffic = capture.read()
+    else:
+        random.seed(0)
+        traffic = generate_traffic()
+    chunks = split_to_chunks(traffic)
+
+    legacy_responses = legacy_parse(chunks)
+    responses = parse(chunks)
+    print("{} bytes in {} chunks, {} responses (legacy parser: {})".format(
+        len(traffic), len(chunks), len(responses), len(legacy_responses)))
+
+    repeat = 10
+    legacy_time = min(timeit.repeat(lambda: legacy_parse(chunks), number=1, repeat=repeat))
+    new_time = min(timeit.repeat(lambda: parse(chunks), number=1, repeat=repeat))
+    print("legacy parser:   {:8.2f} ms ({:6.2f} MB/s)".format(legacy_time * 1000, len(traffic) / legacy_time / 1e6))
+    print("ResponseParser:  {:8.2f} ms ({:6.2f} MB/s)".format(new_time * 1000, len(traffic) / new_time / 1e6))
+    print("speedup: {:.1f}x".format(legacy_time / new_time))
+
+
+if __name__ == '__main__':
+    main()
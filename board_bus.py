@@ -6,9 +6,27 @@ import logging
 import time
 import queue
 import numpy
+import serial
 
-from ledBoard import Board, BROADCAST_ADDRESS
+from ledBoard import Board, BROADCAST_ADDRESS, COMMAND_OVERHEAD
+from board_registry import BoardRegistry
+from bus_timing import BusTimingModel
+from bus_scheduler import BusScheduler
+from bus_simulator import SimulatedSerial
 from fpsManager import FpsManager
+from frame_encoder import FrameEncoder
+from response_parser import ResponseParser
+from timer import StageTimer, DeadlineSleeper
+
+
+def open_port(port):
+    """
+    Opens serial port. Ports starting with "sim://" open a simulated bus with emulated boards.
+    """
+    if port.startswith(SimulatedSerial.url_scheme + "://"):
+        logging.info("Opening simulated bus {}".format(port))
+        return SimulatedSerial.from_url(port, baudrate=500000)
+    return serial.Serial(port=port, baudrate=500000, writeTimeout=0)
 
 
 class IdPool():
@@ -38,6 +56,56 @@ class IdPool():
                 heapq.heapify(self._pool)  # If we removed an element, lets turn it back to heap again
 
 
+class BusTransaction():
+    """
+    Collects commands for several boards into one contiguous buffer.
+    Whole buffer is written to serial with one write() call, so the USB-UART bridge
+    gets one transfer instead of one per board.
+    """
+    # Byte that no board reacts to. Used (inside echo marks) to keep the bus busy instead of being silent.
+    guard_byte = 0x00
+
+    def __init__(self, serial_connection):
+        self.serial_connection = serial_connection
+        self._buffer = bytearray()
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def add(self, board, command, data=None):
+        """
+        Appends one <id data cmd> frame to the transaction
+        """
+        board.encode_command(command, data, self._buffer)
+
+    def add_command(self, command):
+        """
+        Appends complete, already encoded <id data cmd> frame
+        """
+        self._buffer += command
+
+    def add_guard(self, n_bytes):
+        """
+        Appends n_bytes of guard data, enclosed in echo marks.
+        Boards ignore it, so it works as a precisely timed pause between two commands.
+        """
+        self._buffer.append(ord("<"))
+        self._buffer += bytes([BusTransaction.guard_byte]) * n_bytes
+        self._buffer.append(ord(">"))
+
+    def flush(self):
+        """
+        Writes everything collected so far with one write() call.
+
+        @return: number of bytes written
+        """
+        n_bytes = len(self._buffer)
+        if n_bytes:
+            self.serial_connection.write(self._buffer)
+            self._buffer = bytearray()
+        return n_bytes
+
+
 class BoardBus(threading.Thread):
     """
     This class describes all properties and functions of one bus.
@@ -45,17 +113,10 @@ class BoardBus(threading.Thread):
     Each bus has it's own thread.
     """
 
-    # Maximum amount of time board can be busy (for example rendering image)
-
-
-    # I perfected it by setting sensor_update and data_update FPS to 100 (more than possible)
-    # Then I put one probe on RS-bus and other on MCU LED-data output.
-    # Then adjusted value so that next sensor poll would not overlap LED'data output.
-    led_data_transfertime = 3.2  # Measured one packet transfer time:
-    led_data_rendertime = 3  # Measured one render time: 3ms
-    led_data_time_to_render = 2.5  # Time from end of transfer to start of render: 2.5ms
-
     board_assignment = []
+    registry = BoardRegistry()  # Indexes of assignments and enumerated boards of all buses
+    # Share of the time until next frame that LED data may take (rest is left for sensors), None - send everything
+    led_time_share = 0.8
 
     _id_pool3 = IdPool()
 
@@ -65,45 +126,67 @@ class BoardBus(threading.Thread):
         Adds assignation to a list so bus knows what part of image data to send to board with specified ID. (when found)
         """
         BoardBus.board_assignment.append([board_id, x, y])
+        BoardBus.registry.add_assignment(board_id, x, y)
         BoardBus._id_pool3.push(board_id)
 
-    def __init__(self, serial_connection, data):
+    def __init__(self, serial_connection, frames, channel_order=(0, 1, 2)):
+        """
+        Args:
+            serial_connection: serial.Serial (or SimulatedSerial) of the bus
+            frames: FrameReader giving frames (numpy arrays (height, width, channels)) to be displayed on boards
+            channel_order: index of red, green and blue channel in frames
+        """
         super().__init__()
         self.serial_connection = serial_connection
-        self.data = data
+        self.frames = frames
 
         self.fps = {
             "LED update": FpsManager(),
             "Sensor poll": FpsManager(),
             "Sensor response": FpsManager()
         }
+        # Time spent in pipeline stages of the bus
+        self.stage_timers = {
+            "Encode": StageTimer(),
+            "Transmit": StageTimer()
+        }
 
         self.name = "{} Send".format(self.serial_connection.name)
 
         self._stop_flag = False  # event used to stop the threads
         self.first_ping_is_complete = False  # Disable sensor polling until first ping is done
 
-        # These two flags can be counter-intuitive - True blocks new calls going in queue!
-        # these flags show whether call is already in queue (we only allow one of each)
-        self._update_display_flag = False  # update is pending (is currently in queue)
-        self._read_sensors_flag = False  # reading sensors is pending (is currently in queue)
-
-        self._command_queue = queue.Queue()  # Queue of functions - to be executed in BoardBus thread in order
+        # Plans functions to be executed in BoardBus send thread (LED refresh, sensor poll and maintenance slots)
+        self.scheduler = BusScheduler()
 
-        self.ignoring_serial_echo = False
-        self.ignored_buffer = ""
+        self._parser = ResponseParser()
 
         self.boards = []  # list of boards connected to this bus
+        self._transaction = BusTransaction(self.serial_connection)  # LED refresh (and sensor poll) is written at once
+        self._encoder = FrameEncoder(self.frames.shape, channel_order)  # Encodes frames for numbered boards
+        self.dirty_tiles = 0  # Number of changed boards found by last LED refresh
+        self.deferred_tiles = 0  # Number of changed boards left for next LED refresh (did not fit in time budget)
+        # Encoding stage: new frame is encoded in it's own thread, while previous one is being sent
+        self._frame_published = threading.Event()
+        self._refresh_deadline = None
+        self._frame_period = None  # Time (seconds) from last refresh request to it's deadline
+        # Compiled show (ShowFile) being played instead of encoded frames
+        self._show = None
+        self._show_frame = None  # (show, frame index) to be sent in next LED slot
+        self._show_index = None  # Index of the last frame sent
+        self._show_boards = set()  # Ids of the boards that have received a full frame of the show
 
         # All boards will listen if data is sent to this board
         self._broadcast_board = Board(BROADCAST_ADDRESS, self.serial_connection)
 
         self._responses = queue.Queue()
-        self.current_response = {}
 
         # Time when transfer should end (this is used when sending LED data because USB-uart bridge buffers data)
         # This is set to estimate time when the transfer should end.
-        self.silence_until = time.time()
+        # (time.perf_counter() - silence windows are shorter than a millisecond and must not follow wall clock changes)
+        self.silence_until = time.perf_counter()
+        self.silence_sleeper = DeadlineSleeper()  # Waits out silence windows, keeps overshoot statistics
+        self.timing = BusTimingModel(self.serial_connection.baudrate)  # Estimates silence windows
 
         self.request_info()
 
@@ -115,11 +198,13 @@ class BoardBus(threading.Thread):
         self.threads.append(t)
         t = threading.Thread(target=self._run_sending_thread, name="{} Send".format(self.serial_connection.name))
         self.threads.append(t)
+        t = threading.Thread(target=self._run_encoding_thread, name="{} Encode".format(self.serial_connection.name))
+        self.threads.append(t)
 
 
     def _run_receiving_thread(self):
         """
-        This reads serial port byte-by-byte and puts received responses into self._responses
+        This reads serial port in chunks and puts received responses into self._responses
         Produced responses will be consumed in BoardBus thread
         """
         logging.debug(self.serial_connection.name + " serial Receive thread started")
@@ -133,74 +218,65 @@ class BoardBus(threading.Thread):
             bytes_waiting = self.serial_connection.inWaiting()
             if bytes_waiting:
                 received_data += self.serial_connection.read(bytes_waiting)
+            received_at = time.perf_counter()
 
-            for received_byte in received_data:
-                received_char = chr(received_byte)
-
-                # Echo Ignoring
-                if received_char == '<':
-                    self.ignoring_serial_echo = True
-                if self.ignoring_serial_echo:
-                    self.ignored_buffer += received_char
-                    if received_char == '>':
-                        self.ignoring_serial_echo = False
-                        # logging.debug("Ignored data: \"{}\" ".format(self.ignored_buffer))
-                        self.ignored_buffer = ""
-                    continue  # This is echo, let's read next byte
-
-                # If board ID received
-                if 128 <= received_byte < 255:
-                    if self.current_response != {}:
-                        logging.error("incomplete data from bus: {}".format(self.current_response))
-                    self.current_response = dict()
-                    self.current_response['id'] = received_byte
-                elif received_byte in Board.command_codes:
-                    self.current_response['code'] = Board.Command(received_byte)
-                    self._responses.put_nowait(self.current_response)
-                    self.current_response = {}
-                else:
-                    try:
-                        self.current_response['data'] += received_char
-                    except KeyError:
-                        self.current_response['data'] = received_char
+            for response in self._parser.feed(received_data):
+                self.timing.observe(response, self._slot_index(response), received_at)
+                self._responses.put_nowait(response)
         logging.debug(self.serial_connection.name + " serial Receive thread stopped")
 
     def _run_sending_thread(self):
         """
         This thread sends commands over serial
-        Thread waits for commands in queue and then sends them
+        Thread waits until bus is silent, then asks scheduler for the next job and executes it
         """
 
         logging.debug(self.serial_connection.name + " serial Sending thread started")
         while not self._stop_flag:
-            try:
-                command, args = self._command_queue.get(timeout=0.1)
-            except queue.Empty:
-                pass
-            else:
-                # Sleep until silence is over
-                currtime = time.time()
-                while self.silence_until > currtime:
-                    time.sleep(self.silence_until - currtime)
-                    currtime = time.time()
-
-                command(*args)
+            # Sleep until silence is over
+            self.silence_sleeper.sleep_until(self.silence_until)
 
-                # if this is the first ping, wait for answers and then set flag "first_ping_is_complete"
-                if not self.first_ping_is_complete and command == self._ping:
-                    while self.silence_until > time.time():
-                        time.sleep(self.silence_until - time.time())
-                    self.first_ping_is_complete = True
-                    logging.debug("Initial ping is complete")
+            job = self.scheduler.next(timeout=0.1)
+            if job is None:
+                continue
 
+            job.function(*job.args)
 
+            # if this is the first ping, wait for answers and then set flag "first_ping_is_complete"
+            if not self.first_ping_is_complete and job.function == self._ping:
+                self.silence_sleeper.sleep_until(self.silence_until)
+                self.first_ping_is_complete = True
+                logging.debug("Initial ping is complete")
 
         # Sleep until silence is over
-        while self.silence_until > time.time():
-            time.sleep(self.silence_until - time.time())
+        self.silence_sleeper.sleep_until(self.silence_until)
         self._turn_off_boards()
         logging.debug(self.serial_connection.name + " serial Sending thread stopped")
 
+    def _run_encoding_thread(self):
+        """
+        This thread encodes newest frame, when it is published, and requests LED refresh slot for sending it
+        Frames published while encoding are not queued: next encoding takes the newest one. Changes not sent yet
+        are merged with the new ones (see FrameEncoder.update)
+        """
+        logging.debug(self.serial_connection.name + " Encoding thread started")
+        while not self._stop_flag:
+            if not self._frame_published.wait(0.1):
+                continue
+            self._frame_published.clear()
+            self._encode_latest()
+        logging.debug(self.serial_connection.name + " Encoding thread stopped")
+
+    def _encode_latest(self):
+        """
+        Encodes newest frame and requests LED refresh slot for sending it
+        """
+        deadline = self._refresh_deadline
+        with self.stage_timers["Encode"]:
+            frame = self.frames.latest()  # Newest complete frame, game does not touch it until next pick-up
+            self._encoder.update(frame.data, self.frames.dirty_boards)
+        self.scheduler.request(BusScheduler.Slot.led, self._refresh_leds, deadline)
+
     def run(self):
         logging.debug(self.serial_connection.name + " serial Process thread started")
         self._stop_flag = False
@@ -232,148 +308,200 @@ class BoardBus(threading.Thread):
         """
         self._stop_flag = True
 
-    def refresh_leds(self):
+    def status(self):
+        """
+        @return: dictionary of bus statistics (plain values, so it can be passed between processes)
+        """
+        return {
+            "name": self.serial_connection.name,
+            "fps": {name: fps.current_fps for name, fps in self.fps.items()},
+            "timing": self.timing.snapshot(),
+            "overruns": self.scheduler.overruns,
+            "dirty tiles": self.dirty_tiles,
+            "deferred tiles": self.deferred_tiles,
+            "boards": len(self.boards),
+            "frames sent": self.frames.frames_sent,
+            "frames dropped": self.frames.frames_dropped,
+            "stage timers": {name: (timer.average, timer.maximum) for name, timer in self.stage_timers.items()},
+            "silence waits": self.silence_sleeper.snapshot()
+        }
+
+    def refresh_leds(self, deadline=None):
+        """
+        Signals thread to encode newest frame and refresh image on boards in next LED slot.
+        (merged if already scheduled)
+
+        @param deadline: time (time.time()) by which refresh should be started, used for overrun statistics
+        """
+        self._set_refresh_deadline(deadline)
+        self._frame_published.set()
+
+    def _set_refresh_deadline(self, deadline):
+        self._refresh_deadline = deadline
+        if deadline is not None:
+            self._frame_period = deadline - time.time()
+
+    def show_frame(self, show, index, deadline=None):
         """
-        Signals thread to refresh image on boards next cycle. (if not already scheduled)
+        Signals thread to send a frame of compiled show in next LED slot. (merged if already scheduled)
+
+        @param show: ShowFile
+        @param index: index of the frame
+        @param deadline: time (time.time()) by which frame should be sent, used for overrun statistics
         """
-        if not self._update_display_flag:
-            self._update_display_flag = True
-            self._command_queue.put_nowait((self._refresh_leds, []))
+        self._show_frame = show, index
+        self.scheduler.request(BusScheduler.Slot.led, self._send_show_frame, deadline)
 
-    def read_sensors(self):
+    def read_sensors(self, deadline=None):
         """
-        Signals thread to poll sensors on boards next cycle. (if not already scheduled)
+        Signals thread to poll sensors on boards in next sensor slot. (merged if already scheduled)
+
+        @param deadline: time (time.time()) by which poll should be started, used for overrun statistics
         """
         # When first ping is not complete disable reading sensors
         if not self.first_ping_is_complete:
             return
 
-        if not self._read_sensors_flag:
-            self._read_sensors_flag = True
-            self._command_queue.put_nowait((self._read_sensors, []))
+        self.scheduler.request(BusScheduler.Slot.sensor, self._read_sensors, deadline)
 
     def turn_off_boards(self):
         """
         Signals thread to turn off boards next cycle
         """
-        self._command_queue.put_nowait((self._turn_off_boards, []))
+        self.scheduler.add(self._turn_off_boards)
 
     def reset_id(self, board):
         """
         Signals thread to reset board ID next cycle
         """
-        self._command_queue.put_nowait((self._reset_id, [board]))
+        self.scheduler.add(self._reset_id, [board])
 
     def reset_id_all(self):
         """
         Signals thread to reset all ID's next cycle
         """
-        self._command_queue.put_nowait((self._reset_id, [self._broadcast_board]))
+        self.scheduler.add(self._reset_id, [self._broadcast_board])
 
     def ping(self, board):
         """
         Signals thread to ping board next cycle
         """
-        self._command_queue.put_nowait((self._ping, [board]))
+        self.scheduler.add(self._ping, [board])
 
     def ping_all(self):
         """
         Signals thread to ping all boards next cycle
         """
-        self._command_queue.put_nowait((self._ping, [self._broadcast_board]))
+        self.scheduler.add(self._ping, [self._broadcast_board])
 
     def assign_board_id(self):
         """
         Signals thread to assign an id next cycle
         """
-        self._command_queue.put_nowait((self._assign_board_id, []))
+        self.scheduler.add(self._assign_board_id)
 
     def assign_board_seq_no(self, board, value):
         """
         Signals thread to assign a sequence number next cycle
         """
-        self._command_queue.put_nowait((self._assign_board_seq_no, [board, value]))
+        self.scheduler.add(self._assign_board_seq_no, [board, value])
 
     def request_info(self):
         """
         Signals thread to request info next cycle
         """
-        self._command_queue.put_nowait((self._request_info, []))
+        self.scheduler.add(self._request_info)
 
 
     def _new_board(self, board_id):
         board = None
-        for assignment in BoardBus.board_assignment:
-            if assignment[0] == board_id:
-                board = Board(board_id, self.serial_connection, assignment[1], assignment[2])
-                logging.info(
-                    "Assigned board {id} col={col} row={row}".format(id=board_id, col=assignment[1], row=assignment[2]))
-                self.boards.append(board)
-                break
+        assignment = BoardBus.registry.get_assignment(board_id)
+        if assignment is not None:
+            column, row = assignment
+            board = Board(board_id, self.serial_connection, column, row)
+            logging.info("Assigned board {id} col={col} row={row}".format(id=board_id, col=column, row=row))
+            self.boards.append(board)
+            BoardBus.registry.add(board)
+            # Board ignores LED data until it has a sequence number, it gets the frame in _assign_board_seq_no()
         else:
             logging.warning("Assignment for board {} not found".format(board_id))
 
         return board
 
+    def _find_board(self, board_id):
+        """
+        @return: board with given ID on this bus, None if not found
+        """
+        board = BoardBus.registry.get(board_id)
+        if board is not None and board.serial_connection is self.serial_connection:
+            return board
+        return None
+
     def _process_response(self, response):
         """
         Processes one response from queue
         Each response code is treated in it's own if clause
         """
 
-        if response['code'] == Board.Command.request_id:
+        if response.code == Board.Command.request_id:
             self.assign_board_id()
 
-        elif response['code'] == Board.Command.pong:
-            for board in self.boards:
-                if board.id == response["id"]:
-                    logging.debug("Board {} is already enumerated.".format(response["id"]))
-                    break
+        elif response.code == Board.Command.pong:
+            if self._find_board(response.id) is not None:
+                logging.debug("Board {} is already enumerated.".format(response.id))
             else:  # We have found a board not currently known
-                logging.info("Board found: id={id}".format(**response))
+                logging.info("Board found: id={}".format(response.id))
                 try:
-                    BoardBus._id_pool3.remove(response["id"])
+                    BoardBus._id_pool3.remove(response.id)
                 except ValueError:
                     pass
-                new_board = self._new_board(response["id"])
+                new_board = self._new_board(response.id)
 
                 self.assign_board_seq_no(new_board, self.next_sequence_no)
                 self.next_sequence_no += 1
 
-        elif response['code'] == Board.Command.sensor_data:
-            try:
-                _ = response["id"]
-                _ = response["data"]
-            except KeyError:
-                logging.error("Received sensor data without id or data. \"{}\". ".format(response))
+        elif response.code == Board.Command.sensor_data:
+            if not response.data:
+                logging.error("Received sensor data without data. \"{}\". ".format(response))
             else:
                 self.fps["Sensor response"].cycle_complete()
-                for board in self.boards:
-                    if board.id == response["id"]:
-                        try:
-                            board.set_sensor_value(int(response["data"]))
-                        except ValueError:
-                            logging.exception("Setting sensor value failed. response={}".format(response))
-                        break
+                board = self._find_board(response.id)
+                if board is not None:
+                    try:
+                        board.set_sensor_value(int(response.data))
+                    except ValueError:
+                        logging.exception("Setting sensor value failed. response={}".format(response))
                 else:
                     logging.error("Received sensor data from unknown board. \"{}\".".format(response))
-        elif response['code'] == Board.Command.info:
-            try:
-                logging.debug("Board info: ID={id} version=\"{data}\"".format(**response))
-            except KeyError:
-                logging.error("Info response did not contain id or data. response={}".format(response))
+        elif response.code == Board.Command.info:
+            logging.debug("Board info: ID={} version=\"{}\"".format(response.id, response.data.decode()))
 
-        elif response['code'] == Board.Command.debug:
-            try:
-                logging.debug("Board debug: ID={id} Data=\"{data}\"".format(**response))
-            except KeyError:
-                logging.error("debug response didn't have ID or Data. response={}".format(response))
+        elif response.code == Board.Command.debug:
+            logging.debug("Board debug: ID={} Data=\"{}\"".format(response.id, response.data))
 
         else:
             logging.error("UNKNOWN RESPONSE CODE. Response={}".format(response))
 
-    def _be_silent_next_us(self, us):
-        self.silence_until = max(self.silence_until, time.time() + (us / 1000) / 1000)
+    def _slot_index(self, response):
+        """
+        @return: index of the response slot the board answered in (None if unknown)
+        """
+        if response.code == Board.Command.sensor_data:
+            board = self._find_board(response.id)
+            return None if board is None else board.sequence_number
+        return response.id - 128
+
+    def _sent(self, start, n_bytes, response_time_us, command=None):
+        """
+        Sets silence after sending n_bytes, so boards have response_time_us to answer (or render).
+
+        @param start: time (time.perf_counter()) just before data was written to serial
+        @param command: command boards are answering to (starts learning response timing)
+        """
+        transfer_time_us = self.timing.transfer_time(n_bytes)
+        self.timing.command_sent(command, start + transfer_time_us / 1000000, response_time_us)
+        self.timing.bus_busy(start, transfer_time_us + response_time_us)
+        self.silence_until = max(self.silence_until, start + (transfer_time_us + response_time_us) / 1000000)
 
     #
     # Methods below this line send data to serial bus:
@@ -388,11 +516,13 @@ class BoardBus(threading.Thread):
         """
         input_list = numpy.zeros((10, 10, 3), dtype=numpy.uint8)
         self._broadcast_board.refresh_leds(input_list)
+        self._encoder.invalidate()  # Boards are not displaying last sent data anymore
 
     def _reset_id(self, board):
         board.reset_id()
         if board == self._broadcast_board:
             for board in self.boards:
+                BoardBus.registry.remove(board)
                 BoardBus._id_pool3.push(board.id)
             self.boards = []
             self.next_sequence_no = 0
@@ -402,43 +532,131 @@ class BoardBus(threading.Thread):
             except ValueError:
                 logging.exception("Reset sent to board which was not in boards list")
             else:
+                BoardBus.registry.remove(board)
                 BoardBus._id_pool3.push(board.id)
+        self._encoder.set_boards(self._numbered_boards())
 
     def _ping(self, board):
+        start = time.perf_counter()
         board.ping()
-        slot_time = 300  # Time for each board in microseconds #TODO: ADJUST THIS
-        additional_time = 500  # for other delays
         number_of_boards = len(BoardBus.board_assignment)
-        self._be_silent_next_us(number_of_boards * (slot_time + additional_time))
+        response_time_us = self.timing.response_silence(Board.Command.ping_from_master, number_of_boards)
+        self._sent(start, COMMAND_OVERHEAD, response_time_us, Board.Command.ping_from_master)
 
     def _refresh_leds(self):
-        no_boards_updated = 0  # number of boards updated in for loop
-        for board in self.boards:
-            numpy_input = self.data[board.row * 10:board.row * 10 + 10, board.column * 10:board.column * 10 + 10]
-            updated = board.refresh_leds(numpy_input)
-            if updated:
-                no_boards_updated += 1
+        """
+        Sends LED data of all changed boards in one transaction.
+        If sensor poll is pending, it is sent in the same transaction (after boards have rendered).
+        """
+        with self.stage_timers["Transmit"]:
+            transaction = self._transaction
+            render_time_us = self.timing.render_silence()
+            guard_bytes = int(render_time_us / self.timing.transfer_time(1))
+
+            # Boards whose tile has changed since last refresh (identical tiles may be broadcast)
+            broadcast_gap = (guard_bytes + 2) / (FrameEncoder.packet_size + COMMAND_OVERHEAD)
+            shared, boards, encoded_data = self._encoder.take_pending(broadcast_gap, self._led_budget(render_time_us))
+            self._show = self._show_frame = None  # Show file is released (closed when nothing refers to it)
+            self.dirty_tiles = self._encoder.dirty_count
+            self.deferred_tiles = self._encoder.deferred_count
+            if shared is not None:
+                transaction.add(self._broadcast_board, Board.Command.send_led_data, shared)
+                if boards:
+                    # Boards drop everything they receive while rendering
+                    transaction.add_guard(guard_bytes)
+            packet_size = FrameEncoder.packet_size
+            for i, board in enumerate(boards):
+                board_data = encoded_data[i * packet_size:(i + 1) * packet_size]
+                transaction.add(board, Board.Command.send_led_data, board_data)
+
+            if shared is None and not boards:
+                render_time_us = 0
+
+            command = None
+            if self.first_ping_is_complete and self.scheduler.take(BusScheduler.Slot.sensor):
+                # Boards drop everything they receive while rendering - keep the bus busy until they are done
+                if render_time_us:
+                    transaction.add_guard(guard_bytes)
+                response_time_us = self._add_sensor_poll(transaction)
+                command = Board.Command.request_sensor
+            else:
+                response_time_us = render_time_us
+
+            start = time.perf_counter()
+            n_bytes = transaction.flush()
+            self._sent(start, n_bytes, response_time_us, command)
 
+        if self.deferred_tiles:
+            # Deferred tiles are sent in following LED slots, even if no new frame comes
+            self.scheduler.request(BusScheduler.Slot.led, self._refresh_leds)
+        self.fps["LED update"].cycle_complete()
+
+    def _send_show_frame(self):
+        """
+        Sends packets of a compiled show frame, only of the boards that have changed since the last frame sent.
+        """
+        show_frame = self._show_frame
+        if show_frame is None or show_frame[0].closed:
+            return  # LED refresh has replaced the show meanwhile
+        show, index = show_frame
+        with self.stage_timers["Transmit"]:
+            if show is not self._show:
+                # Boards stop displaying what encoder has sent them
+                self._encoder.invalidate()
+                self._show = show
+                self._show_index = None
+                self._show_boards = set()
+            dirty = show.dirty_between(self._show_index, index)
+            transaction = self._transaction
+            for board in self.boards:
+                row = show.board_rows.get(board.id)
+                if row is None or board.sequence_number is None:
+                    continue
+                if dirty is None or dirty[row] or board.id not in self._show_boards:
+                    transaction.add_command(show.packet(index, row))
+                    self._show_boards.add(board.id)
+            self._show_index = index
+
+            response_time_us = self.timing.render_silence() if len(transaction) else 0
+            start = time.perf_counter()
+            n_bytes = transaction.flush()
+            self._sent(start, n_bytes, response_time_us)
         self.fps["LED update"].cycle_complete()
-        self._update_display_flag = False
-        self._be_silent_next_us(
-            (
-                no_boards_updated * BoardBus.led_data_transfertime +
-                BoardBus.led_data_rendertime +
-                BoardBus.led_data_time_to_render +
-                1  # Just for safety/padding
-            ) * 1000
-        )
+
+    def _led_budget(self, render_time_us):
+        """
+        @return: number of LED packets that can be sent before the next frame is due, None - no limit
+        """
+        deadline = self._refresh_deadline
+        if BoardBus.led_time_share is None or deadline is None:
+            return None
+        time_left = deadline - time.time()
+        if time_left <= 0:
+            # Next frame has not come in time (or deferred tiles are sent after it) - one frame worth of tiles
+            time_left = self._frame_period
+            if time_left is None or time_left <= 0:
+                return None
+        available_us = time_left * 1000000 * BoardBus.led_time_share - render_time_us
+        packet_time_us = self.timing.transfer_time(FrameEncoder.packet_size + COMMAND_OVERHEAD)
+        return max(1, int(available_us / packet_time_us))
 
     def _read_sensors(self):
-        self._broadcast_board.read_sensor()
+        transaction = self._transaction
+        response_time_us = self._add_sensor_poll(transaction)
+        start = time.perf_counter()
+        n_bytes = transaction.flush()
+        self._sent(start, n_bytes, response_time_us, Board.Command.request_sensor)
+
+    def _add_sensor_poll(self, transaction):
+        """
+        Adds sensor poll to the transaction
+
+        @return: time in microseconds boards need for answering
+        """
+        transaction.add(self._broadcast_board, Board.Command.request_sensor)
         number_of_boards = self.next_sequence_no
-        slot_time = 400  # Time for each board in microseconds
-        additional_time = 400  # for safety and other delays
-        adc_time = 100  # time for waiting all boards to take adc measurement
-        self._be_silent_next_us(number_of_boards * slot_time + adc_time + additional_time)
         self.fps["Sensor poll"].cycle_complete()
-        self._read_sensors_flag = False
+        return self.timing.response_silence(Board.Command.request_sensor, number_of_boards)
 
     def _assign_board_id(self):
         try:
@@ -447,29 +665,33 @@ class BoardBus(threading.Thread):
         except IndexError:
             logging.error("Unable to assign ID to board: ID pool is empty.")
         else:
+            start = time.perf_counter()
             self._broadcast_board.assign_board_id(board_id)
             #Re enumerate after a delay
             #
             #time.sleep(BoardBus.board_busy_time)
             # self._ping(self._broadcast_board)  # TODO: Maybe ping only one
             #
-            self._be_silent_next_us(
-                (
-                    BoardBus.led_data_transfertime +
-                    BoardBus.led_data_rendertime +
-                    BoardBus.led_data_time_to_render +
-                    1
-                ) * 1000
-            )
+            # Board clears it's LED's and saves ID to EEPROM
+            self._sent(start, COMMAND_OVERHEAD + 1, self.timing.render_silence())
             self.ping(self._broadcast_board)
 
-    @staticmethod
-    def _assign_board_seq_no(board, seq_no):
+    def _assign_board_seq_no(self, board, seq_no):
         board.assign_sequence_number(seq_no)
+        if board in self.boards:
+            self._encoder.set_boards(self._numbered_boards())
+            if self._show is None:  # (Show sends everything to boards it has not sent to yet)
+                self.refresh_leds()  # Show current frame on the new board (render loop may be idle)
+
+    def _numbered_boards(self):
+        """
+        @return: boards that have been given a sequence number (others ignore LED data)
+        """
+        return [board for board in self.boards if board.sequence_number is not None]
 
     def _request_info(self):
+        start = time.perf_counter()
         self._broadcast_board.request_info()
-        slot_time = 500  # Time for each board in microseconds
-        additional_time = 500  # for other delays
         number_of_boards = len(BoardBus.board_assignment)
-        self._be_silent_next_us(number_of_boards * (slot_time + additional_time))
\ No newline at end of file
+        response_time_us = self.timing.response_silence(Board.Command.request_info, number_of_boards)
+        self._sent(start, COMMAND_OVERHEAD, response_time_us, Board.Command.request_info)
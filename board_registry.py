@@ -0,0 +1,61 @@
+__author__ = 'Mark Laane'
+
+import threading
+
+
+class BoardRegistry():
+    """
+    Indexes of all assignments and all enumerated boards (on all buses).
+
+    Lookups are plain dictionary reads, so they can be done from any thread without locking.
+    Changes are done under a lock, by bus threads when boards are enumerated or reset.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._assignments = {}  # board id -> (column, row)
+        self._boards = {}  # board id -> Board
+        self._boards_by_position = {}  # (column, row) -> Board
+
+    def add_assignment(self, board_id, column, row):
+        """
+        Remembers what part of image data belongs to board with specified ID.
+        """
+        with self._lock:
+            self._assignments[board_id] = column, row
+
+    def get_assignment(self, board_id):
+        """
+        @return: (column, row) assigned to the board, None if there is no assignment
+        """
+        return self._assignments.get(board_id)
+
+    def add(self, board):
+        """
+        Adds an enumerated board.
+        """
+        with self._lock:
+            self._boards[board.id] = board
+            self._boards_by_position[board.column, board.row] = board
+
+    def remove(self, board):
+        """
+        Removes a board (if it is registered).
+        """
+        with self._lock:
+            if self._boards.get(board.id) is board:
+                del self._boards[board.id]
+            if self._boards_by_position.get((board.column, board.row)) is board:
+                del self._boards_by_position[board.column, board.row]
+
+    def get(self, board_id):
+        """
+        @return: enumerated board with given ID, None if not found
+        """
+        return self._boards.get(board_id)
+
+    def get_at(self, column, row):
+        """
+        @return: enumerated board at given position, None if not found
+        """
+        return self._boards_by_position.get((column, row))
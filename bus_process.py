@@ -0,0 +1,446 @@
+__author__ = 'Mark Laane'
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy
+
+from board_bus import BoardBus, open_port
+from bus_timing import BusTimingModel
+from frame_encoder import FrameEncoder, TileCache
+from frame_exchange import Frame
+from ledBoard import Board
+from show_file import ShowFile
+from timer import DeadlineSleeper
+
+
+def _attach(name):
+    """
+    Attaches to shared memory created by another process (which also unlinks it).
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 registers the block again - with the resource tracker shared with the parent process,
+        # so it is still unlinked once, by it's creator
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedFrame():
+    """
+    Latest frame in shared memory, published by render loop (single writer) for bus processes.
+
+    Block is guarded by a sequence counter (seqlock): counter is odd while frame is being written.
+    Reader copies the frame and retries if counter was odd or changed meanwhile. Writer never waits.
+
+    Layout: counter, frame sequence (uint64 each), dirty mask flag, dirty boards (uint8 per board), frame data
+    """
+
+    def __init__(self, shape, board_shape, name=None):
+        """
+        Args:
+            shape: shape of the frame (uint8)
+            board_shape: (rows, columns) of boards, shape of the dirty boards mask
+            name: name of existing shared memory block to attach to, None creates a new one
+        """
+        self.shape = shape
+        self.board_shape = board_shape
+        n_boards = board_shape[0] * board_shape[1]
+        size = 16 + 1 + n_boards + int(numpy.prod(shape))
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.memory = _attach(name)
+        self.name = self.memory.name
+        buffer = self.memory.buf
+        self._header = numpy.ndarray(2, dtype=numpy.uint64, buffer=buffer)
+        self._has_mask = numpy.ndarray(1, dtype=numpy.uint8, buffer=buffer, offset=16)
+        self._mask = numpy.ndarray(board_shape, dtype=bool, buffer=buffer, offset=17)
+        self.data = numpy.ndarray(shape, dtype=numpy.uint8, buffer=buffer, offset=17 + n_boards)
+
+    def write(self, frame):
+        """
+        Publishes a frame (frame_exchange.Frame)
+        """
+        self._header[0] += 1  # Odd - write in progress
+        numpy.copyto(self.data, frame.data)
+        if frame.dirty_boards is None:
+            self._has_mask[0] = 0
+        else:
+            self._has_mask[0] = 1
+            numpy.copyto(self._mask, frame.dirty_boards)
+        self._header[1] = frame.sequence
+        self._header[0] += 1
+
+    def read(self, frame):
+        """
+        Copies latest complete frame into frame (frame_exchange.Frame)
+        """
+        while True:
+            counter = int(self._header[0])
+            if counter % 2:
+                time.sleep(0)  # Writer is in the middle of a frame
+                continue
+            numpy.copyto(frame.data, self.data)
+            frame.sequence = int(self._header[1])
+            if self._has_mask[0]:
+                frame.dirty_boards = self._mask.copy()
+            else:
+                frame.dirty_boards = None
+            if int(self._header[0]) == counter:
+                return frame
+
+    def close(self, unlink=False):
+        self._header = self._has_mask = self._mask = self.data = None  # Views have to be released before closing
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+class SharedFrameReader():
+    """
+    Same interface as frame_exchange.FrameReader, for a bus that runs in a worker process.
+    """
+
+    def __init__(self, shared_frame):
+        self._shared_frame = shared_frame
+        self._frame = Frame(0, shared_frame.shape)
+        self.shape = shared_frame.shape
+        self.last_sequence = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.dirty_boards = None
+
+    def latest(self):
+        """
+        Picks up the newest complete frame. Frame is a private copy, it stays intact until next call.
+
+        @return: Frame
+        """
+        frame = self._shared_frame.read(self._frame)
+        if frame.sequence != self.last_sequence:
+            # Only dirty boards of the newest frame are shared - if frames were dropped, everything is compared
+            if self.last_sequence and frame.sequence == self.last_sequence + 1:
+                self.dirty_boards = frame.dirty_boards
+            else:
+                self.dirty_boards = None
+            if self.last_sequence:
+                self.frames_dropped += max(0, frame.sequence - self.last_sequence - 1)
+            self.last_sequence = frame.sequence
+            self.frames_sent += 1
+        elif self.dirty_boards is not None:
+            self.dirty_boards = numpy.zeros_like(self.dirty_boards)
+        return frame
+
+    def is_new_frame(self):
+        """
+        @return: True if a frame newer than the last picked up has been published
+        """
+        return int(self._shared_frame._header[1]) != self.last_sequence
+
+
+class RemoteBoard():
+    """
+    Board enumerated by a bus in a worker process. Sensor value is read from shared memory.
+    """
+    is_button_pressed = Board.is_button_pressed
+
+    def __init__(self, board_id, column, row, sensor_values):
+        self.id = board_id
+        self.column = column
+        self.row = row
+        self._sensor_values = sensor_values
+
+    @property
+    def sensor_value(self):
+        return int(self._sensor_values[self.id])
+
+
+class BusProcess():
+    """
+    Runs BoardBus in it's own worker process, so encoding and serial I/O of every bus get their own interpreter.
+
+    Frames are read from SharedFrame, sensor values are written back to a shared array (indexed by board id).
+    Commands (same as BoardBus commands) are sent to the worker over a pipe. Worker sends back enumerated boards
+    and status of the bus.
+    """
+    status_period = 0.5  # How often (seconds) worker sends bus status
+    sensor_period = 0.01  # How often (seconds) worker copies sensor values to shared memory
+
+    def __init__(self, port, shared_frame, channel_order=(0, 1, 2), bus_class=BoardBus):
+        """
+        Args:
+            port: serial port identifier (see board_bus.open_port)
+            shared_frame: SharedFrame frames are published to
+            channel_order: index of red, green and blue channel in frames
+            bus_class: bus implementation run in the worker (BoardBus or AsyncBoardBus)
+        """
+        self.name = port
+        self.boards = []  # RemoteBoards enumerated on this bus
+        self._status = None
+
+        self._sensor_memory = shared_memory.SharedMemory(create=True, size=256 * 2)
+        self._sensor_values = numpy.ndarray(256, dtype=numpy.int16, buffer=self._sensor_memory.buf)
+        self._sensor_values[:] = -1
+
+        self._connection, self._worker_connection = multiprocessing.Pipe()
+        self._send_lock = threading.Lock()  # Commands are sent from several threads
+        self._process = multiprocessing.Process(
+            target=_run_bus_worker, name="{} Bus".format(port), daemon=True,
+            args=(
+                port, shared_frame.name, shared_frame.shape, shared_frame.board_shape, self._sensor_memory.name,
+                channel_order, list(BoardBus.board_assignment), _settings(bus_class), self._worker_connection
+            )
+        )
+        self._receiving_thread = threading.Thread(target=self._run_receiving_thread, name="{} Proxy".format(port))
+
+    def start(self):
+        self._process.start()
+        self._worker_connection.close()  # Only worker holds it's end, so receiving gets EOF when worker exits
+        self._receiving_thread.start()
+
+    def stop(self):
+        """
+        Signals worker to stop bus and close serial port
+        """
+        self._command("stop")
+
+    def join(self, timeout=None):
+        """
+        Stops the worker process and waits for it
+        """
+        self.stop()
+        self._process.join(timeout)
+        self._receiving_thread.join(timeout)
+        for board in self.boards:
+            BoardBus.registry.remove(board)
+        self.boards = []
+        self._sensor_values = None
+        try:
+            self._sensor_memory.close()
+        except BufferError:
+            pass  # RemoteBoards still referenced somewhere keep the mapping until they are gone
+        self._sensor_memory.unlink()
+
+    def status(self):
+        """
+        @return: last status (see BoardBus.status) received from worker
+        """
+        if self._status is None:
+            # Nothing received yet - default slot times of the timing model
+            return {
+                "name": self.name, "fps": {"LED update": 0.0, "Sensor poll": 0.0, "Sensor response": 0.0},
+                "timing": BusTimingModel(500000).snapshot(), "overruns": 0, "dirty tiles": 0, "deferred tiles": 0,
+                "boards": 0, "frames sent": 0, "frames dropped": 0, "stage timers": {},
+                "silence waits": DeadlineSleeper().snapshot()
+            }
+        return self._status
+
+    def refresh_leds(self, deadline=None):
+        self._command("refresh_leds", deadline)
+
+    def show_frame(self, show, index, deadline=None):
+        self._command("show_frame", show.path, index, deadline)  # Worker maps the show file itself
+
+    def read_sensors(self, deadline=None):
+        self._command("read_sensors", deadline)
+
+    def turn_off_boards(self):
+        self._command("turn_off_boards")
+
+    def reset_id(self, board):
+        self._command("reset_id", board.id)
+
+    def reset_id_all(self):
+        self._command("reset_id_all")
+
+    def ping(self, board):
+        self._command("ping", board.id)
+
+    def ping_all(self):
+        self._command("ping_all")
+
+    def assign_board_id(self):
+        self._command("assign_board_id")
+
+    def request_info(self):
+        self._command("request_info")
+
+    def _command(self, name, *args):
+        with self._send_lock:
+            try:
+                self._connection.send((name, args))
+            except (BrokenPipeError, EOFError, OSError) as e:
+                logging.debug("{} worker is not running, {} not sent: {}".format(self.name, name, e))
+
+    def _run_receiving_thread(self):
+        """
+        Receives messages from worker until it exits
+        """
+        while True:
+            try:
+                message, value = self._connection.recv()
+            except (EOFError, OSError):
+                break
+            if message == "status":
+                self._status = value
+            elif message == "boards":
+                self._update_boards(value)
+            elif message == "error":
+                logging.error("Unable to open serial port {}. \n{}".format(self.name, value))
+        logging.debug("{} worker has exited".format(self.name))
+
+    def _update_boards(self, board_positions):
+        """
+        @param board_positions: list of (id, column, row) of boards enumerated by worker
+        """
+        previous = {board.id: board for board in self.boards}
+        boards = []
+        for board_id, column, row in board_positions:
+            board = previous.pop(board_id, None)
+            if board is None or (board.column, board.row) != (column, row):
+                board = RemoteBoard(board_id, column, row, self._sensor_values)
+                BoardBus.registry.add(board)
+            boards.append(board)
+        for board in previous.values():
+            BoardBus.registry.remove(board)
+        self.boards = boards
+
+
+def _settings(bus_class):
+    """
+    @param bus_class: bus implementation run in the worker
+    @return: configured class attributes the bus depends on (worker process may not inherit them)
+    """
+    return {
+        "bus_class": bus_class,
+        "learning": BusTimingModel.learning,
+        "safety_margin": BusTimingModel.safety_margin,
+        "safety_padding": BusTimingModel.safety_padding,
+        "tile_cache_size": TileCache.max_size if FrameEncoder.tile_cache is not None else 0,
+        "max_staleness": FrameEncoder.max_staleness,
+        "led_time_share": BoardBus.led_time_share,
+        "log_level": logging.getLogger().getEffectiveLevel()
+    }
+
+
+def _run_bus_worker(port, frame_name, frame_shape, board_shape, sensor_name, channel_order, assignments, settings,
+                    connection):
+    """
+    Main function of a bus worker process
+    """
+    logging.basicConfig(format='[%(asctime)s] [%(threadName)13s] %(levelname)7s: %(message)s',
+                        level=settings["log_level"])
+    BusTimingModel.learning = settings["learning"]
+    BusTimingModel.safety_margin = settings["safety_margin"]
+    BusTimingModel.safety_padding = settings["safety_padding"]
+    TileCache.max_size = settings["tile_cache_size"]
+    if TileCache.max_size <= 0:
+        FrameEncoder.tile_cache = None
+    FrameEncoder.max_staleness = settings["max_staleness"]
+    BoardBus.led_time_share = settings["led_time_share"]
+    for board_id, x, y in assignments:
+        if BoardBus.registry.get_assignment(board_id) is None:
+            BoardBus.add_assignation(board_id, x, y)
+
+    try:
+        serial_connection = open_port(port)
+    except Exception as e:
+        connection.send(("error", str(e)))
+        connection.close()
+        return
+
+    shared_frame = SharedFrame(frame_shape, board_shape, frame_name)
+    sensor_memory = _attach(sensor_name)
+    sensor_values = numpy.ndarray(256, dtype=numpy.int16, buffer=sensor_memory.buf)
+    bus = settings["bus_class"](serial_connection, SharedFrameReader(shared_frame), channel_order)
+    bus.start()
+
+    stop = threading.Event()
+    status_thread = threading.Thread(
+        target=_run_status_thread, args=(bus, sensor_values, connection, stop), name="{} Status".format(port)
+    )
+    status_thread.start()
+
+    shows = {}  # path -> ((modification time, size), ShowFile)
+    try:
+        while True:
+            try:
+                name, args = connection.recv()
+            except (EOFError, OSError):
+                break  # Main process has gone
+            if name == "stop":
+                break
+            try:
+                if name in ("reset_id", "ping"):
+                    board = BoardBus.registry.get(args[0])
+                    if board is None:
+                        continue
+                    args = (board,)
+                elif name == "show_frame":
+                    args = (_cached_show(shows, args[0]),) + args[1:]
+                getattr(bus, name)(*args)
+                if name == "refresh_leds" and shows:
+                    _close_shows(shows)  # Show has been stopped (file may be compiled again)
+            except Exception:
+                logging.exception("{} command {}{} failed".format(port, name, args))
+    finally:
+        bus.join()
+        _close_shows(shows)
+        stop.set()
+        status_thread.join()
+        serial_connection.close()
+        sensor_values = None
+        sensor_memory.close()
+        shared_frame.close()
+        connection.close()
+
+
+def _cached_show(shows, path):
+    """
+    @param shows: path -> ((modification time, size), ShowFile) of the shows mapped by the worker
+    @return: ShowFile of given path, mapped again if the file has been written since (old mapping is closed)
+    """
+    stat = os.stat(path)
+    version = stat.st_mtime_ns, stat.st_size
+    cached = shows.get(path)
+    if cached is not None:
+        if cached[0] == version:
+            return cached[1]
+        cached[1].close()
+        del shows[path]
+    show = ShowFile(path)
+    shows[path] = version, show
+    return show
+
+
+def _close_shows(shows):
+    for version, show in shows.values():
+        show.close()
+    shows.clear()
+
+
+def _run_status_thread(bus, sensor_values, connection, stop):
+    """
+    Copies sensor values to shared memory, sends enumerated boards when they change and status periodically
+    """
+    board_positions = []
+    next_status = time.time()
+    while not stop.wait(BusProcess.sensor_period):
+        boards = list(bus.boards)
+        for board in boards:
+            sensor_values[board.id] = board.sensor_value
+        try:
+            positions = [(board.id, board.column, board.row) for board in boards]
+            if positions != board_positions:
+                board_positions = positions
+                connection.send(("boards", positions))
+            if time.time() >= next_status:
+                next_status += BusProcess.status_period
+                connection.send(("status", bus.status()))
+        except (BrokenPipeError, OSError):
+            break
@@ -0,0 +1,119 @@
+__author__ = 'Mark Laane'
+
+from collections import deque, namedtuple
+from enum import Enum, unique
+import threading
+import time
+
+
+# Function to be executed in send thread, slot it is executed in and time it should have been started by
+Job = namedtuple("Job", ["slot", "function", "args", "deadline"])
+
+
+class BusScheduler():
+    """
+    Plans what send thread of the bus does next.
+
+    Bus time is divided into a repeating timeline of slots: LED refresh, sensor poll and maintenance
+    (ping, ID offer, reset...). Each slot that has work gets it's turn once per cycle, so LED refresh
+    and sensor polling keep steady rates even if producers request them at different rates.
+
+    LED and sensor slot hold at most one pending request - a newer request is merged into the pending one.
+    Maintenance slot is a FIFO queue.
+    """
+
+    @unique
+    class Slot(Enum):
+        led = 0
+        sensor = 1
+        maintenance = 2
+
+    timeline = [Slot.led, Slot.sensor, Slot.maintenance]
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._pending = {}  # slot -> Job (LED and sensor slots)
+        self._maintenance = deque()
+        self._position = 0  # Position in timeline
+
+        self.merged = {BusScheduler.Slot.led: 0, BusScheduler.Slot.sensor: 0}  # Requests merged into pending ones
+        self.overruns = 0  # Jobs started after their deadline
+        self.max_lateness = 0.0  # Biggest overrun in seconds
+        self.on_job = None  # Function called (from the requesting thread) when job is added, for non-blocking users
+
+    def request(self, slot, function, deadline=None):
+        """
+        Requests LED refresh or sensor poll. Merged with the pending request of the same slot (if there is one).
+
+        @param slot: Slot.led or Slot.sensor
+        @param function: function to call
+        @param deadline: time (time.time()) by which it should be started
+        """
+        with self._condition:
+            if slot in self._pending:
+                self.merged[slot] += 1
+            self._pending[slot] = Job(slot, function, (), deadline)
+            self._condition.notify()
+        self._notify_job()
+
+    def add(self, function, args=()):
+        """
+        Adds maintenance job. Maintenance jobs are executed in order of adding.
+        """
+        with self._condition:
+            self._maintenance.append(Job(BusScheduler.Slot.maintenance, function, tuple(args), None))
+            self._condition.notify()
+        self._notify_job()
+
+    def take(self, slot):
+        """
+        Removes pending request, so it can be executed together with another job.
+
+        @return: True if request was pending
+        """
+        with self._condition:
+            return self._pending.pop(slot, None) is not None
+
+    def is_pending(self, slot):
+        return slot in self._pending
+
+    def next(self, timeout=None):
+        """
+        Waits for the next job.
+
+        @param timeout: longest time to wait (seconds), 0 returns immediately, None waits forever
+        @return: Job or None if timeout occurred
+        """
+        with self._condition:
+            end_time = None if timeout is None else time.time() + timeout
+            job = self._pick()
+            while job is None:
+                remaining = None if end_time is None else end_time - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+                job = self._pick()
+
+        if job.deadline is not None:
+            lateness = time.time() - job.deadline
+            if lateness > 0:
+                self.overruns += 1
+                self.max_lateness = max(self.max_lateness, lateness)
+        return job
+
+    def _notify_job(self):
+        on_job = self.on_job
+        if on_job is not None:
+            on_job()
+
+    def _pick(self):
+        for i in range(len(BusScheduler.timeline)):
+            slot = BusScheduler.timeline[(self._position + i) % len(BusScheduler.timeline)]
+            if slot == BusScheduler.Slot.maintenance:
+                job = self._maintenance.popleft() if self._maintenance else None
+            else:
+                job = self._pending.pop(slot, None)
+            if job is not None:
+                self._position = (self._position + i + 1) % len(BusScheduler.timeline)
+                return job
+        return None
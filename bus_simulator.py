@@ -0,0 +1,358 @@
+__author__ = 'Mark Laane'
+
+import heapq
+import logging
+import re
+import threading
+import time
+from urllib.parse import urlsplit, parse_qs
+
+import numpy
+
+from ledBoard import Board, BROADCAST_ADDRESS
+
+UNUSED_ADDRESS = 254  # Address only master listens to (used by boards requesting ID)
+VERSION_STRING = b"0.9.10-sim"
+
+
+class SimulatedBoard:
+    """
+    Emulates one LED board running firmware in "Board Firmware/LED_plaat".
+
+    Only what is visible on the bus is emulated: command parsing (serialEvent),
+    response timing (slots) and time when board is busy and drops incoming data.
+    """
+
+    # Commands board reacts to (same list as in serialEvent())
+    master_commands = {
+        Board.Command.reset_id.value,
+        Board.Command.offer_id.value,
+        Board.Command.ping_from_master.value,
+        Board.Command.offer_sequence_number.value,
+        Board.Command.send_led_data.value,
+        Board.Command.request_sensor.value,
+        Board.Command.request_info.value
+    }
+    buffer_size = 300
+
+    # Timing of the firmware in microseconds
+    led_decode_time = 2500  # setPixels()
+    led_show_time = 3000  # led_matrix.show()
+    sensor_slot_time = 400
+    adc_time = 100
+    ping_slot_time = 300
+    info_slot_time = 500
+
+    def __init__(self, board_id=BROADCAST_ADDRESS, sensor_value=0):
+        self.id = board_id
+        self.sequence_no = 255
+        self.sensor_value = sensor_value
+        self.id_requested = False
+        self.led_data = bytes([1 << 6]) * 150  # All LED's off
+        self.led_updates = 0  # Number of LED updates shown
+
+        self._busy_until = 0.0  # Bytes received before this time are lost
+
+    def hears(self, t):
+        """
+        @return: True if board reads a byte arriving at time t
+        """
+        return t >= self._busy_until and not self.is_waiting_for_id
+
+    def receive(self, command, data, t):
+        """
+        Receives a command addressed to this board or broadcast (serialEvent)
+
+        @param command: command code
+        @param data: bytes between the address and the command code
+        @param t: time when command code was received
+        @return: list of (time, bytes) responses
+        """
+        return self._execute(command, data[:SimulatedBoard.buffer_size - 1], t)
+
+    @property
+    def is_waiting_for_id(self):
+        """
+        Board without ID is stuck until user presses it (and it has requested ID)
+        """
+        return self.id == BROADCAST_ADDRESS and not self.id_requested
+
+    @property
+    def is_pressed(self):
+        return self.sensor_value >= 100
+
+    def request_id(self, t):
+        """
+        User pressed the board, which does not have an ID
+
+        @return: list of (time, bytes) responses
+        """
+        self.id_requested = True
+        self._busy_until = max(self._busy_until, t)  # Bytes written before pressing were not read
+        return [(t, bytes([UNUSED_ADDRESS, Board.Command.request_id.value]))]
+
+    def pixels(self):
+        """
+        @return: 10x10x3 numpy array of currently displayed colors (3 bits per channel, like the board displays them)
+        """
+        data = numpy.frombuffer(self.led_data, dtype=numpy.uint8)
+        values = numpy.empty(data.size * 2, dtype=numpy.uint8)
+        values[::2] = (data >> 3) & 0b111
+        values[1::2] = data & 0b111
+        arr = (values << 5).reshape(10, 10, 3)
+        arr[1::2] = arr[1::2, ::-1]
+        return arr
+
+    def _execute(self, command, data, t):
+        if command == Board.Command.send_led_data.value:
+            if self.sequence_no == 255:
+                return []
+            self.led_data = data
+            self.led_updates += 1
+            self._busy_until = t + (self.led_decode_time + self.led_show_time) / 1e6
+
+        elif command == Board.Command.request_sensor.value:
+            if self.sequence_no == 255:
+                return []
+            response = bytes([self.id]) + str(self.sensor_value).encode() + bytes([Board.Command.sensor_data.value])
+            return self._respond(t + (self.sequence_no * self.sensor_slot_time + self.adc_time) / 1e6, response)
+
+        elif command == Board.Command.request_info.value:
+            response = bytes([self.id]) + VERSION_STRING + bytes([Board.Command.info.value])
+            return self._respond(t + ((self.id - 128) * self.info_slot_time + 1) / 1e6, response)
+
+        elif command == Board.Command.reset_id.value:
+            if data == b"RST":
+                self.id = BROADCAST_ADDRESS
+                self.sequence_no = 255
+                self.id_requested = False
+
+        elif command == Board.Command.offer_id.value:
+            if self.id_requested and len(data) == 1:
+                self.id_requested = False
+                self.id = data[0]
+            # If somebody hears it's id given away - it looks like master sent only "[id] [OfferID]"
+            if len(data) == 0:
+                self.id = BROADCAST_ADDRESS
+                self.id_requested = False
+
+        elif command == Board.Command.ping_from_master.value:
+            response = bytes([self.id, Board.Command.pong.value])
+            return self._respond(t + ((self.id - 128) * self.ping_slot_time + 1) / 1e6, response)
+
+        elif command == Board.Command.offer_sequence_number.value:
+            if len(data) >= 2:
+                self.sequence_no = (data[0] & 0b00111111) + ((data[1] & 0b00111111) << 6)
+        return []
+
+    def _respond(self, t, response):
+        # Board does not read the bus while waiting for it's slot and sending
+        self._busy_until = t + len(response) * SimulatedSerial.bits_per_byte / SimulatedSerial.default_baudrate
+        return [(t, response)]
+
+
+class SimulatedSerial:
+    """
+    Software stand-in for serial.Serial with emulated RS-485 bus and boards behind it.
+
+    Everything written is echoed back (like on the real bus). Commands are parsed once for the whole bus and
+    delivered to the addressed boards at the time their command code would arrive at given baud rate.
+    Board starts a command at the last byte that is it's id or broadcast address (if it was not busy then),
+    like the firmware reading byte by byte does.
+    Board responses are put on the bus at the time firmware would send them.
+
+    Can be opened from url: sim://<name>?boards=<count>&first_id=<id>&unassigned=<count>
+        boards - number of boards with an ID (ID's are first_id, first_id+1, ...)
+        unassigned - number of additional boards without ID (they request ID when pressed)
+    """
+    url_scheme = "sim"
+    default_baudrate = 500000
+    bits_per_byte = 10  # start bit + 8 data bits + stop bit
+    _command_pattern = re.compile(b"[" + bytes(sorted(SimulatedBoard.master_commands)) + b"]")
+    _address_pattern = re.compile(b"[\x80-\xff]")  # Bytes that can start a command (board id or broadcast)
+
+    def __init__(self, name="sim", boards=(), baudrate=default_baudrate):
+        self.name = name
+        self.port = name
+        self.baudrate = baudrate
+        self.timeout = None
+        self.is_open = True
+        self.boards = list(boards)
+
+        self.bytes_written = 0
+        self.collisions = 0  # Number of times something was sent while bus was not free
+
+        self._condition = threading.Condition()
+        self._received = []  # heap of (time, sequence, bytes) - data that will arrive to master
+        self._sequence = 0
+        self._ready = bytearray()  # data arrived to master, not read yet
+        self._bus_free_at = 0.0  # When master's last transmission ends
+        self._responses_end_at = 0.0  # When last board response ends
+        # Command being received: bytes after the last command code and (position, address, time) of address bytes
+        self._command_data = bytearray()
+        self._addresses = []
+        self._boards_by_id = None  # id -> boards with that id, rebuilt when id's change
+
+    @classmethod
+    def from_url(cls, url, baudrate=default_baudrate):
+        """
+        Creates simulated bus from "sim://" url
+        """
+        parts = urlsplit(url)
+        if parts.scheme != cls.url_scheme:
+            raise ValueError("Not a simulator url: '{}'".format(url))
+        query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        number_of_boards = int(query.get("boards", 1))
+        first_id = int(query.get("first_id", 128))
+        unassigned = int(query.get("unassigned", 0))
+        if first_id < 128 or first_id + number_of_boards > UNUSED_ADDRESS:
+            raise ValueError("Board ID's out of range in '{}'".format(url))
+
+        boards = [SimulatedBoard(first_id + i) for i in range(number_of_boards)]
+        boards += [SimulatedBoard() for _ in range(unassigned)]
+        return cls(name=url, boards=boards, baudrate=baudrate)
+
+    @property
+    def byte_time(self):
+        return self.bits_per_byte / self.baudrate
+
+    def write(self, data):
+        data = bytes(data)
+        with self._condition:
+            now = time.perf_counter()
+            start = max(now, self._bus_free_at)
+            if start < self._responses_end_at:
+                self.collisions += 1
+                logging.debug("{}: master started sending while boards were answering".format(self.name))
+            byte_time = self.byte_time
+            responses = []
+            position = 0
+            for match in SimulatedSerial._command_pattern.finditer(data):
+                end = match.start()
+                self._add_command_data(data, position, end, start)
+                responses += self._dispatch(data[end], start + (end + 1) * byte_time)
+                position = end + 1
+            self._add_command_data(data, position, len(data), start)
+            self._bus_free_at = start + len(data) * byte_time
+            self.bytes_written += len(data)
+            # Echo
+            self._put(self._bus_free_at, data)
+            self._put_responses(responses)
+        return len(data)
+
+    def press(self, board, value=1023):
+        """
+        Simulates user stepping on the board
+
+        @param board: SimulatedBoard or board ID
+        @param value: new sensor value
+        """
+        board = self._find(board)
+        board.sensor_value = value
+        with self._condition:
+            if board.is_waiting_for_id and board.is_pressed:
+                self._put_responses(board.request_id(max(time.perf_counter(), self._bus_free_at)))
+
+    def release(self, board):
+        self._find(board).sensor_value = 0
+
+    def read(self, size=1):
+        deadline = None if self.timeout is None else time.perf_counter() + self.timeout
+        with self._condition:
+            while True:
+                now = time.perf_counter()
+                self._collect(now)
+                if len(self._ready) >= size or (deadline is not None and now >= deadline) or not self.is_open:
+                    break
+                wait_time = None if deadline is None else deadline - now
+                if self._received:
+                    next_time = self._received[0][0] - now
+                    wait_time = next_time if wait_time is None else min(wait_time, next_time)
+                self._condition.wait(wait_time)
+            data = bytes(self._ready[:size])
+            del self._ready[:size]
+        return data
+
+    def inWaiting(self):
+        with self._condition:
+            self._collect(time.perf_counter())
+            return len(self._ready)
+
+    @property
+    def in_waiting(self):
+        return self.inWaiting()
+
+    def flushInput(self):
+        with self._condition:
+            self._collect(time.perf_counter())
+            self._ready = bytearray()
+
+    def close(self):
+        with self._condition:
+            self.is_open = False
+            self._condition.notify_all()
+
+    def _find(self, board):
+        if isinstance(board, SimulatedBoard):
+            return board
+        for simulated_board in self.boards:
+            if simulated_board.id == board:
+                return simulated_board
+        raise ValueError("No simulated board with id {}".format(board))
+
+    def _add_command_data(self, data, begin, end, start):
+        """
+        Adds data[begin:end] (written at time start) to the command being received
+        """
+        offset = len(self._command_data) - begin
+        for match in SimulatedSerial._address_pattern.finditer(data, begin, end):
+            i = match.start()
+            self._addresses.append((offset + i, data[i], start + (i + 1) * self.byte_time))
+        self._command_data += data[begin:end]
+
+    def _dispatch(self, command, t):
+        """
+        Delivers received command to every board that has started it
+
+        @return: list of (time, bytes) responses
+        """
+        addresses = self._addresses
+        responses = []
+        if addresses:
+            if any(address == BROADCAST_ADDRESS for _, address, _ in addresses):
+                boards = self.boards
+            else:
+                if self._boards_by_id is None:
+                    self._boards_by_id = {}
+                    for board in self.boards:
+                        self._boards_by_id.setdefault(board.id, []).append(board)
+                boards = [board for address in {address for _, address, _ in addresses}
+                          for board in self._boards_by_id.get(address, ())]
+            for board in boards:
+                for position, address, address_time in reversed(addresses):
+                    if (address == board.id or address == BROADCAST_ADDRESS) and board.hears(address_time):
+                        responses += board.receive(command, bytes(self._command_data[position + 1:]), t)
+                        break
+            if command in (Board.Command.reset_id.value, Board.Command.offer_id.value):
+                self._boards_by_id = None  # Boards may have changed their id
+        self._command_data = bytearray()
+        self._addresses = []
+        return responses
+
+    def _put_responses(self, responses):
+        for t, response in sorted(responses):
+            if t < self._bus_free_at or t < self._responses_end_at:
+                self.collisions += 1
+                logging.debug("{}: collision on bus, response {}".format(self.name, response))
+            end = t + len(response) * self.byte_time
+            self._responses_end_at = max(self._responses_end_at, end)
+            self._put(end, response)
+
+    def _put(self, t, data):
+        heapq.heappush(self._received, (t, self._sequence, data))
+        self._sequence += 1
+        self._condition.notify_all()
+
+    def _collect(self, now):
+        while self._received and self._received[0][0] <= now:
+            self._ready += heapq.heappop(self._received)[2]
@@ -0,0 +1,197 @@
+__author__ = 'Mark Laane'
+
+from collections import deque
+import threading
+import time
+
+from ledBoard import Board
+
+
+class SlotEstimate():
+    """
+    Learned length of one board's response slot.
+
+    Follows peaks of the observed values: grows quickly when a response arrives later than expected
+    and shrinks slowly when responses keep arriving earlier.
+    """
+    rise_rate = 0.5
+    decay_rate = 0.02
+    max_growth = 1.5  # Observed values are limited to initial slot time times this (protects from USB latency spikes)
+
+    def __init__(self, base_time, slot_time):
+        """
+        Args:
+            base_time: time in microseconds from command to the first slot (fixed in firmware)
+            slot_time: initial slot time in microseconds
+        """
+        self.base_time = base_time
+        self.slot_time = slot_time
+        self.samples = 0
+        self._max_slot_time = slot_time * SlotEstimate.max_growth
+
+    def observe(self, slot_time):
+        slot_time = max(0, min(slot_time, self._max_slot_time))
+        rate = SlotEstimate.rise_rate if slot_time > self.slot_time else SlotEstimate.decay_rate
+        self.slot_time += rate * (slot_time - self.slot_time)
+        self.samples += 1
+
+
+class BusTimingModel():
+    """
+    Estimates how long the bus has to stay silent after a command.
+
+    Transfer time is calculated from baud rate and byte count.
+    Response slot times are learned from arrival times of responses (pong, sensor data, info).
+    All silence windows get safety margins on top of them.
+    """
+    # Defaults (prior loading config file)
+    safety_margin = 0.1  # Relative margin added to learned times
+    safety_padding = 100  # Absolute margin in microseconds
+    learning = True  # Adapt slot times to responses
+
+    led_render_time = 5500  # Time from end of LED data to end of render (not observable by master): 2.5ms + 3ms
+    bits_per_byte = 10  # start bit + 8 data bits + stop bit
+    max_response_size = {  # Longest expected response in bytes (id + data + code)
+        Board.Command.pong: 2,
+        Board.Command.sensor_data: 6,
+        Board.Command.info: 16
+    }
+    # Response code expected for every command
+    response_codes = {
+        Board.Command.ping_from_master: Board.Command.pong,
+        Board.Command.request_sensor: Board.Command.sensor_data,
+        Board.Command.request_info: Board.Command.info
+    }
+
+    def __init__(self, baudrate):
+        self.byte_time = BusTimingModel.bits_per_byte * 1000000 / baudrate  # in microseconds
+        # Initial values are the slot times measured with a scope (+ safety time used back then)
+        self.slots = {
+            Board.Command.pong: SlotEstimate(base_time=1, slot_time=300 + 500),
+            Board.Command.sensor_data: SlotEstimate(base_time=100, slot_time=400),
+            Board.Command.info: SlotEstimate(base_time=1, slot_time=500 + 500)
+        }
+        self._lock = threading.Lock()
+        self._window = None  # (expected response code, time when command was completely sent, time window ends)
+        self._last_response = None  # (slot index, slot time) of the highest slot answered in current window
+
+        # Bus utilisation over the last period
+        self._busy_period = 1.0
+        self._busy_samples = deque()  # (start time, busy time in seconds)
+
+    def transfer_time(self, n_bytes):
+        """
+        @return: time in microseconds it takes to transfer n_bytes over the bus
+        """
+        return n_bytes * self.byte_time
+
+    def render_silence(self):
+        """
+        @return: time in microseconds boards need after receiving LED data
+        """
+        return self._with_margin(BusTimingModel.led_render_time)
+
+    def response_silence(self, command, number_of_slots):
+        """
+        @param command: command sent (ping_from_master, request_sensor or request_info)
+        @param number_of_slots: number of response slots boards will use
+        @return: time in microseconds all boards need for answering
+        """
+        code = BusTimingModel.response_codes[command]
+        slot = self.slots[code]
+        if number_of_slots == 0:
+            return self._with_margin(slot.base_time)
+        last_response = (
+            slot.base_time +
+            (number_of_slots - 1) * slot.slot_time +
+            self.transfer_time(BusTimingModel.max_response_size[code])
+        )
+        return self._with_margin(last_response)
+
+    def command_sent(self, command, transfer_end, response_time_us=None):
+        """
+        Starts a response window. Responses arriving after that are used for learning slot times.
+
+        @param command: command that was sent
+        @param transfer_end: time (time.perf_counter()) when the command has been completely sent
+        @param response_time_us: silence given to boards for answering (responses arriving later are not learned)
+        """
+        with self._lock:
+            self._learn_window()
+            code = BusTimingModel.response_codes.get(command)
+            if code is None:
+                self._window = None
+            else:
+                window_end = None if response_time_us is None else transfer_end + response_time_us / 1000000
+                self._window = code, transfer_end, window_end
+
+    def observe(self, response, slot_index, received_at):
+        """
+        Learns from arrival time of a response.
+
+        Serial data arrives in chunks, so all responses of a chunk get the arrival time of the last one (plus USB
+        latency). Only the highest slot of a window is learned from (when next window starts), that way latency
+        is divided by the number of slots it spans instead of being taken in full by the first slot.
+        Windows are told apart only by time: response that could not have been sent in it's slot of current window
+        (late answer to the previous command) or arrives after the window has ended is not learned from.
+
+        @param response: received Response
+        @param slot_index: index of the response slot used by the board (sequence number or id-128)
+        @param received_at: time (time.perf_counter()) when the response was read from serial
+        """
+        if not BusTimingModel.learning or slot_index is None or slot_index < 1:
+            return
+        with self._lock:
+            if self._window is None or self._window[0] != response.code:
+                return
+            _, transfer_end, window_end = self._window
+            if window_end is not None and received_at > window_end:
+                return
+            offset = (received_at - transfer_end) * 1000000
+            slot = self.slots[response.code]
+            # Response must have been started at the beginning of it's slot
+            response_time = self.transfer_time(len(response.data) + 2)
+            slot_time = (offset - slot.base_time - response_time) / slot_index
+            if slot_time < slot.slot_time / SlotEstimate.max_growth:
+                return  # Earlier than it's slot could have started
+            if self._last_response is None or self._last_response[0] < slot_index:
+                self._last_response = slot_index, slot_time
+
+    def _learn_window(self):
+        """
+        Learns from the highest slot answered in the window that ends (call with lock held)
+        """
+        if self._last_response is not None:
+            self.slots[self._window[0]].observe(self._last_response[1])
+            self._last_response = None
+
+    def bus_busy(self, start, busy_time):
+        """
+        Accounts time bus is busy (transfer + silence) for utilisation statistics.
+
+        @param start: time (time.perf_counter()) of the start of transaction
+        @param busy_time: time in microseconds
+        """
+        with self._lock:
+            self._busy_samples.append((start, busy_time / 1000000))
+            self._forget_old_samples(start)
+
+    def snapshot(self):
+        """
+        @return: dictionary of learned values
+            slot times (microseconds) for each response and utilisation/headroom of the bus during the last second
+        """
+        with self._lock:
+            self._forget_old_samples(time.perf_counter())
+            utilisation = min(1.0, sum(busy_time for _, busy_time in self._busy_samples) / self._busy_period)
+            values = {code.name: round(slot.slot_time) for code, slot in self.slots.items()}
+        values["utilisation"] = utilisation
+        values["headroom"] = 1 - utilisation
+        return values
+
+    def _forget_old_samples(self, now):
+        while self._busy_samples and now - self._busy_samples[0][0] >= self._busy_period:
+            self._busy_samples.popleft()
+
+    def _with_margin(self, us):
+        return us * (1 + BusTimingModel.safety_margin) + BusTimingModel.safety_padding
@@ -0,0 +1,106 @@
+"""
+Compiles a game into a show file (see show_file.ShowFile), which is played in GameController.Mode.show.
+
+Game is stepped and drawn headlessly once per frame and every frame is encoded to LED data commands of all
+assigned boards. Floor dimensions and game settings are read from config.ini.
+Usage:
+    python compile_show.py <mode> <show file> [seconds] [fps]
+    (mode is a GameController.Mode name, e.g. logo)
+"""
+__author__ = 'Mark Laane'
+
+import configparser
+import logging
+import sys
+
+import numpy
+import cairocffi as cairo
+
+from board_bus import BoardBus
+from configure import configure_all
+from frame_encoder import FrameEncoder
+from game_controller import GameController
+from games import VideoPlayback
+from ledBoard import Board
+from matrix_controller import MatrixController
+from show_file import ShowFile, ShowWriter
+
+
+def compile_show(game, path, fps, seconds, dimensions, board_assignment, channel_order=MatrixController.channel_order):
+    """
+    Runs game for given time and writes every frame to a show file.
+
+    @param game: Game to be compiled
+    @param fps: frames per second (game is stepped once per frame)
+    @param dimensions: floor dimensions in boards
+    @param board_assignment: list of [board id, column, row]
+    @param channel_order: index of red, green and blue byte in Cairo pixel
+    """
+    width, height = dimensions[0] * 10, dimensions[1] * 10
+    stride = cairo.ImageSurface.format_stride_for_width(cairo.FORMAT_ARGB32, width)
+    frame = numpy.zeros((height, stride // 4, 4), dtype=numpy.uint8)
+    surface = cairo.ImageSurface.create_for_data(memoryview(frame), cairo.FORMAT_ARGB32, width, height, stride)
+    ctx = cairo.Context(surface)
+
+    boards = [Board(board_id, None, column, row) for board_id, column, row in board_assignment]
+    encoder = FrameEncoder(frame.shape, channel_order)
+    encoder.set_boards(boards)
+    packet_size = FrameEncoder.packet_size
+    commands = numpy.empty((len(boards), ShowFile.stride), dtype=numpy.uint8)
+    command = bytearray()
+
+    n_frames = int(seconds * fps)
+    with ShowWriter(path, [board.id for board in boards], n_frames) as writer:
+        for i in range(n_frames):
+            game.step()
+            if game.draws_pixels:
+                game.draw_pixels(frame[:, :width], channel_order)
+            elif game.interpolates:
+                game.draw(ctx, 0.0)
+            else:
+                game.draw(ctx)
+            surface.flush()
+
+            _, encoded_data = encoder.encode(frame)
+            for row, board in enumerate(boards):
+                del command[:]
+                board.encode_command(
+                    Board.Command.send_led_data, encoded_data[row * packet_size:(row + 1) * packet_size], command
+                )
+                commands[row] = numpy.frombuffer(command, dtype=numpy.uint8)
+            writer.add(i / fps, commands)
+        writer.close(n_frames / fps)  # (Show of a single frame has no frame period to take the duration from)
+    logging.info("Compiled {} frames to {}".format(n_frames, path))
+
+
+def main():
+    logging.basicConfig(format='[%(asctime)s] %(levelname)7s: %(message)s', level=logging.INFO)
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    mode = GameController.Mode[sys.argv[1]]
+    path = sys.argv[2]
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 60.0
+
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    configure_all(config)
+    fps = float(sys.argv[4]) if len(sys.argv) > 4 else MatrixController.data_update_FPS
+
+    dimensions = MatrixController.dimensions
+    for y in range(dimensions[1]):
+        for x in range(dimensions[0]):
+            BoardBus.add_assignation(128 + dimensions[0] * y + x, x, y)
+    field_dims = dimensions[0] * 10, dimensions[1] * 10
+    if mode == GameController.Mode.video:
+        # Clip has to follow game time - frames are compiled faster than they are played
+        game = VideoPlayback(field_dims, GameController.video_file, step_period=1 / fps)
+    else:
+        game = GameController.create_game(mode, field_dims, dimensions)
+    compile_show(game, path, fps, seconds, dimensions, BoardBus.board_assignment)
+    if isinstance(game, VideoPlayback):
+        game.stop()
+
+
+if __name__ == '__main__':
+    main()
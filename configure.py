@@ -1,13 +1,26 @@
 __author__ = 'Mark'
 
 from matrix_controller import MatrixController
+from board_bus import BoardBus
+from async_bus import AsyncBoardBus
+from bus_timing import BusTimingModel
+from frame_encoder import FrameEncoder, TileCache
+from game_clock import GameClock
+from game_controller import GameController
+from show_file import ShowPlayer
 from games.game_elements_library import Ball, Paddle
+from games.sprite_cache import SpriteCache
 from games.catch_colors import FadingSymbol
-from games import Breaker, Pong, CatchColorsMultiplayer, LogoBounce
+from games import Breaker, Pong, CatchColorsMultiplayer, LogoBounce, VideoPlayback
 
 
 def configure_all(config):
     conf_matrix(config["Matrix"])
+    conf_bus_timing(config["Bus Timing"])
+    conf_frame_encoder(config["Frame Encoder"])
+    conf_show(config["Show"])
+    conf_video(config["Video"])
+    conf_sprites(config["Sprites"])
     conf_ball(config["Ball"])
     conf_paddle(config["Paddle"])
     conf_logo_bounce(config["Logo Bounce"])
@@ -35,19 +48,58 @@ def csv_to_float_list(csv_string):
 def conf_matrix(conf):
     MatrixController.serial_ports = csv_to_list(conf["Serial ports"])
     MatrixController.data_update_FPS = float(conf["Data Update FPS"])
+    if conf.get("Simulation FPS", "").strip():
+        MatrixController.simulation_FPS = float(conf["Simulation FPS"])
+    GameClock.max_catch_up = int(conf["Max catch-up steps"])
     MatrixController.sensor_update_FPS = float(conf["Serial Update FPS"])
     MatrixController.dimensions = int(conf["Width"]), int(conf["Height"])
+    MatrixController.bus_processes = conf.getboolean("Bus processes", fallback=False)
+    bus_drivers = {"threads": BoardBus, "asyncio": AsyncBoardBus}
+    MatrixController.bus_class = bus_drivers[conf.get("Bus driver", "threads").strip().lower()]
+    MatrixController.render_backend = conf.get("Render backend", "cairo").strip().lower()
+
+
+def conf_bus_timing(conf):
+    BusTimingModel.learning = conf.getboolean("Learn")
+    BusTimingModel.safety_margin = float(conf["Safety margin"])
+    BusTimingModel.safety_padding = float(conf["Safety padding"])
+    BoardBus.led_time_share = float(conf["LED time share"]) or None
+
+
+def conf_frame_encoder(conf):
+    TileCache.max_size = int(conf["Tile cache size"])
+    FrameEncoder.max_staleness = float(conf["Max staleness"])
+    if TileCache.max_size <= 0:
+        FrameEncoder.tile_cache = None
+
+
+def conf_show(conf):
+    GameController.show_file = conf["File"]
+    ShowPlayer.loop = conf.getboolean("Loop")
+
+
+def conf_video(conf):
+    GameController.video_file = conf["File"]
+    VideoPlayback.raw_size = csv_to_int_list(conf["Raw size"])
+    VideoPlayback.fps = float(conf["FPS"])
+    VideoPlayback.read_ahead_frames = int(conf["Read-ahead frames"])
+    VideoPlayback.loop = conf.getboolean("Loop")
+
+
+def conf_sprites(conf):
+    SpriteCache.max_size = int(conf["Cache size"])
+    SpriteCache.phase_steps = int(conf["Phase steps"])
 
 
 def conf_ball(conf):
-    Ball.radius = float(conf["Radius"])
+    Ball.default_radius = float(conf["Radius"])
     Ball.stroke_color = csv_to_float_list(conf["Stroke color"])
     Ball.fill_color = csv_to_float_list(conf["Fill color"])
 
 
 def conf_paddle(conf):
-    Paddle.width = float(conf["width"])
-    Paddle.height = float(conf["height"])
+    Paddle.default_width = float(conf["width"])
+    Paddle.default_height = float(conf["height"])
     Paddle.stroke_color = [
         csv_to_float_list(conf["Stroke color 0"]),
         csv_to_float_list(conf["Stroke color 1"])
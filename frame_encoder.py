@@ -0,0 +1,373 @@
+__author__ = 'Mark Laane'
+
+from collections import namedtuple, OrderedDict
+import threading
+import time
+
+import numpy
+
+BOARD_SIZE = 10  # Number of LEDs on each side of a board
+
+# Everything that belongs to one list of boards. Swapped in as a whole, so other threads always see matching parts.
+_EncoderState = namedtuple(
+    "_EncoderState",
+    ["boards", "positions", "indices", "tiles", "shadow", "displayed", "shown", "pending", "pending_since", "buffer",
+     "output", "send_buffer", "send_output"]
+)
+
+# Result of FrameEncoder.take_pending() and encode_dirty()
+#   shared - encoded tile to be broadcast to all boards (None if broadcasting does not pay off)
+#   boards - boards that need their own packet (after the shared tile)
+#   data - encoded data of these boards (packet_size bytes per board, in same order)
+EncodedFrame = namedtuple("EncodedFrame", ["shared", "boards", "data"])
+
+
+class TileCache():
+    """
+    Bounded LRU cache of encoded tiles, shared by encoders of all buses.
+
+    Key is the content of a quantized tile (3-bit values in LED order), so equal keys always mean equal packets.
+    Lookups and stores are done in batches - one lock acquisition per frame.
+    """
+    max_size = 512  # Number of encoded tiles kept (150 bytes each)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._packets = OrderedDict()  # tile content -> encoded packet
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._packets)
+
+    def lookup(self, keys):
+        """
+        @return: list of encoded packets (None for tiles not in cache), in the same order as keys
+        """
+        packets = []
+        with self._lock:
+            for key in keys:
+                packet = self._packets.get(key)
+                if packet is not None:
+                    self._packets.move_to_end(key)
+                packets.append(packet)
+            misses = packets.count(None)
+            self.misses += misses
+            self.hits += len(packets) - misses
+        return packets
+
+    def store(self, items):
+        """
+        @param items: iterable of (key, packet)
+        """
+        with self._lock:
+            for key, packet in items:
+                self._packets[key] = packet
+                self._packets.move_to_end(key)
+            while len(self._packets) > TileCache.max_size:
+                self._packets.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._packets.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class FrameEncoder:
+    """
+    Encodes LED data for all boards of one bus in a single vectorized pass.
+
+    Gather indices (serpentine LED order + board column/row offset) are calculated once in set_boards().
+    Encoding a frame is then one numpy.take into a work array and a few shifts into
+    a preallocated bytearray, instead of one copy/flip/pack round-trip per board.
+
+    Encoder also keeps a shadow frame - tiles of all boards (3-bit values) as they should be displayed.
+    update() compares all tiles against it at once and encodes only the changed ones. Changed tiles are
+    collected until transmit takes them with take_pending(), so encoding of the next frame can run while
+    the previous one is being sent.
+    If many changed tiles are identical (clears, fills, fades), that tile can be broadcast once instead.
+    If transmit has a budget, tiles that are furthest from what boards display are taken first, rest are deferred
+    (but not for longer than max_staleness).
+    Changed tiles seen recently (black, solid colors, static patterns) are taken from tile_cache instead of encoding.
+    """
+    tile_cache = TileCache()  # Shared by all encoders, None disables caching
+    max_staleness = 0.5  # Longest time (seconds) a changed tile can be deferred by budget
+    values_per_board = BOARD_SIZE * BOARD_SIZE * 3
+    packet_size = values_per_board // 2  # Two 3-bit color values are packed into each byte
+
+    def __init__(self, frame_shape, channel_order=(0, 1, 2)):
+        """
+        Args:
+            frame_shape: shape of the frame array (height, width, channels)
+            channel_order: index of red, green and blue channel in frame
+        """
+        self.frame_shape = frame_shape
+        self.channel_order = channel_order
+        self.dirty_count = 0  # Number of changed tiles found by last take_pending()
+        self.deferred_count = 0  # Number of changed tiles left pending by last take_pending() (over budget)
+        # Encoding stage (update) and transmit stage (take_pending) can run in different threads
+        self._lock = threading.RLock()
+        self._state = self._build([], None)
+
+    @property
+    def boards(self):
+        return self._state.boards
+
+    @property
+    def buffer(self):
+        """
+        bytearray holding encoded data (packet_size bytes per board)
+        """
+        return self._state.buffer
+
+    def set_boards(self, boards):
+        """
+        Recalculates gather indices. Has to be called every time list of boards changes.
+        Shadow of boards that stay on the list is kept, new boards will be refreshed with next update().
+        """
+        with self._lock:
+            self._state = self._build(list(boards), self._state)
+
+    def invalidate(self):
+        """
+        Forgets what boards are displaying. All boards will be refreshed with next update().
+        """
+        with self._lock:
+            state = self._state
+            # Only boards with encoded data can be taken right away, others are encoded by next update()
+            state.pending_since[state.shown & ~state.pending] = time.perf_counter()
+            numpy.logical_or(state.pending, state.shown, out=state.pending)
+            state.shown[:] = False
+
+    def encode(self, frame):
+        """
+        Encodes data of all boards.
+
+        @param frame: numpy array of the whole image (frame_shape)
+        @return: list of boards and memoryview of encoded data (packet_size bytes per board, in same order)
+        """
+        with self._lock:
+            state = self._state
+            if state.boards:
+                tiles = state.tiles
+                numpy.take(frame.reshape(-1), state.indices, out=tiles)
+                tiles >>= 5
+                self._pack(tiles, state.output)
+            return state.boards, memoryview(state.buffer)
+
+    def encode_dirty(self, frame, broadcast_gap=None, changed_boards=None, budget=None):
+        """
+        Encodes data of the boards whose tile differs from the shadow frame (update() and take_pending() at once).
+
+        @param frame: numpy array of the whole image (frame_shape)
+        @param broadcast_gap: see take_pending()
+        @param changed_boards: see update()
+        @param budget: see take_pending()
+        @return: EncodedFrame
+        """
+        with self._lock:
+            self.update(frame, changed_boards)
+            return self.take_pending(broadcast_gap, budget)
+
+    def update(self, frame, changed_boards=None):
+        """
+        Compares frame against the shadow frame, updates the shadow and encodes changed tiles.
+        Tiles that differ from what board displays stay pending until take_pending(). If frames are updated faster
+        than they are taken, changes of all of them are merged (only the latest data of a board is sent).
+
+        @param frame: numpy array of the whole image (frame_shape)
+        @param changed_boards: boolean numpy array (rows, columns) of boards that could have changed since last call.
+            Only these boards (and boards not refreshed yet) are compared. None - compare all boards.
+        """
+        with self._lock:
+            state = self._state
+            if not state.boards:
+                return
+
+            if changed_boards is None:
+                tiles = state.tiles
+                numpy.take(frame.reshape(-1), state.indices, out=tiles)
+                tiles >>= 5  # Boards display 3 bits per channel - compare only what is visible
+                dirty = (tiles != state.shadow).any(axis=1)
+                dirty |= ~state.shown
+                numpy.copyto(state.shadow, tiles)
+            else:
+                candidates = numpy.flatnonzero(changed_boards[state.positions] | ~state.shown)
+                tiles = numpy.take(frame.reshape(-1), state.indices[candidates])
+                tiles >>= 5
+                dirty = numpy.zeros(len(state.boards), dtype=bool)
+                dirty[candidates] = (tiles != state.shadow[candidates]).any(axis=1) | ~state.shown[candidates]
+                state.shadow[candidates] = tiles
+
+            rows = numpy.flatnonzero(dirty)
+            self._encode_rows(state.shadow, rows, state.output)
+            # Tile that changed back to what board displays (while deferred) does not have to be sent anymore
+            pending = (state.shadow[rows] != state.displayed[rows]).any(axis=1) | ~state.shown[rows]
+            state.pending_since[rows[pending & ~state.pending[rows]]] = time.perf_counter()
+            state.pending[rows] = pending
+
+    def take_pending(self, broadcast_gap=None, budget=None):
+        """
+        Takes changed tiles that have not been taken yet.
+
+        When the most common changed tile is shared by enough boards, it is returned separately to be broadcast.
+        Every board with a different tile then needs it's own packet (even if it did not change), because
+        broadcast overwrites all boards. Broadcast is used only if it takes less packets than sending
+        changed tiles one by one.
+
+        If there are more changed tiles than budget allows, tiles pending for max_staleness are taken first
+        (even over budget), then tiles with the biggest difference to what boards display. Rest stay pending.
+
+        @param broadcast_gap: cost (in packets) of the pause boards need after broadcast, None disables broadcasting
+        @param budget: number of packets that can be sent, None - no limit
+        @return: EncodedFrame
+        """
+        with self._lock:
+            state = self._state
+            rows = numpy.flatnonzero(state.pending)
+            self.dirty_count = len(rows)
+
+            # Shadow holds the tiles of all boards as they should be displayed
+            shared = None
+            if broadcast_gap is not None and len(rows) > 1:
+                shared_tile, other_rows = self._most_common_tile(state.shadow, rows)
+                # Boards added after last update() have no encoded data yet - they are refreshed by next update()
+                encoded = state.shown | state.pending
+                other_rows = other_rows[encoded[other_rows]]
+                gap = broadcast_gap if len(other_rows) else 0
+                cost = 1 + gap + len(other_rows)
+                if cost < len(rows) and (budget is None or cost <= budget):
+                    shared = bytearray(self.packet_size)
+                    self._encode_rows(shared_tile.reshape(1, -1), [0],
+                                      numpy.frombuffer(shared, dtype=numpy.uint8).reshape(1, -1))
+                    shared = memoryview(shared)
+                    rows = other_rows
+                    # Broadcast overwrites all boards
+                    state.displayed[encoded] = shared_tile
+                    state.shown[encoded] = True
+
+            if budget is not None and len(rows) > budget:
+                rows = self._prioritize(rows, budget)
+            state.displayed[rows] = state.shadow[rows]
+            state.shown[rows] = True
+            if shared is None:
+                state.pending[rows] = False
+            else:
+                numpy.any(state.displayed != state.shadow, axis=1, out=state.pending)
+                numpy.logical_and(state.pending, state.shown, out=state.pending)
+            self.deferred_count = int(numpy.count_nonzero(state.pending))
+
+            if len(rows):
+                state.send_output[:len(rows)] = state.output[rows]
+            boards = [state.boards[row] for row in rows]
+            return EncodedFrame(shared, boards, memoryview(state.send_buffer)[:len(rows) * FrameEncoder.packet_size])
+
+    def _prioritize(self, rows, budget):
+        """
+        @return: rows that have waited for max_staleness and as many rows with the biggest error as fit in budget
+        """
+        state = self._state
+        stale = state.pending_since[rows] <= time.perf_counter() - FrameEncoder.max_staleness
+        # Error - how far displayed tile is from the target (boards not refreshed yet first)
+        error = numpy.abs(state.shadow[rows].astype(numpy.int16) - state.displayed[rows]).sum(axis=1)
+        error[~state.shown[rows]] = FrameEncoder.values_per_board * 8
+        free = max(0, budget - numpy.count_nonzero(stale))
+        fresh = numpy.flatnonzero(~stale)
+        chosen = fresh[numpy.argsort(-error[fresh], kind="stable")[:free]]
+        return numpy.sort(numpy.concatenate((rows[stale], rows[chosen])))
+
+    @staticmethod
+    def _encode_rows(tiles, rows, output):
+        """
+        Encodes given rows of tiles into the same rows of output. Uses tile cache if it is enabled.
+        """
+        if len(rows) == 0:
+            return
+        cache = FrameEncoder.tile_cache
+        if cache is None:
+            packed = numpy.empty((len(rows), FrameEncoder.packet_size), dtype=numpy.uint8)
+            FrameEncoder._pack(tiles[rows], packed)
+            output[rows] = packed
+            return
+
+        keys = [tiles[row].tobytes() for row in rows]
+        missing = []
+        for row, packet in zip(rows, cache.lookup(keys)):
+            if packet is None:
+                missing.append(row)
+            else:
+                output[row] = numpy.frombuffer(packet, dtype=numpy.uint8)
+        if missing:
+            packed = numpy.empty((len(missing), FrameEncoder.packet_size), dtype=numpy.uint8)
+            FrameEncoder._pack(tiles[missing], packed)
+            output[missing] = packed
+            cache.store((tiles[row].tobytes(), packet.tobytes()) for row, packet in zip(missing, packed))
+
+    @staticmethod
+    def _most_common_tile(tiles, rows):
+        """
+        @return: most common tile among given rows and rows of all tiles that differ from it
+        """
+        unique_tiles, counts = numpy.unique(tiles[rows], axis=0, return_counts=True)
+        shared_tile = unique_tiles[numpy.argmax(counts)]
+        other_rows = numpy.flatnonzero((tiles != shared_tile).any(axis=1))
+        return shared_tile, other_rows
+
+    @staticmethod
+    def _pack(tiles, output):
+        # Sum every pair of values (first value shifted) and add required bit
+        numpy.left_shift(tiles[:, ::2], 3, out=output)
+        output += tiles[:, 1::2]
+        output += 1 << 6
+
+    def _build(self, boards, previous):
+        height, width, channels = self.frame_shape
+
+        # Position of every value inside one board: LED rows top to bottom, every second row reversed
+        led_y, led_x = numpy.mgrid[0:BOARD_SIZE, 0:BOARD_SIZE]
+        led_x[1::2] = led_x[1::2, ::-1]
+        tile_offsets = (led_y.reshape(-1, 1) * width + led_x.reshape(-1, 1)) * channels + self.channel_order
+        tile_offsets = tile_offsets.reshape(-1)
+
+        indices = numpy.empty((len(boards), self.values_per_board), dtype=numpy.intp)
+        positions = (
+            numpy.array([board.row for board in boards], dtype=numpy.intp),
+            numpy.array([board.column for board in boards], dtype=numpy.intp)
+        )
+        for i, board in enumerate(boards):
+            origin = (board.row * BOARD_SIZE * width + board.column * BOARD_SIZE) * channels
+            indices[i] = tile_offsets + origin
+
+        tiles = numpy.empty(indices.shape, dtype=numpy.uint8)
+        shadow = numpy.zeros(indices.shape, dtype=numpy.uint8)
+        displayed = numpy.zeros(indices.shape, dtype=numpy.uint8)  # Tiles last sent to boards
+        shown = numpy.zeros(len(boards), dtype=bool)  # Board displays it's tile in displayed
+        pending = numpy.zeros(len(boards), dtype=bool)  # Board does not display the target tile yet
+        pending_since = numpy.zeros(len(boards))  # Time (time.perf_counter()) board became pending
+
+        # Encoded data of every board (row of each board is updated when it's tile changes)
+        buffer = bytearray(len(boards) * self.packet_size)
+        # Encoded data of boards taken for sending (packed together)
+        send_buffer = bytearray(len(boards) * self.packet_size)
+        if boards:
+            output = numpy.frombuffer(buffer, dtype=numpy.uint8).reshape(len(boards), self.packet_size)
+            send_output = numpy.frombuffer(send_buffer, dtype=numpy.uint8).reshape(len(boards), self.packet_size)
+        else:
+            output = None
+            send_output = None
+
+        if previous is not None:
+            for i, board in enumerate(boards):
+                if board in previous.boards:
+                    old_row = previous.boards.index(board)
+                    shadow[i] = previous.shadow[old_row]
+                    displayed[i] = previous.displayed[old_row]
+                    shown[i] = previous.shown[old_row]
+                    pending[i] = previous.pending[old_row]
+                    pending_since[i] = previous.pending_since[old_row]
+                    output[i] = previous.output[old_row]
+        return _EncoderState(
+            boards, positions, indices, tiles, shadow, displayed, shown, pending, pending_since, buffer, output,
+            send_buffer, send_output
+        )
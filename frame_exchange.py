@@ -0,0 +1,144 @@
+__author__ = 'Mark Laane'
+
+import time
+
+import numpy
+
+
+class Frame():
+    """
+    One slot of the frame exchange: image buffer and information about the frame currently in it.
+    """
+
+    def __init__(self, index, shape):
+        self.index = index  # Position of the slot in FrameExchange.slots
+        self.data = numpy.zeros(shape, dtype=numpy.uint8)
+        self.sequence = 0  # Sequence number of the frame (0 - nothing published yet)
+        self.timestamp = None  # Time (time.time()) when frame was published
+        self.dirty_boards = None  # Boolean array (rows, columns) of boards changed by this frame (None - all)
+
+
+class FrameReader():
+    """
+    Read end of the frame exchange used by one consumer (bus or GUI).
+    Reader holds the frame it picked up until it picks up the next one.
+    """
+
+    def __init__(self, exchange, index):
+        self._exchange = exchange
+        self._index = index
+        self.shape = exchange.shape
+        self.last_sequence = 0  # Sequence number of the last frame picked up
+        self.frames_sent = 0  # Frames picked up
+        self.frames_dropped = 0  # Published frames that were replaced before they were picked up
+        # Boards changed since the previous frame picked up (union over dropped frames), None - all
+        self.dirty_boards = None
+
+    def latest(self):
+        """
+        Picks up the newest complete frame. Frame stays intact until next call.
+
+        @return: Frame (data of all zeros with sequence 0 if nothing is published yet)
+        """
+        exchange = self._exchange
+        while True:
+            frame = exchange.latest
+            exchange.held[self._index] = frame.index
+            # Writer does not take a slot that is held or latest. If latest is unchanged after the hold was
+            # announced, writer could not have taken this slot in between.
+            if exchange.latest is frame:
+                break
+
+        if frame.sequence != self.last_sequence:
+            if self.last_sequence:
+                self.frames_dropped += frame.sequence - self.last_sequence - 1
+                self.dirty_boards = exchange.dirty_boards_between(self.last_sequence, frame.sequence)
+            else:
+                self.dirty_boards = None
+            self.last_sequence = frame.sequence
+            self.frames_sent += 1
+        elif self.dirty_boards is not None:
+            self.dirty_boards = numpy.zeros_like(self.dirty_boards)
+        return frame
+
+    def is_new_frame(self):
+        """
+        @return: True if a frame newer than the last picked up has been published
+        """
+        return self._exchange.latest.sequence != self.last_sequence
+
+
+class FrameExchange():
+    """
+    Hands frames from the game loop (single writer) to buses and GUI (readers) without locks or copies on the read side.
+
+    Exchange is a ring of readers + 2 slots: every reader can hold one frame, one slot is the latest
+    complete frame and writer always has one free slot to render into. Writer never waits and readers
+    always get the newest complete frame, skipping the ones they were too slow for.
+
+    Writer:
+        frame = exchange.begin()
+        ...draw into frame.data...
+        exchange.publish(frame, dirty_boards)
+    """
+    history_size = 64  # Number of frames dirty boards are remembered for
+
+    def __init__(self, shape, readers):
+        """
+        Args:
+            shape: shape of the frame buffers
+            readers: number of readers
+        """
+        self.shape = shape
+        self.slots = [Frame(i, shape) for i in range(readers + 2)]
+        self.held = [None] * readers  # Index of the slot each reader holds
+        self.readers = [FrameReader(self, i) for i in range(readers)]
+        self.latest = self.slots[0]
+        self._sequence = 0
+        self._history = [(0, None)] * FrameExchange.history_size  # (sequence, dirty boards) at sequence % size
+
+    def begin(self):
+        """
+        Takes a free slot for rendering the next frame.
+        Latest frame is copied into it, so game can draw only what has changed.
+
+        @return: Frame
+        """
+        latest = self.latest
+        held = set(self.held)
+        for frame in self.slots:
+            if frame is not latest and frame.index not in held:
+                break
+        else:
+            raise RuntimeError("No free slot in frame exchange")
+        numpy.copyto(frame.data, latest.data)
+        return frame
+
+    def publish(self, frame, dirty_boards=None):
+        """
+        Makes rendered frame available to readers.
+
+        @param dirty_boards: boolean numpy array (rows, columns) of boards that have changed, None if unknown
+        """
+        self._sequence += 1
+        frame.sequence = self._sequence
+        frame.timestamp = time.time()
+        frame.dirty_boards = dirty_boards
+        self._history[self._sequence % FrameExchange.history_size] = (self._sequence, dirty_boards)
+        self.latest = frame
+
+    def dirty_boards_between(self, first_sequence, last_sequence):
+        """
+        @return: boolean array of boards changed by frames after first_sequence up to last_sequence,
+            None if any of these frames changed everything or is not in history anymore
+        """
+        dirty_boards = None
+        for sequence in range(first_sequence + 1, last_sequence + 1):
+            history_sequence, frame_dirty_boards = self._history[sequence % FrameExchange.history_size]
+            if history_sequence != sequence or frame_dirty_boards is None:
+                return None
+            if dirty_boards is None:
+                dirty_boards = frame_dirty_boards.copy()
+            else:
+                dirty_boards |= frame_dirty_boards
+        return dirty_boards
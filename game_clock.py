@@ -0,0 +1,110 @@
+__author__ = 'Mark Laane'
+
+import time
+
+
+class GameClock():
+    """
+    Fixed timestep clock for the render loop.
+
+    Game is stepped at a fixed simulation rate, independent of the rate frames are rendered at.
+    Time that has passed since the last frame is turned into whole steps, the remainder is carried over
+    (and available as interpolation alpha). If the loop falls behind (GC pause, slow serial write),
+    at most max_catch_up steps are run per frame - rest of the lag is dropped instead of stepping
+    in a burst, which would make the loop fall behind even more.
+
+    Uses time.monotonic, so changes of wall clock do not affect the game.
+    """
+    max_catch_up = 5  # Maximum number of steps run for one frame
+    jitter_tolerance = 0.1  # Step that is due within this fraction of step period is run now (keeps cadence steady)
+
+    def __init__(self, step_rate, frame_rate):
+        """
+        Args:
+            step_rate: simulation steps per second
+            frame_rate: rendered frames per second
+        """
+        self.step_period = 1.0 / step_rate
+        self.frame_period = 1.0 / frame_rate
+
+        self.steps = 0  # Steps run
+        self.frames = 0  # Frames rendered
+        self.skipped_frames = 0  # Frames not rendered because loop was late
+        self.dropped_steps = 0  # Steps not run because of max_catch_up
+        self.max_steps_per_frame = 0
+
+        self._lag = 0.0  # Simulation time not stepped yet (seconds)
+        self._last_time = 0.0
+        self._frame_time = 0.0  # When current frame was due
+        self.reset()
+
+    def reset(self):
+        """
+        Starts counting from now (after the loop has been paused or idle), without catching up.
+        First frame after reset gets one step.
+        """
+        self._lag = self.step_period
+        self._last_time = time.monotonic()
+        self._frame_time = self._last_time
+
+    def steps_due(self):
+        """
+        Accounts time passed since last call.
+
+        @return: number of simulation steps to run before rendering next frame
+        """
+        now = time.monotonic()
+        self._lag += now - self._last_time
+        self._last_time = now
+
+        steps = max(0, int(self._lag / self.step_period + GameClock.jitter_tolerance))
+        if steps > GameClock.max_catch_up:
+            self.dropped_steps += steps - GameClock.max_catch_up
+            steps = GameClock.max_catch_up
+            self._lag = steps * self.step_period  # Forget the time that could not be caught up
+        self._lag -= steps * self.step_period
+
+        self.steps += steps
+        self.max_steps_per_frame = max(self.max_steps_per_frame, steps)
+        return steps
+
+    @property
+    def alpha(self):
+        """
+        How far (0.0 ... 1.0) simulation time is between the last step and the next one. Used for interpolation.
+        """
+        return min(1.0, max(0.0, self._lag / self.step_period))
+
+    def frame_done(self):
+        """
+        Plans the next frame.
+
+        @return: time in seconds to sleep until the next frame
+        """
+        self.frames += 1
+        self._frame_time += self.frame_period
+        now = time.monotonic()
+        if now - self._frame_time >= self.frame_period:
+            # More than a frame late - skip frames that are already over instead of rendering them back to back
+            skipped = int((now - self._frame_time) / self.frame_period)
+            self.skipped_frames += skipped
+            self._frame_time += skipped * self.frame_period
+        return max(0.0, self._frame_time - now)
+
+    def deadline(self):
+        """
+        @return: time (time.time()) when the frame after the current one is due
+        """
+        return time.time() + max(0.0, self._frame_time + self.frame_period - time.monotonic())
+
+    def stats(self):
+        """
+        @return: dictionary of step and frame counters
+        """
+        return {
+            "steps": self.steps,
+            "frames": self.frames,
+            "skipped frames": self.skipped_frames,
+            "dropped steps": self.dropped_steps,
+            "max steps per frame": self.max_steps_per_frame
+        }
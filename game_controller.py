@@ -4,10 +4,14 @@ import logging
 
 from board_bus import BoardBus
 from matrix_controller import MatrixController
-from games import Animation, Breaker, CatchColors, CatchColorsMultiplayer, LogoBounce, Pong, TestPattern
+from show_file import ShowFile, ShowPlayer
+from games import Animation, Breaker, CatchColors, CatchColorsMultiplayer, LogoBounce, Pong, TestPattern, VideoPlayback
 
 
 class GameController:
+    show_file = "show.ledshow"  # Compiled show played in show mode (see compile_show.py)
+    video_file = "video.gif"  # Clip played in video mode (see games.VideoPlayback)
+
     @unique
     class Mode(Enum):
         test = 0
@@ -17,58 +21,92 @@ class GameController:
         logo = 4
         catch_colors = 5
         catch_colors_multiplayer = 6
+        show = 7
+        video = 8
 
     def __init__(self, matrix_controller):
         assert isinstance(matrix_controller, MatrixController)
         self.matrix_controller = matrix_controller
         self._call_on_game_change = list()
         self.current_mode = GameController.Mode.test
+        self._show_player = None
 
     def reset_game(self):
         self.set_game_mode(self.current_mode)
 
     def set_game_mode(self, mode):
+        # Show or game is opened first - if it can not be played, current one keeps running
+        try:
+            if mode == GameController.Mode.show:
+                # Compiled show is written to buses as it is - nothing is rendered
+                game = None
+                show = ShowFile(GameController.show_file)
+            else:
+                game = self.create_game(
+                    mode, self.matrix_controller.surface_dims, self.matrix_controller.dimensions,
+                    self.matrix_controller.board_buses
+                )
+        except (OSError, ValueError) as e:
+            logging.error("Unable to start {}, keeping {}. \n{}".format(mode, self.current_mode, e))
+            return
+
         self.current_mode = mode
         logging.info("Game set to {}".format(mode))
-        surface_dims = self.matrix_controller.surface_dims  # Floor dimensions in pixels
-        matrix_dims = self.matrix_controller.dimensions  # Floor dimensions in boards
-
-        if mode == GameController.Mode.test:
-            game = TestPattern(matrix_dims, BoardBus.board_assignment, self.matrix_controller.board_buses)
-
-        elif mode == GameController.Mode.pong:
-            game = Pong(surface_dims)
+        if self._show_player is not None:
+            # Buses may still hold the show for a queued frame - it is closed when the last of them lets go.
+            # Matrix controller publishes the first frame of the next game, that replaces the show on all boards.
+            self._show_player.stop()
+            self._show_player = None
+        if isinstance(self.matrix_controller.game, VideoPlayback):
+            self.matrix_controller.game.stop()  # Stops read-ahead thread
+        if mode == GameController.Mode.show:
+            self._show_player = ShowPlayer(show, self.matrix_controller.board_buses)
+
+        if mode == GameController.Mode.pong:
             self._add_pong_buttons(game)
-
         elif mode == GameController.Mode.breaker:
-            game = Breaker(surface_dims)
             self._add_breaker_buttons(game)
-
-        elif mode == GameController.Mode.animation:
-            game = Animation(BoardBus.board_assignment)
+        elif mode in (GameController.Mode.animation, GameController.Mode.catch_colors,
+                      GameController.Mode.catch_colors_multiplayer):
             self._add_all_buttons(game)
 
+        # notify all of change
+        for func in self._call_on_game_change:
+            func(mode)
+
+        self.matrix_controller.game = game
+        if self._show_player is not None:
+            self._show_player.start()
+
+    @staticmethod
+    def create_game(mode, surface_dims, matrix_dims, board_buses=()):
+        """
+        Creates game of given mode (without buttons).
+
+        @param surface_dims: floor dimensions in pixels
+        @param matrix_dims: floor dimensions in boards
+        @param board_buses: buses displaying the game (used by test pattern)
+        """
+        if mode == GameController.Mode.test:
+            return TestPattern(matrix_dims, BoardBus.board_assignment, board_buses)
+        elif mode == GameController.Mode.pong:
+            return Pong(surface_dims)
+        elif mode == GameController.Mode.breaker:
+            return Breaker(surface_dims)
+        elif mode == GameController.Mode.animation:
+            return Animation(BoardBus.board_assignment)
         elif mode == GameController.Mode.logo:
             with open("logo.png", "rb") as logo_image:
-                game = LogoBounce(surface_dims, logo_image)
-
+                return LogoBounce(surface_dims, logo_image)
         elif mode == GameController.Mode.catch_colors:
-            game = CatchColors(BoardBus.board_assignment)
-            self._add_all_buttons(game)
-
+            return CatchColors(BoardBus.board_assignment)
         elif mode == GameController.Mode.catch_colors_multiplayer:
-            game = CatchColorsMultiplayer(BoardBus.board_assignment, surface_dims)
-            self._add_all_buttons(game)
-
+            return CatchColorsMultiplayer(BoardBus.board_assignment, surface_dims)
+        elif mode == GameController.Mode.video:
+            return VideoPlayback(surface_dims, GameController.video_file)
         else:
             raise ValueError("Unknown game mode")
 
-        # notify all of change
-        for func in self._call_on_game_change:
-            func(mode)
-
-        self.matrix_controller.game = game
-
     def connect(self, event, function):
         if event == "game changed":
             self._call_on_game_change.append(function)
@@ -4,4 +4,5 @@ from .breaker import Breaker
 from .catch_colors import CatchColors, CatchColorsMultiplayer
 from .logo_bounce import LogoBounce
 from .pong import Pong
-from .test_pattern import TestPattern
\ No newline at end of file
+from .test_pattern import TestPattern
+from .video_playback import VideoPlayback
@@ -42,6 +42,7 @@ class Breaker(game.Game):
 
         self._state = Breaker.State.initialising
         self.invalidated_areas = []
+        self.dirty_areas = None  # Areas redrawn since last get_dirty_areas() (None - whole field)
         self.player = Player(Breaker.lives)
         self.paddle = Paddle(0, self.field_dims[1] - 4, speed=Breaker.init_paddle_speed)  # Paddle on the bottom
         self.balls = []
@@ -109,8 +110,15 @@ class Breaker(game.Game):
 
         for invalidated_area in self.invalidated_areas:
             self._draw(ctx, invalidated_area)
+        if self.dirty_areas is not None:
+            self.dirty_areas += self.invalidated_areas  # Rectangles have been grown to cover everything redrawn
         self.invalidated_areas = []
 
+    def get_dirty_areas(self):
+        dirty_areas = self.dirty_areas
+        self.dirty_areas = []
+        return dirty_areas
+
     def _draw(self, ctx, invalidated_rect):
         # ## DEBUG OPTIONS ###
         display_redraw = False
@@ -124,7 +132,7 @@ class Breaker(game.Game):
         while new_added:
             new_added = False
             for element in not_redrawn:
-                if invalidated_rect.intersection(element):
+                if invalidated_rect.intersects(element):
                     not_redrawn.remove(element)
                     redrawn.append(element)
                     invalidated_rect.union_ip(element)  # Grow invalidated rect
@@ -179,20 +187,13 @@ class Breaker(game.Game):
                 self._collide_ball_to_brick(ball, brick)
 
     def _collide_ball_to_brick(self, ball, brick):
-        intersection = brick.intersection(ball)
-        if intersection is not None:
-            if intersection.width > intersection.height:
+        if brick.intersects(ball):
+            if brick.overlap_width(ball) > brick.overlap_height(ball):
                 # bounce from top-or bottom
-                ball.speed_y = math.copysign(
-                    ball.speed_y,
-                    ball.center_y - brick.center_y
-                )
+                ball.vy = math.copysign(ball.vy, ball.center_y - brick.center_y)
             else:
                 # bounce from sides
-                ball.speed_x = math.copysign(
-                    ball.speed_x,
-                    ball.center_x - brick.center_x
-                )
+                ball.vx = math.copysign(ball.vx, ball.center_x - brick.center_x)
 
             self.bricks.remove(brick)
             if random.random() < Breaker.multi_ball_probability:
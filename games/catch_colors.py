@@ -222,6 +222,12 @@ class CatchColors(game.Game):
         if self._symbol is not None:
             self._symbol.draw(ctx)
 
+    def idle_until(self):
+        # After fading, symbol stays the same until it dies (or is pressed)
+        if self._symbol is None or self._symbol.age < FadingSymbol.change_period:
+            return None
+        return self._symbol.born + FadingSymbol.lifetime
+
     def _new_symbol(self):
         board_id, x, y = random.choice(self._board_assignment)
         self._symbol = FadingSymbol(center_x=x * 10 + 5, center_y=y * 10 + 5, board_id=board_id)
@@ -6,9 +6,47 @@ class Game:
     Abstract class for a game
     Game has to implement at least these methods
     """
+    # If True, draw() is called with a second argument - interpolation alpha (0.0 ... 1.0),
+    # how far render time is between the last simulation step and the next one
+    interpolates = False
+    # If True, draw_pixels() is called instead of draw() - game writes pixels straight into the frame buffer
+    draws_pixels = False
+    # If True, game uses Cairo features NumpyContext does not have (text...) and is drawn with Cairo on any backend
+    requires_cairo = False
 
     def step(self):
         raise NotImplementedError("Subclass must implement abstract method")
 
     def draw(self, context):
-        raise NotImplementedError("Subclass must implement abstract method")
\ No newline at end of file
+        raise NotImplementedError("Subclass must implement abstract method")
+
+    def draw_pixels(self, data, channel_order):
+        """
+        Draws without Cairo (games with draws_pixels = True).
+        Frame buffer holds the previous frame, so only changes have to be written.
+
+        @param data: numpy array (height, width, 4) of ARGB32 pixels (the frame buffer)
+        @param channel_order: index of red, green and blue byte in a pixel
+        """
+        raise NotImplementedError("Subclass must implement abstract method")
+
+    def get_dirty_areas(self):
+        """
+        Reports what part of the surface has changed since last call (in step and draw).
+        Games that draw only changed parts can override this, so only boards under these areas are compared and sent.
+
+        @return: list of rectangles (objects with left, top, width and height in pixels),
+            None if anything could have changed (full repaint)
+        """
+        return None
+
+    def idle_until(self):
+        """
+        Tells render loop that image will not change for a while, so it can stop stepping and drawing.
+        Game is asked again after that time (or earlier). Input (button callbacks) may change the game any time,
+        so after input the game has to return None again.
+
+        @return: time (time.time()) until which image stays the same unless input arrives (math.inf - until input),
+            None if game has to be stepped and drawn every frame
+        """
+        return None
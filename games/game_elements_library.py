@@ -6,6 +6,10 @@ from threading import Thread
 
 import cairocffi as cairo
 
+from games.physics import Rectangle, Circle, Moving, collide_to_left_wall, collide_to_right_wall, \
+    collide_to_top_wall, collide_to_bottom_wall
+from games.sprite_cache import sprites
+
 
 class Player:
     def __init__(self, max_hp=4):
@@ -24,143 +28,12 @@ class Player:
         return self.hp > 0
 
 
-class Rectangle():
-    def __init__(self, left, top, width, height):
-        super().__init__()
-        self.left = left
-        self.top = top
-        self.width = width
-        self.height = height
-
-    @property
-    def right(self):
-        return self.left + self.width
-
-    @right.setter
-    def right(self, value):
-        self.left = value - self.width
-
-    @property
-    def bottom(self):
-        return self.top + self.height
-
-    @bottom.setter
-    def bottom(self, value):
-        self.top = value - self.height
-
-    @property
-    def center_x(self):
-        return self.left + self.width / 2
-
-    @center_x.setter
-    def center_x(self, value):
-        self.left = value - self.width / 2
-
-    @property
-    def center_y(self):
-        return self.top + self.height / 2
-
-    @center_y.setter
-    def center_y(self, value):
-        self.top = value - self.height / 2
-
-    def intersects(self, other):
-        return not (
-            self.bottom <= other.top or
-            self.top >= other.bottom or
-            self.left >= other.right or
-            self.right <= other.left
-        )
-
-    def intersection(self, other):
-        """
-        :param other: Other rectangle
-        :return: new rectangle with the size of the intersection
-        if elements do not intersect - None
-        """
-        if self.intersects(other):
-            left = max(self.left, other.left)
-            right = min(self.right, other.right)
-            bottom = min(self.bottom, other.bottom)
-            top = max(self.top, other.top)
-            width = right - left
-            height = bottom - top
-            return Rectangle(left, top, width, height)
-        else:
-            return None
-
-    def union(self, other):
-        """
-        :param other: Other rectangle
-        :return: new rectangle that completely covers both rectangles
-        """
-        left, top, width, height = self._union(other)
-        return Rectangle(left, top, width, height)
-
-    def union_ip(self, other):
-        """
-        Grows self so it covers the other rectangle too
-        :param other: Other rectangle
-        """
-        self.left, self.top, self.width, self.height = self._union(other)
-
-    def _union(self, other):
-        left = min(self.left, other.left)
-        right = max(self.right, other.right)
-        bottom = max(self.bottom, other.bottom)
-        top = min(self.top, other.top)
-        width = right - left
-        height = bottom - top
-        return left, top, width, height
-
-
-class Circle():
-    def __init__(self, center_x, center_y, radius):
-        super().__init__()
-        self.center_x = center_x
-        self.center_y = center_y
-        self.radius = radius
-
-    @property
-    def left(self):
-        return self.center_x - self.radius
-
-    @left.setter
-    def left(self, value):
-        self.center_x = value + self.radius
-
-    @property
-    def right(self):
-        return self.center_x + self.radius
-
-    @right.setter
-    def right(self, value):
-        self.center_x = value - self.radius
-
-    @property
-    def top(self):
-        return self.center_y - self.radius
-
-    @top.setter
-    def top(self, value):
-        self.center_y = value + self.radius
-
-    @property
-    def bottom(self):
-        return self.center_y + self.radius
-
-    @bottom.setter
-    def bottom(self, value):
-        self.center_y = value - self.radius
-
-    @property
-    def bounding_box(self):
-        return Rectangle(self.left, self.top, self.radius * 2, self.radius * 2)
-
-
 class Brick(Rectangle):
+    __slots__ = ("colors", "patterns", "broken")
+
     def __init__(self, x, y, width, height, colors):
         super().__init__(x, y, width, height)
+        self.colors = tuple(tuple(color) for color in colors)
         self.patterns = []
         self.patterns.append(cairo.SolidPattern(*colors[0]))
         self.patterns.append(cairo.SolidPattern(*colors[1]))
@@ -168,64 +41,48 @@ class Brick(Rectangle):
 
     def draw(self, ctx):
         if not self.broken:
-            ctx.rectangle(self.left + 0.5, self.top + 0.5, self.width - 1, self.height - 1)
-            ctx.set_source(self.patterns[1])
-            ctx.fill_preserve()
-            ctx.set_source(self.patterns[0])
-            ctx.set_line_width(1)
-            ctx.stroke()
-
-
-class Moving():
-    def __init__(self):
-        self.speed = 0
-        self.heading = 0
-
-    @property
-    def speed_x(self):
-        return self.speed * math.cos(self.heading)
-
-    @speed_x.setter
-    def speed_x(self, x_speed):
-        self.speed = (x_speed ** 2 + self.speed_y ** 2) ** 0.5
-        self.heading = math.atan2(self.speed_y, x_speed)
-
-    @property
-    def speed_y(self):
-        return self.speed * math.sin(self.heading)
+            key = Brick, self.width, self.height, self.colors
+            sprites.draw(ctx, key, self.left, self.top, self.width, self.height, self._render)
 
-    @speed_y.setter
-    def speed_y(self, y_speed):
-        self.speed = (y_speed ** 2 + self.speed_x ** 2) ** 0.5
-        self.heading = math.atan2(y_speed, self.speed_x)
+    def _render(self, ctx, left, top):
+        ctx.rectangle(left + 0.5, top + 0.5, self.width - 1, self.height - 1)
+        ctx.set_source(self.patterns[1])
+        ctx.fill_preserve()
+        ctx.set_source(self.patterns[0])
+        ctx.set_line_width(1)
+        ctx.stroke()
 
 
 class Ball(Circle, Moving):
+    __slots__ = ("vx", "vy", "colors", "stroke_pattern", "fill_pattern")
     # Default values (prior loading config file)
     stroke_color = (0, 0, 1, 1)
     fill_color = (0, 0, 0, 1)
-    radius = 1.5
+    default_radius = 1.5
 
     def __init__(self, center_x, center_y, speed, heading):
-        super().__init__(center_x, center_y, Ball.radius)
-        self.speed = speed
-        self.heading = heading
+        super().__init__(center_x, center_y, Ball.default_radius)
+        self.set_velocity(speed, heading)
 
+        self.colors = tuple(Ball.stroke_color), tuple(Ball.fill_color)
         self.stroke_pattern = cairo.SolidPattern(*Ball.stroke_color)
         self.fill_pattern = cairo.SolidPattern(*Ball.fill_color)
 
     def step(self):
-        last_bounding_box = self.bounding_box
-
-        self.center_x += self.speed_x
-        self.center_y += self.speed_y
-
-        new_bounding_box = self.bounding_box
-        dirty_area = last_bounding_box.union(new_bounding_box)
+        """
+        :return: dirty area - rectangle covering the ball before and after the step
+        """
+        dirty_area = self.swept_box(self.vx, self.vy)
+        self.center_x += self.vx
+        self.center_y += self.vy
         return dirty_area
 
     def draw(self, cairo_context):
-        cairo_context.arc(self.center_x, self.center_y, self.radius - 0.5, 0, 2 * math.pi)
+        size = self.radius * 2
+        sprites.draw(cairo_context, (Ball, self.radius, self.colors), self.left, self.top, size, size, self._render)
+
+    def _render(self, cairo_context, left, top):
+        cairo_context.arc(left + self.radius, top + self.radius, self.radius - 0.5, 0, 2 * math.pi)
         cairo_context.set_line_width(1)
         cairo_context.set_source(self.fill_pattern)
         cairo_context.fill_preserve()
@@ -234,13 +91,14 @@ class Ball(Circle, Moving):
 
 
 class Paddle(Rectangle):
-    width = 24
-    height = 4
+    __slots__ = ("speed", "flipped", "gradient_pos", "target_position", "invalidated_area")
+    default_width = 24
+    default_height = 4
     stroke_color = [(0, 1, 0, 1), (1, 0, 0, 1)]
     fill_color = [(0, 1, 0, 1), (1, 0, 0, 1)]
 
     def __init__(self, left, top, speed=1, flipped=False):
-        super().__init__(left, top, Paddle.width, Paddle.height)
+        super().__init__(left, top, Paddle.default_width, Paddle.default_height)
         self.speed = speed
         self.flipped = flipped  # flips the paddle up/down
         self.gradient_pos = 0  # position of the gradient line on the paddle
@@ -303,12 +161,13 @@ class Paddle(Rectangle):
         # calculate difference between current and target position
         delta = self.target_position - self.center_x
         if abs(delta) > 0:
-            last_bounding_box = self.bounding_box
             # move accordingly (limited by speed)
-            self.center_x += clamp(delta, -self.speed, self.speed)
-            new_bounding_box = self.bounding_box
-            invalidated_area = last_bounding_box.union(new_bounding_box)
-            self._invalidate_rect(invalidated_area)
+            movement = clamp(delta, -self.speed, self.speed)
+            # Area covered before and after the move
+            self._invalidate_rect(
+                Rectangle(self.left + min(movement, 0), self.top, self.width + abs(movement), self.height)
+            )
+            self.left += movement
 
     def _invalidate_rect(self, rect):
         if self.invalidated_area is None:
@@ -332,21 +191,29 @@ class Paddle(Rectangle):
             self.target_position = self.center_x
 
     def draw(self, cr):
+        key = (
+            Paddle, self.width, self.height, self.flipped, self.gradient_pos,
+            tuple(map(tuple, Paddle.fill_color)), tuple(map(tuple, Paddle.stroke_color))
+        )
+        sprites.draw(cr, key, self.left, self.top, self.width, self.height, self._render)
+
+    def _render(self, cr, left, top):
+        right = left + self.width
         # Calculate Path
-        y = self.center_y
+        y = top + self.height / 2
         r = self.height / 2 - 0.5
-        x = self.left + self.height / 2
+        x = left + self.height / 2
         cr.arc(x, y, r, math.pi / 2, -math.pi / 2)
-        x = self.right - self.height / 2
+        x = right - self.height / 2
         cr.arc(x, y, r, -math.pi / 2, math.pi / 2)
         cr.close_path()
 
         # Fill
         # Gradient background
         if self.flipped:
-            pat = cairo.LinearGradient(self.right + 1, 0.0, self.left - 1, 0)
+            pat = cairo.LinearGradient(right + 1, 0.0, left - 1, 0)
         else:
-            pat = cairo.LinearGradient(self.left - 1, 0.0, self.right + 1, 0)
+            pat = cairo.LinearGradient(left - 1, 0.0, right + 1, 0)
 
         pat.add_color_stop_rgba(self.gradient_pos, *Paddle.fill_color[1])
         pat.add_color_stop_rgba(self.gradient_pos, *Paddle.fill_color[0])
@@ -356,9 +223,9 @@ class Paddle(Rectangle):
 
         # Stroke
         if self.flipped:
-            pat = cairo.LinearGradient(self.right + 1, 0.0, self.left - 1, 0)
+            pat = cairo.LinearGradient(right + 1, 0.0, left - 1, 0)
         else:
-            pat = cairo.LinearGradient(self.left - 1, 0.0, self.right + 1, 0)
+            pat = cairo.LinearGradient(left - 1, 0.0, right + 1, 0)
 
         pat.add_color_stop_rgba(self.gradient_pos, *Paddle.stroke_color[1])
         pat.add_color_stop_rgba(self.gradient_pos, *Paddle.stroke_color[0])
@@ -384,7 +251,7 @@ def collide_ball_to_paddle(ball, paddle):
     assert (isinstance(paddle, Paddle))
     assert (isinstance(ball, Ball))
     heading_delta = 0.1  # change of heading of the ball on hitting edges of the paddle
-    if paddle.intersection(ball):
+    if paddle.intersects(ball):
         # put ball back on the board
         if paddle.flipped:
             ball.top = paddle.bottom
@@ -392,34 +259,10 @@ def collide_ball_to_paddle(ball, paddle):
             ball.bottom = paddle.top
 
         direction = 1 if paddle.flipped else -1
-        ball.speed_y = (direction * abs(ball.speed_y))
+        ball.vy = direction * abs(ball.vy)
 
         if ball.center_x < (paddle.left + paddle.width / 4):
             ball.heading += direction * heading_delta
 
         elif (paddle.right - paddle.width / 4) < ball.center_x:
             ball.heading += direction * -heading_delta
-
-
-def collide_to_left_wall(obj):
-    if obj.left <= 0:
-        obj.speed_x = abs(obj.speed_x)
-        obj.left = 0 - obj.left
-
-
-def collide_to_right_wall(obj, limit):
-    if obj.right >= limit:
-        obj.speed_x = -abs(obj.speed_x)
-        obj.right = 2 * limit - obj.right
-
-
-def collide_to_top_wall(obj):
-    if obj.top <= 0:
-        obj.speed_y = abs(obj.speed_y)
-        obj.top = 0 - obj.top
-
-
-def collide_to_bottom_wall(obj, limit):
-    if obj.bottom >= limit:
-        obj.speed_y = -abs(obj.speed_y)
-        obj.bottom = 2 * limit - obj.bottom
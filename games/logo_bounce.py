@@ -34,8 +34,7 @@ class Logo(Rectangle, Moving):
     def __init__(self, image, left, top, width, height, speed, heading):
         self.logo_surface = cairo.ImageSurface.create_from_png(image)
         super().__init__(left, top, width, height)
-        self.speed = speed
-        self.heading = heading
+        self.set_velocity(speed, heading)
 
         # calculate proportional scaling
         width_ratio = float(self.width) / float(self.logo_surface.get_width())
@@ -43,11 +42,9 @@ class Logo(Rectangle, Moving):
         self.scale_xy = min(height_ratio, width_ratio)
 
     def step(self):
-        self.center_x += self.speed_x
-        self.center_y += self.speed_y
+        self.move()
 
     def draw(self, ctx):
-        assert(isinstance(ctx, cairo.Context))
         # scale image and add it
         ctx.save()
         ctx.translate(self.left, self.top)
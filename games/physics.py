@@ -0,0 +1,225 @@
+__author__ = 'Mark Laane'
+
+import math
+
+
+class Rectangle():
+    __slots__ = ("left", "top", "width", "height")
+
+    def __init__(self, left, top, width, height):
+        super().__init__()
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+
+    @property
+    def right(self):
+        return self.left + self.width
+
+    @right.setter
+    def right(self, value):
+        self.left = value - self.width
+
+    @property
+    def bottom(self):
+        return self.top + self.height
+
+    @bottom.setter
+    def bottom(self, value):
+        self.top = value - self.height
+
+    @property
+    def center_x(self):
+        return self.left + self.width / 2
+
+    @center_x.setter
+    def center_x(self, value):
+        self.left = value - self.width / 2
+
+    @property
+    def center_y(self):
+        return self.top + self.height / 2
+
+    @center_y.setter
+    def center_y(self, value):
+        self.top = value - self.height / 2
+
+    def intersects(self, other):
+        """
+        :param other: Rectangle or Circle (bounding box of the circle is used)
+        """
+        return not (
+            self.top + self.height <= other.top or
+            self.top >= other.bottom or
+            self.left >= other.right or
+            self.left + self.width <= other.left
+        )
+
+    def overlap_width(self, other):
+        """
+        :return: width of the intersection, 0 or less if elements do not intersect
+        """
+        return min(self.left + self.width, other.right) - max(self.left, other.left)
+
+    def overlap_height(self, other):
+        """
+        :return: height of the intersection, 0 or less if elements do not intersect
+        """
+        return min(self.top + self.height, other.bottom) - max(self.top, other.top)
+
+    def intersection(self, other):
+        """
+        :param other: Other rectangle
+        :return: new rectangle with the size of the intersection
+        if elements do not intersect - None
+        """
+        if self.intersects(other):
+            left = max(self.left, other.left)
+            top = max(self.top, other.top)
+            return Rectangle(left, top, self.overlap_width(other), self.overlap_height(other))
+        else:
+            return None
+
+    def union(self, other):
+        """
+        :param other: Other rectangle
+        :return: new rectangle that completely covers both rectangles
+        """
+        left, top, width, height = self._union(other)
+        return Rectangle(left, top, width, height)
+
+    def union_ip(self, other):
+        """
+        Grows self so it covers the other rectangle too
+        :param other: Other rectangle
+        """
+        self.left, self.top, self.width, self.height = self._union(other)
+
+    def _union(self, other):
+        left = min(self.left, other.left)
+        right = max(self.left + self.width, other.right)
+        bottom = max(self.top + self.height, other.bottom)
+        top = min(self.top, other.top)
+        return left, top, right - left, bottom - top
+
+
+class Circle():
+    __slots__ = ("center_x", "center_y", "radius")
+
+    def __init__(self, center_x, center_y, radius):
+        super().__init__()
+        self.center_x = center_x
+        self.center_y = center_y
+        self.radius = radius
+
+    @property
+    def left(self):
+        return self.center_x - self.radius
+
+    @left.setter
+    def left(self, value):
+        self.center_x = value + self.radius
+
+    @property
+    def right(self):
+        return self.center_x + self.radius
+
+    @right.setter
+    def right(self, value):
+        self.center_x = value - self.radius
+
+    @property
+    def top(self):
+        return self.center_y - self.radius
+
+    @top.setter
+    def top(self, value):
+        self.center_y = value + self.radius
+
+    @property
+    def bottom(self):
+        return self.center_y + self.radius
+
+    @bottom.setter
+    def bottom(self, value):
+        self.center_y = value - self.radius
+
+    @property
+    def bounding_box(self):
+        return Rectangle(self.left, self.top, self.radius * 2, self.radius * 2)
+
+    def swept_box(self, dx, dy):
+        """
+        :return: new rectangle covering the circle before and after moving it by (dx, dy) - bounding boxes and union
+        in one allocation
+        """
+        diameter = self.radius * 2
+        return Rectangle(self.center_x - self.radius + min(dx, 0), self.center_y - self.radius + min(dy, 0),
+                         diameter + abs(dx), diameter + abs(dy))
+
+
+class Moving():
+    """
+    Velocity of an element (pixels per step), stored as vx and vy. Speed and heading are calculated when asked.
+    Classes using it have to have vx and vy slots (or no slots at all).
+    """
+    __slots__ = ()
+
+    def __init__(self):
+        super().__init__()
+        self.vx = 0.0
+        self.vy = 0.0
+
+    def set_velocity(self, speed, heading):
+        self.vx = speed * math.cos(heading)
+        self.vy = speed * math.sin(heading)
+
+    @property
+    def speed(self):
+        return math.hypot(self.vx, self.vy)
+
+    @speed.setter
+    def speed(self, speed):
+        current_speed = math.hypot(self.vx, self.vy)
+        if current_speed == 0:
+            self.vx, self.vy = speed, 0.0  # No direction - heading 0
+        else:
+            self.vx *= speed / current_speed
+            self.vy *= speed / current_speed
+
+    @property
+    def heading(self):
+        return math.atan2(self.vy, self.vx)
+
+    @heading.setter
+    def heading(self, heading):
+        self.set_velocity(math.hypot(self.vx, self.vy), heading)
+
+    def move(self):
+        self.center_x += self.vx
+        self.center_y += self.vy
+
+
+def collide_to_left_wall(obj):
+    if obj.left <= 0:
+        obj.vx = abs(obj.vx)
+        obj.left = 0 - obj.left
+
+
+def collide_to_right_wall(obj, limit):
+    if obj.right >= limit:
+        obj.vx = -abs(obj.vx)
+        obj.right = 2 * limit - obj.right
+
+
+def collide_to_top_wall(obj):
+    if obj.top <= 0:
+        obj.vy = abs(obj.vy)
+        obj.top = 0 - obj.top
+
+
+def collide_to_bottom_wall(obj, limit):
+    if obj.bottom >= limit:
+        obj.vy = -abs(obj.vy)
+        obj.bottom = 2 * limit - obj.bottom
@@ -0,0 +1,99 @@
+__author__ = 'Mark Laane'
+
+import math
+from collections import OrderedDict
+
+import cairocffi as cairo
+
+from numpy_context import NumpyContext, NumpySurface
+
+
+class SpriteCache():
+    """
+    Bounded LRU cache of pre-rasterized game elements.
+
+    Element is rendered once into a small ImageSurface per key (shape, size, colors... and sub-pixel phase of it's
+    position) and then only blitted onto the frame with set_source_surface. Positions are snapped to
+    1 / phase_steps of a pixel, so a moving element needs at most phase_steps ** 2 sprites.
+    Result is the same as drawing the element straight onto the frame (at the snapped position).
+    """
+    max_size = 256  # Number of sprites kept, 0 disables the cache (elements are drawn every time)
+    phase_steps = 4  # Sub-pixel positions per pixel
+    margin = 1  # Transparent pixels around element (antialiasing)
+
+    def __init__(self):
+        self._sprites = OrderedDict()  # key -> ImageSurface
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._sprites)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def draw(self, ctx, key, left, top, width, height, render):
+        """
+        Draws element at given position, from cache if possible.
+
+        @param ctx: Cairo context of the frame
+        @param key: hashable description of everything that changes element's look (except position)
+        @param left, top, width, height: bounding box of the element
+        @param render: function(context, left, top) drawing the element with it's bounding box at (left, top)
+        """
+        if SpriteCache.max_size <= 0:
+            render(ctx, left, top)
+            return
+
+        steps = SpriteCache.phase_steps
+        left = round(left * steps) / steps
+        top = round(top * steps) / steps
+        pixel_x = math.floor(left)
+        pixel_y = math.floor(top)
+        key = key, type(ctx), left - pixel_x, top - pixel_y  # Sprites are surfaces of the backend drawn on
+
+        sprite = self._sprites.get(key)
+        if sprite is None:
+            self.misses += 1
+            sprite = self._render(ctx, render, left - pixel_x, top - pixel_y, width, height)
+            self._sprites[key] = sprite
+            while len(self._sprites) > SpriteCache.max_size:
+                self._sprites.popitem(last=False)
+                self.evictions += 1
+        else:
+            self.hits += 1
+            self._sprites.move_to_end(key)
+
+        margin = SpriteCache.margin
+        ctx.set_source_surface(sprite, pixel_x - margin, pixel_y - margin)
+        ctx.rectangle(pixel_x - margin, pixel_y - margin, sprite.get_width(), sprite.get_height())
+        ctx.fill()
+
+    @staticmethod
+    def _render(ctx, render, phase_x, phase_y, width, height):
+        """
+        @return: new sprite, rendered with the same backend as ctx
+        """
+        margin = SpriteCache.margin
+        size = math.ceil(phase_x + width) + 2 * margin, math.ceil(phase_y + height) + 2 * margin
+        if isinstance(ctx, NumpyContext):
+            sprite = NumpySurface.create(*size)
+            render(NumpyContext(sprite), margin + phase_x, margin + phase_y)
+            return sprite
+        sprite = cairo.ImageSurface(cairo.FORMAT_ARGB32, *size)
+        render(cairo.Context(sprite), margin + phase_x, margin + phase_y)
+        sprite.flush()
+        return sprite
+
+    def clear(self):
+        self._sprites.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+# Shared by all game elements
+sprites = SpriteCache()
@@ -1,11 +1,15 @@
 __author__ = 'Mark'
 
+import math
+
 import cairocffi as cairo
 
 from games import game
 
 
 class TestPattern(game.Game):
+    requires_cairo = True  # Board ids are drawn as text
+
     def __init__(self, matrix_dims, board_assignments, board_buses):
         self.board_assignments = board_assignments
         self.board_buses = board_buses
@@ -22,11 +26,23 @@ class TestPattern(game.Game):
             self.disconnected_pat.add_color_stop_rgba((i + 1) / matrix_dims[1], 0, 0, 0.4, 1)
 
         self.font_pat = cairo.SolidPattern(0.8, 0.8, 0.8, alpha=1.0)
+        self._drawn_boards = None  # Positions of connected boards last drawn
 
     def step(self):
         pass
 
+    def idle_until(self):
+        # Pattern changes only when boards get connected or disconnected
+        if self._drawn_boards == self._connected_boards():
+            return math.inf
+        return None
+
+    def _connected_boards(self):
+        return frozenset((board.column, board.row) for bus in self.board_buses for board in list(bus.boards))
+
     def draw(self, ctx):
+        self._drawn_boards = self._connected_boards()
+
         # Clear
         ctx.set_source_rgb(0, 0, 0)
         ctx.paint()
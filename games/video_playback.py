@@ -0,0 +1,237 @@
+__author__ = 'Mark Laane'
+
+import glob
+import logging
+import math
+import queue
+import threading
+import time
+
+import numpy
+from PIL import Image, ImageSequence
+
+from games import game
+
+
+class RawVideoSource():
+    """
+    Frames of a raw RGB file (width * height * 3 bytes per frame, rows top to bottom), read one at a time.
+    """
+
+    def __init__(self, path, width, height, fps):
+        self.path = path
+        self.shape = height, width, 3
+        self.frame_duration = 1.0 / fps
+
+    def frames(self):
+        """
+        @return: iterator of (RGB numpy array (height, width, 3), duration in seconds)
+        """
+        frame = numpy.empty(self.shape, dtype=numpy.uint8)
+        with open(self.path, "rb") as file:
+            while file.readinto(frame) == frame.nbytes:
+                yield frame, self.frame_duration
+
+
+class ImageSequenceSource():
+    """
+    Frames of image files (PNG, GIF...) matching a glob pattern, in order of file names.
+    """
+
+    def __init__(self, pattern, fps):
+        self.paths = sorted(glob.glob(pattern))
+        if not self.paths:
+            raise ValueError("No images found with '{}'".format(pattern))
+        self.frame_duration = 1.0 / fps
+
+    def frames(self):
+        for path in self.paths:
+            with Image.open(path) as image:
+                yield numpy.asarray(image.convert("RGB")), self.frame_duration
+
+
+class AnimatedImageSource():
+    """
+    Frames of an animated image (GIF, APNG, WebP...), decoded one at a time. Still image is one frame.
+    """
+    default_duration = 0.1  # Seconds, if image does not tell frame duration
+
+    def __init__(self, path):
+        self.path = path
+
+    def frames(self):
+        with Image.open(self.path) as image:
+            for frame in ImageSequence.Iterator(image):
+                duration = frame.info.get("duration") or AnimatedImageSource.default_duration * 1000
+                yield numpy.asarray(frame.convert("RGB")), duration / 1000
+
+
+class ReadAhead():
+    """
+    Decodes frames of a source in a background thread into a bounded ring of preallocated buffers.
+    Frames are scaled to output size on the way (nearest neighbour, index maps are calculated from the first frame).
+    Memory use does not depend on length of the clip.
+    """
+
+    def __init__(self, source, size, buffers=8, loop=True):
+        """
+        @param source: object with frames() method (see RawVideoSource)
+        @param size: (width, height) of output frames
+        @param buffers: number of frame buffers (frames decoded ahead + the one displayed)
+        """
+        self.source = source
+        self.loop = loop
+        self.size = size
+        width, height = size
+        self._free = queue.Queue()
+        for _ in range(buffers):
+            self._free.put(numpy.empty((height, width, 3), dtype=numpy.uint8))
+        self._ready = queue.Queue()  # (buffer, duration), None at the end of the clip
+        self._scale_shape = None
+        self._rows = self._columns = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="Video ReadAhead", daemon=True)
+        self._thread.start()
+
+    def get(self, wait=False):
+        """
+        @param wait: wait until next frame is decoded
+        @return: next (frame buffer, duration), None if no frame is ready yet. Raises EOFError at the end of the clip.
+        """
+        try:
+            item = self._ready.get(block=wait)
+        except queue.Empty:
+            return None
+        if item is None:
+            raise EOFError("End of clip")
+        return item
+
+    def release(self, buffer):
+        """
+        Gives buffer back for decoding (when it's frame is not displayed anymore)
+        """
+        self._free.put(buffer)
+
+    def stop(self):
+        self._stop.set()
+        self._free.put(None)  # Wakes up the thread if it waits for a buffer
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                n_frames = 0
+                for frame, duration in self.source.frames():
+                    buffer = self._free.get()
+                    if buffer is None or self._stop.is_set():
+                        return
+                    self._scale(frame, buffer)
+                    self._ready.put((buffer, duration))
+                    n_frames += 1
+                if n_frames == 0:
+                    raise ValueError("Clip has no frames")  # Looping would only keep reopening it
+                if not self.loop:
+                    break
+        except (OSError, ValueError) as e:
+            logging.error("Reading video failed: {}".format(e))
+        finally:
+            self._ready.put(None)
+
+    def _scale(self, frame, output):
+        if frame.shape[:2] == output.shape[:2]:
+            numpy.copyto(output, frame)
+            return
+        if frame.shape != self._scale_shape:
+            height, width = output.shape[:2]
+            self._rows = (numpy.arange(height) * frame.shape[0] // height).reshape(-1, 1)
+            self._columns = numpy.arange(width) * frame.shape[1] // width
+            self._scale_shape = frame.shape
+        numpy.take(frame.reshape(-1, 3), self._rows * frame.shape[1] + self._columns, axis=0, out=output)
+
+
+class VideoPlayback(game.Game):
+    """
+    Plays a clip (raw RGB file, sequence of images or animated image) at it's own frame rate.
+    Frames are written straight into the frame buffer (see draw_pixels), Cairo is not used.
+
+    Clip follows the wall clock, or game time if step_period is given - every step() advances it by step_period
+    and waits until frame is decoded (compiling a show steps faster than real time).
+    """
+    draws_pixels = True
+    read_ahead_frames = 8  # Number of decoded frames kept ready
+    raw_size = 40, 40  # (width, height) of raw RGB files
+    fps = 25  # Frame rate of raw files and image sequences
+    loop = True
+
+    def __init__(self, field_dims, path, step_period=None):
+        """
+        @param field_dims: (width, height) of the floor in pixels
+        @param path: raw RGB file (.rgb, .raw), glob pattern of images or animated image
+        @param step_period: game time (seconds) of one step, None - clip follows the wall clock
+        """
+        self.read_ahead = ReadAhead(
+            self.open_source(path), field_dims, VideoPlayback.read_ahead_frames + 1, VideoPlayback.loop
+        )
+        self.underruns = 0  # Frames that were due but not decoded in time
+        self._frame = None  # Frame being displayed
+        self._frame_number = 0  # Number of frames taken from read-ahead (buffers are reused, so they are counted)
+        self._drawn = 0  # Number of the frame last written to frame buffer
+        self.step_period = step_period
+        self._steps = 0
+        self._next_frame_time = time.time() if step_period is None else 0.0
+        self._ended = False
+
+    @staticmethod
+    def open_source(path):
+        if path.lower().endswith((".rgb", ".raw")):
+            width, height = VideoPlayback.raw_size
+            return RawVideoSource(path, width, height, VideoPlayback.fps)
+        if glob.has_magic(path):
+            return ImageSequenceSource(path, VideoPlayback.fps)
+        return AnimatedImageSource(path)
+
+    def step(self):
+        if self.step_period is None:
+            now = time.time()
+        else:
+            # First step is at time 0. Frame is taken by the step nearest to it's time (sums of durations are inexact)
+            now = (self._steps + 0.5) * self.step_period
+            self._steps += 1
+        while not self._ended and now >= self._next_frame_time:
+            try:
+                item = self.read_ahead.get(wait=self.step_period is not None)
+            except EOFError:
+                self._ended = True
+                break
+            if item is None:
+                self.underruns += 1
+                break
+            buffer, duration = item
+            if self._frame is not None:
+                self.read_ahead.release(self._frame)
+            self._frame = buffer
+            self._frame_number += 1
+            # Timeline is kept even if frames come late (catching up skips frames)
+            self._next_frame_time = max(self._next_frame_time + duration, now - 1.0)
+
+    def draw(self, context):
+        raise NotImplementedError("VideoPlayback draws pixels (see draw_pixels)")
+
+    def draw_pixels(self, data, channel_order):
+        if self._drawn == self._frame_number:
+            return  # Frame buffer already holds this frame
+        data[..., list(channel_order)] = self._frame
+        alpha = ({0, 1, 2, 3} - set(channel_order)).pop()
+        data[..., alpha] = 255
+        self._drawn = self._frame_number
+
+    def idle_until(self):
+        if self._drawn != self._frame_number:
+            return None  # New frame has to be drawn
+        if self._ended:
+            return math.inf
+        if self.step_period is not None:
+            return None  # Frames are due in game time
+        return self._next_frame_time
+
+    def stop(self):
+        self.read_ahead.stop()
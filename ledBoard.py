@@ -7,6 +7,7 @@ import numpy
 
 
 BROADCAST_ADDRESS = 255
+COMMAND_OVERHEAD = 4  # Bytes sent with every command in addition to data: start mark, id, command code, stop mark
 
 
 class Board:
@@ -41,6 +42,7 @@ class Board:
         self.column = column
         self.row = row
         self.sensor_value = -1
+        self.sequence_number = None  # Order of board's response slot on the bus
         self.data_currently_displayed = None
 
     # TODO: move some of those commands to BroadcastBoard
@@ -82,6 +84,7 @@ class Board:
         encoded_sequence_number = [(sequence_number & 0b00111111) + 64, ((sequence_number >> 6) & 0b00111111) + 64]
 
         self._send_command(Board.Command.offer_sequence_number, bytearray(encoded_sequence_number))
+        self.sequence_number = sequence_number
         logging.debug("Assigned board id={} sequence number {}".format(self.id, sequence_number))
 
     def ping(self):
@@ -114,9 +117,17 @@ class Board:
                 return False
 
         encoded_data = self.led_encoder(new_data)
-        self._send_command(Board.Command.send_led_data, encoded_data)
+        self.send_led_data(encoded_data)
         return True
 
+    def send_led_data(self, encoded_data):
+        """
+        Sends already encoded data to be displayed on board's LED's
+
+        @param encoded_data: bytes produced by led_encoder (or FrameEncoder)
+        """
+        self._send_command(Board.Command.send_led_data, encoded_data)
+
     def read_sensor(self):
         """
         Sends out command for board to answer with it's sensor value
@@ -133,22 +144,35 @@ class Board:
     def _send_command(self, command, data=None):
         """
         Sends command with board's ID and command code.
-        Encloses command  with start and stop marks, so it is easy to filter echo.
 
         Args:
             command: command to send
             data: data to send with command
         """
-        output = bytearray([ord("<")])
+        self.serial_connection.write(self.encode_command(command, data))
+
+    def encode_command(self, command, data=None, output=None):
+        """
+        Encodes command with board's ID and command code.
+        Encloses command  with start and stop marks, so it is easy to filter echo.
 
-        output += bytearray([self.id])
+        Args:
+            command: command to encode
+            data: data to send with command
+            output: bytearray to append the command to (new bytearray is created if None)
+        Returns:
+            bytearray with the command appended
+        """
+        if output is None:
+            output = bytearray()
+        assert isinstance(command, Board.Command)
+        output.append(ord("<"))
+        output.append(self.id)
         if data is not None:
             output += data
-        assert isinstance(command, Board.Command)
-        output += bytearray([command.value])
-
-        output += bytearray([ord(">")])
-        self.serial_connection.write(output)
+        output.append(command.value)
+        output.append(ord(">"))
+        return output
 
     def set_sensor_value(self, value):
         """
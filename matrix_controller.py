@@ -1,6 +1,8 @@
 __author__ = 'Mark Laane'
 
 import logging
+import math
+import sys
 import threading
 import time
 
@@ -8,40 +10,80 @@ import serial
 import numpy
 import cairocffi as cairo
 
-from board_bus import BoardBus
+from board_bus import BoardBus, open_port
+from bus_process import BusProcess, SharedFrame
 from fpsManager import FpsManager
-from timer import Timer
+from frame_exchange import FrameExchange
+from game_clock import GameClock
+from numpy_context import NumpyContext, NumpySurface
+from timer import Timer, StageTimer
 
 
 class MatrixController:
-    data_update_FPS = 25
+    data_update_FPS = 25  # Rendered frames per second
+    simulation_FPS = None  # Game steps per second (None - same as data_update_FPS)
     sensor_update_FPS = 25
     serial_ports = []  # List of serial port identifiers
 
     dimensions = 10, 10  # Number of boards in X and Y axis
+    max_idle_sleep = 0.5  # Longest time (seconds) render loop sleeps while game is idle (game is asked again after)
+    bus_processes = False  # Run every bus in it's own worker process (see BusProcess)
+    bus_class = BoardBus  # Bus implementation (BoardBus - threads of it's own, AsyncBoardBus - shared event loop)
+    render_backend = "cairo"  # Games draw with "cairo" or "numpy" (NumpyContext, games with requires_cairo use Cairo)
+
+    # Index of red, green and blue byte in a pixel of Cairo ARGB32 surface (pixel is a native endian 32-bit integer)
+    channel_order = (2, 1, 0) if sys.byteorder == "little" else (1, 2, 3)
 
     def __init__(self):
         self.data_update_callback = None
-        self.game = None
+        self._game = None
+        self._wake_up = threading.Event()  # Interrupts render loop sleep (game change, stop)
         # TODO - bug here if dims don't match
         self.surface_dims = MatrixController.dimensions[0] * 10, MatrixController.dimensions[1] * 10
         self.fps = dict(Game=FpsManager(), Sensor=FpsManager())
+        self.idle_frames = 0  # Frames not rendered because game was idle
+        self.identical_frames = 0  # Rendered frames not sent because they were identical to the previous one
+        self.clock = None  # GameClock of the render loop (steps and frame skip statistics)
+        self.stage_timers = dict(Step=StageTimer(), Render=StageTimer())  # Encode/transmit are timed by buses
         self._stop = threading.Event()
         self.threads = []
         self.board_buses = []
         self.buttons = []
-        # Cairo surface for drawing on
-        self.surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, self.surface_dims[0], self.surface_dims[1])
-        self.context = cairo.Context(self.surface)
-        # Numpy array of data displayed on floor and GUI
-        # Image from Cairo surface is copied into this buffer every frame
-        self.displayed_data = numpy.zeros((self.surface_dims[1], self.surface_dims[0], 3), dtype=numpy.uint8)
+        # Frames displayed on floor and GUI (ARGB32 pixels, see channel_order)
+        # Game renders into a free slot, while buses and GUI (one reader each) read complete frames
+        stride = cairo.ImageSurface.format_stride_for_width(cairo.FORMAT_ARGB32, self.surface_dims[0])
+        self.frames = FrameExchange(
+            (self.surface_dims[1], stride // 4, 4), readers=len(MatrixController.serial_ports) + 1
+        )
+        self._gui_frames = self.frames.readers[-1]
+        self._shared_frame = None  # Copy of the latest frame for buses running in worker processes
+        # Cairo surface for drawing on (one on top of every frame buffer, so buses read it without copying)
+        self.surfaces = [
+            cairo.ImageSurface.create_for_data(
+                memoryview(frame.data), cairo.FORMAT_ARGB32, self.surface_dims[0], self.surface_dims[1], stride
+            )
+            for frame in self.frames.slots
+        ]
+        self.contexts = [cairo.Context(surface) for surface in self.surfaces]
+        self.numpy_contexts = [
+            NumpyContext(NumpySurface(frame.data, self.surface_dims[0], self.surface_dims[1]))
+            for frame in self.frames.slots
+        ]
 
         self._assign_boards()
 
         self.running = False
         self.start()
 
+    @property
+    def game(self):
+        return self._game
+
+    @game.setter
+    def game(self, game):
+        self._game = game
+        self._wake_up.set()  # New game has to be drawn right away
+
     @staticmethod
     def _assign_boards():
         for y in range(MatrixController.dimensions[1]):
@@ -63,13 +105,25 @@ class MatrixController:
         self.board_buses = []
         self.threads = []
 
-        for port in MatrixController.serial_ports:
+        if MatrixController.bus_processes:
+            self._shared_frame = SharedFrame(self.frames.shape, MatrixController.dimensions[::-1])
+            self._shared_frame.write(self.frames.latest)
+
+        for port, frames in zip(MatrixController.serial_ports, self.frames.readers):
+            if self._shared_frame is not None:
+                # Worker opens the port itself and reports if it fails
+                new_bus = BusProcess(
+                    port, self._shared_frame, MatrixController.channel_order, MatrixController.bus_class
+                )
+                self.board_buses.append(new_bus)
+                self.threads.append(new_bus)
+                continue
             try:
-                connection = serial.Serial(port=port, baudrate=500000, writeTimeout=0)
-                new_bus = BoardBus(connection, self.displayed_data)
+                connection = open_port(port)
+                new_bus = MatrixController.bus_class(connection, frames, MatrixController.channel_order)
                 self.board_buses.append(new_bus)
                 self.threads.append(new_bus)
-            except serial.SerialException as e:
+            except (serial.SerialException, ValueError) as e:
                 logging.error("Unable to open serial port {}. \n{}".format(port,e))
 
         # Data Update (Game Loop) - updates data for displaying
@@ -88,7 +142,6 @@ class MatrixController:
 
         # Enumerate/ping boards
         for bus in self.board_buses:
-            assert isinstance(bus, BoardBus)
             bus.ping_all()
 
     def stop(self):
@@ -102,18 +155,21 @@ class MatrixController:
         """
         logging.debug("Signalling matrix controller threads to stop")
         self._stop.set()
+        self._wake_up.set()
         for thread in self.threads:
             thread.join()
         logging.debug("Matrix controller stopped")
 
         logging.debug("Closing serial ports")
         for bus in self.board_buses:
-            assert isinstance(bus, BoardBus)
-            connection = bus.serial_connection
-            assert isinstance(connection, serial.Serial)
-            connection.close()
+            if isinstance(bus, BoardBus):  # Worker processes close their ports themselves
+                bus.serial_connection.close()
         logging.debug("Serial ports closed")
 
+        if self._shared_frame is not None:
+            self._shared_frame.close(unlink=True)
+            self._shared_frame = None
+
     def update_data(self):
         """
         Loop that advances the game/animation
@@ -121,11 +177,11 @@ class MatrixController:
         fps = MatrixController.data_update_FPS
         if fps == 0:
             return
-        update_period = 1.0 / fps
-
-        next_update = time.time()
+        self.clock = clock = GameClock(MatrixController.simulation_FPS or fps, fps)
+        last_game = None
+        first_frame = False  # Published even if it equals the latest frame - boards may show something else (show)
 
-        while not self._stop.isSet() and fps != 0:
+        while not self._stop.isSet():
 
             # Poll buttons -> this will call associated functions when buttons are pressed.
             for button in self.buttons:
@@ -135,48 +191,68 @@ class MatrixController:
                 except ValueError as e:
                     logging.warning("{}".format(e))
 
+            game = self.game
+            if game is not last_game:
+                clock.reset()  # New game starts from now, nothing to catch up
+                last_game = game
+                first_frame = True
+            idle_until = None if game is None else game.idle_until()
+            if idle_until is not None and idle_until > time.time():
+                # Nothing changes until idle_until (or input). Sleep, but keep polling buttons if there are any
+                self.idle_frames += 1
+                wake_up_time = min(idle_until, time.time() + MatrixController.max_idle_sleep)
+                if self.buttons:
+                    wake_up_time = min(wake_up_time, time.time() + clock.frame_period)
+                self._wake_up.wait(max(0, wake_up_time - time.time()))
+                self._wake_up.clear()
+                clock.reset()  # Game was not running - nothing to catch up
+                continue
+
             # # UPDATE
-            if self.game is not None:
-
-                self.game.step()
-                self.game.draw(self.context)
-
-                # Get data from surface and convert it to numpy array
-                self.surface.flush()
-                buf = self.surface.get_data()
-                a = numpy.frombuffer(buf, numpy.uint8)
-                a.shape = (self.surface_dims[1], self.surface_dims[0], 4)
-                # Strip Alpha values and copy to our main numpy array
-                # also switch BGR to RGB
-                numpy.copyto(self.displayed_data[:, :, 0], a[:, :, 2])
-                numpy.copyto(self.displayed_data[:, :, 1], a[:, :, 1])
-                numpy.copyto(self.displayed_data[:, :, 2], a[:, :, 0])
+            if game is not None:
+
+                frame = self.frames.begin()
+                with self.stage_timers["Step"]:
+                    for _ in range(clock.steps_due()):
+                        game.step()
+                with self.stage_timers["Render"]:
+                    if game.draws_pixels:
+                        game.draw_pixels(frame.data[:, :self.surface_dims[0]], MatrixController.channel_order)
+                        self.surfaces[frame.index].mark_dirty()  # Cairo must not keep cached pixels
+                    else:
+                        numpy_backend = MatrixController.render_backend == "numpy" and not game.requires_cairo
+                        context = (self.numpy_contexts if numpy_backend else self.contexts)[frame.index]
+                        if game.interpolates:
+                            game.draw(context, clock.alpha)
+                        else:
+                            game.draw(context)
+                        if numpy_backend:
+                            self.surfaces[frame.index].mark_dirty()
+                        else:
+                            # Make sure Cairo has written everything to frame buffer
+                            self.surfaces[frame.index].flush()
+                dirty_boards = self._dirty_boards(game.get_dirty_areas())
+
+                # Frame was started as a copy of the latest one - if nothing was drawn over it, there is nothing to send
+                if not first_frame and numpy.array_equal(frame.data, self.frames.latest.data):
+                    self.identical_frames += 1
+                else:
+                    first_frame = False
+                    self.frames.publish(frame, dirty_boards)
+                    if self._shared_frame is not None:
+                        self._shared_frame.write(frame)
+                    self._signal_update_boards(clock.deadline())
+                    if self.data_update_callback is not None:
+                        # noinspection PyCallingNonCallable
+                        self.data_update_callback()  # signal caller (GUI for example)
 
             # #UPDATE END
 
-            self._signal_update_boards()
-            if self.data_update_callback is not None:
-                # noinspection PyCallingNonCallable
-                self.data_update_callback()  # signal caller (GUI for example)
             self.fps["Game"].cycle_complete()
 
-            next_update += update_period
-            sleep_time = next_update - time.time()
-
-            skipped_frames = 0
-            while sleep_time < 0:
-                # SKIP FRAMES!
-                if self.game is not None:
-                    self.game.step()
-                next_update += update_period
-                sleep_time = next_update - time.time()
-                skipped_frames += 1
-            else:
-                # Normal execution - sleep time is positive
-                self._stop.wait(sleep_time)
-
-            if skipped_frames > 0:
-                logging.debug("skipped_frames: {}".format(skipped_frames))
+            sleep_time = clock.frame_done()
+            self._wake_up.wait(sleep_time)
+            self._wake_up.clear()
 
         logging.debug("Thread \"{}\" stopped".format(threading.current_thread().name))
 
@@ -190,7 +266,7 @@ class MatrixController:
 
         while not self._stop.isSet() and fps != 0:
             for bus in self.board_buses:
-                bus.read_sensors()
+                bus.read_sensors(next_update + update_period)
 
             next_update += update_period
             sleep_time = next_update - time.time()
@@ -199,20 +275,52 @@ class MatrixController:
 
         logging.debug("Thread \"{}\" stopped".format(threading.current_thread().name))
 
+    @staticmethod
+    def _dirty_boards(areas):
+        """
+        Finds boards under areas reported by the game.
+
+        @param areas: list of rectangles (in pixels), None if everything could have changed
+        @return: boolean numpy array (rows, columns) of boards touched by areas, None if everything could have changed
+        """
+        if areas is None:
+            return None
+        columns, rows = MatrixController.dimensions
+        dirty_boards = numpy.zeros((rows, columns), dtype=bool)
+        for area in areas:
+            # One pixel of margin for antialiasing
+            left = max(0, math.floor(area.left) - 1) // 10
+            top = max(0, math.floor(area.top) - 1) // 10
+            right = math.ceil(area.left + area.width) + 1
+            bottom = math.ceil(area.top + area.height) + 1
+            dirty_boards[top:(bottom + 9) // 10, left:(right + 9) // 10] = True
+        return dirty_boards
+
+    def get_rgb_data(self):
+        """
+        Converts the newest frame to RGB. Meant for consumers outside of the game loop (GUI preview).
+
+        @return: new numpy array (height, width, 3) of RGB values
+        """
+        frame = self._gui_frames.latest()
+        return frame.data[:, :self.surface_dims[0], MatrixController.channel_order]
+
     def reset_id_all(self):
         for bus in self.board_buses:
             bus.reset_id_all()
 
-    def _signal_update_boards(self):
+    def _signal_update_boards(self, deadline=None):
         """
         Signals all buses to refresh data displayed on boards
+
+        @param deadline: time by which refresh should be started (next frame is due)
         """
         for bus in self.board_buses:
-            bus.refresh_leds()
+            bus.refresh_leds(deadline)
 
     def add_button(self, board_id, function, args=None, override_key=None):
         self.buttons.append(
-            BoardButton(board_id, self.board_buses, function, args, override_key)
+            BoardButton(board_id, BoardBus.registry, function, args, override_key)
         )
 
     def connect(self, event_name, update_gui):
@@ -226,34 +334,29 @@ class MatrixController:
 
 class BoardButton:
     """
-        Tries to find correct board and then returns it's button's state
+        Looks up correct board from registry and then returns it's button's state
     """
 
-    def __init__(self, board_id, board_buses, function, args=None, override_key=None):
+    def __init__(self, board_id, registry, function, args=None, override_key=None):
         self.board_id = board_id
-        self.board_buses = board_buses
+        self.registry = registry
         self.function = function
         self.args = args
         self.override_key = override_key
 
         self.overridden = False  # Is button currently overridden?
-        self.board = None
         self.warning_timer = time.time()
 
     def is_pressed(self):
-        if self.board is None:
-            for bus in self.board_buses:
-                for board in bus.boards:
-                    if board.id == self.board_id:
-                        self.board = board
-        # Still not found after searching
-        if self.board is None:
+        # Board is looked up every time - it can be reset and enumerated again (as a new Board object)
+        board = self.registry.get(self.board_id)
+        if board is None:
             # If no buttons found after 1 second: Warn user
             if self.warning_timer is not None and time.time() - self.warning_timer > 1.0:
                 logging.warning("BoardButton {} not found".format(self.board_id))
                 self.warning_timer = None
             return False
-        return self.board.is_button_pressed()
+        return board.is_button_pressed()
 
     def is_overridden(self):
         return self.overridden
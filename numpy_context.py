@@ -0,0 +1,524 @@
+__author__ = 'Mark Laane'
+
+import math
+import sys
+import weakref
+
+import numpy
+
+# Index of red, green, blue and alpha byte in a pixel of ARGB32 surface (pixel is a native endian 32-bit integer)
+RGBA_BYTES = (2, 1, 0, 3) if sys.byteorder == "little" else (1, 2, 3, 0)
+_ALPHA = RGBA_BYTES[3]
+
+
+class NumpySurface():
+    """
+    ARGB32 image on top of a numpy array - same memory layout as Cairo's image surface (premultiplied alpha).
+    """
+
+    def __init__(self, data, width, height):
+        """
+        @param data: numpy array (height, stride // 4, 4) of uint8 - pixels are not copied
+        """
+        self.data = data[:height, :width]
+        self.width = width
+        self.height = height
+
+    @staticmethod
+    def create(width, height):
+        """
+        @return: new transparent surface
+        """
+        return NumpySurface(numpy.zeros((height, width, 4), dtype=numpy.uint8), width, height)
+
+    def get_width(self):
+        return self.width
+
+    def get_height(self):
+        return self.height
+
+    def flush(self):
+        pass
+
+    def mark_dirty(self):
+        pass
+
+
+class SolidSource():
+    """
+    Solid color source (see NumpyContext.get_source)
+    """
+
+    def __init__(self, red, green, blue, alpha=1.0):
+        self.rgba = red, green, blue, alpha
+
+    def get_rgba(self):
+        return self.rgba
+
+
+class SurfaceSource():
+    """
+    Image source placed on the surface (see NumpyContext.set_source_surface).
+    Pixels are always sampled with nearest neighbour (Cairo's FILTER_FAST).
+    """
+
+    def __init__(self, pixels, matrix):
+        """
+        @param pixels: numpy array (height, width, 4) of ARGB32 pixels
+        @param matrix: (scale x, scale y, offset x, offset y) - device position of a source pixel
+        """
+        self.pixels = pixels
+        self.matrix = matrix
+        self.filter = None
+
+    def set_filter(self, pixel_filter):
+        self.filter = pixel_filter
+
+    def get_filter(self):
+        return self.filter
+
+
+class NumpyContext():
+    """
+    Drawing context with the subset of Cairo API used by the games, rendering straight into a numpy frame.
+
+    Supported: rectangles, arcs, lines, fill, stroke, paint with solid colors, linear gradients and image surfaces,
+    save/restore, translate and scale. Everything is composited with OVER operator.
+    Coverage of rectangles is exact, other shapes are antialiased with samples x samples points per pixel.
+    Differences from Cairo:
+        - subpaths of one fill are combined as a union (overlapping subpaths are not cut out by winding rule)
+        - stroke joins of polygons are round (rectangles have miter joins like in Cairo)
+        - images are sampled with nearest neighbour
+        - no text, clipping, operators or rotation - games using them must be drawn with Cairo (Game.requires_cairo)
+    """
+    samples = 4  # Antialiasing samples per pixel (in both directions)
+
+    _sources = weakref.WeakKeyDictionary()  # Cairo pattern -> converted source (patterns are not changed after use)
+    _images = weakref.WeakKeyDictionary()  # Cairo image surface -> numpy view of it's pixels
+
+    def __init__(self, surface):
+        """
+        @param surface: NumpySurface to draw on
+        """
+        self.surface = surface
+        self._data = surface.data
+        self._matrix = 1.0, 1.0, 0.0, 0.0  # User space -> device: scale x, scale y, offset x, offset y
+        self._line_width = 2.0
+        self._source = ("solid", numpy.array((0, 0, 0, 255), dtype=numpy.float32))
+        self._source_object = SolidSource(0, 0, 0)
+        self._states = []
+        self._shapes = []  # ("rect", x0, y0, x1, y1), ("circle", x, y, radius) or ("polygon", points, closed)
+        self._points = []  # Points of the polygon being built (device space)
+        self._current_point = None
+
+    def get_target(self):
+        return self.surface
+
+    # State
+
+    def save(self):
+        self._states.append((self._matrix, self._line_width, self._source, self._source_object))
+
+    def restore(self):
+        self._matrix, self._line_width, self._source, self._source_object = self._states.pop()
+
+    def translate(self, x, y):
+        scale_x, scale_y, offset_x, offset_y = self._matrix
+        self._matrix = scale_x, scale_y, offset_x + x * scale_x, offset_y + y * scale_y
+
+    def scale(self, x, y=None):
+        if y is None:
+            y = x
+        scale_x, scale_y, offset_x, offset_y = self._matrix
+        self._matrix = scale_x * x, scale_y * y, offset_x, offset_y
+
+    def identity_matrix(self):
+        self._matrix = 1.0, 1.0, 0.0, 0.0
+
+    def set_line_width(self, width):
+        self._line_width = width
+
+    def get_line_width(self):
+        return self._line_width
+
+    # Sources
+
+    def set_source_rgb(self, red, green, blue):
+        self.set_source_rgba(red, green, blue, 1.0)
+
+    def set_source_rgba(self, red, green, blue, alpha=1.0):
+        self._source = ("solid", self._premultiplied(red, green, blue, alpha))
+        self._source_object = SolidSource(red, green, blue, alpha)
+
+    def set_source(self, pattern):
+        """
+        @param pattern: Cairo SolidPattern or LinearGradient, or source returned by get_source()
+        """
+        self._source_object = pattern
+        if isinstance(pattern, SurfaceSource):
+            self._source = ("surface", pattern)
+            return
+        source = NumpyContext._sources.get(pattern) if not isinstance(pattern, SolidSource) else None
+        if source is None:
+            source = self._convert(pattern)
+            if not isinstance(pattern, SolidSource):
+                NumpyContext._sources[pattern] = source
+        if source[0] == "linear":
+            # Gradient is placed in user space of the moment source is set (like in Cairo)
+            _, (x0, y0, x1, y1), offsets, colors = source
+            source = "linear", self._device(x0, y0) + self._device(x1, y1), offsets, colors
+        self._source = source
+
+    def set_source_surface(self, surface, x=0.0, y=0.0):
+        """
+        @param surface: NumpySurface or Cairo ImageSurface (ARGB32)
+        """
+        if isinstance(surface, NumpySurface):
+            pixels = surface.data
+        else:
+            pixels = NumpyContext._images.get(surface)
+            if pixels is None:
+                pixels = numpy.frombuffer(surface.get_data(), dtype=numpy.uint8).reshape(
+                    surface.get_height(), surface.get_stride() // 4, 4
+                )[:, :surface.get_width()]
+                NumpyContext._images[surface] = pixels
+        scale_x, scale_y, _, _ = self._matrix
+        self.set_source(SurfaceSource(pixels, (scale_x, scale_y) + self._device(x, y)))
+
+    def get_source(self):
+        return self._source_object
+
+    @staticmethod
+    def _premultiplied(red, green, blue, alpha):
+        color = numpy.empty(4, dtype=numpy.float32)
+        color[list(RGBA_BYTES)] = red * alpha * 255, green * alpha * 255, blue * alpha * 255, alpha * 255
+        return color
+
+    @staticmethod
+    def _convert(pattern):
+        if hasattr(pattern, "get_rgba"):
+            return "solid", NumpyContext._premultiplied(*pattern.get_rgba())
+        if hasattr(pattern, "get_linear_points"):
+            stops = pattern.get_color_stops()
+            offsets = numpy.array([stop[0] for stop in stops], dtype=numpy.float32)
+            colors = numpy.empty((len(stops), 4), dtype=numpy.float32)
+            colors[:, list(RGBA_BYTES)] = [stop[1:] for stop in stops]
+            return "linear", pattern.get_linear_points(), offsets, colors
+        raise NotImplementedError("{} is not supported by NumpyContext".format(type(pattern).__name__))
+
+    # Path
+
+    def _device(self, x, y):
+        scale_x, scale_y, offset_x, offset_y = self._matrix
+        return x * scale_x + offset_x, y * scale_y + offset_y
+
+    def new_path(self):
+        self._shapes = []
+        self._points = []
+        self._current_point = None
+
+    def move_to(self, x, y):
+        self._end_polygon(False)
+        self._current_point = self._device(x, y)
+        self._points = [self._current_point]
+
+    def line_to(self, x, y):
+        if self._current_point is None:
+            self.move_to(x, y)
+            return
+        self._current_point = self._device(x, y)
+        self._points.append(self._current_point)
+
+    def rectangle(self, x, y, width, height):
+        self._end_polygon(False)
+        x0, y0 = self._device(x, y)
+        x1, y1 = self._device(x + width, y + height)
+        self._shapes.append(("rect", min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)))
+        self._current_point = x0, y0
+
+    def arc(self, x, y, radius, angle1, angle2):
+        while angle2 < angle1:
+            angle2 += 2 * math.pi
+        scale_x, scale_y, _, _ = self._matrix
+        if not self._points and angle2 - angle1 >= 2 * math.pi and scale_x == scale_y:
+            center = self._device(x, y)
+            self._shapes.append(("circle", center[0], center[1], radius * abs(scale_x)))
+            self._current_point = self._device(x + radius * math.cos(angle2), y + radius * math.sin(angle2))
+            return
+        segments = max(4, math.ceil((angle2 - angle1) * max(1.0, radius * max(abs(scale_x), abs(scale_y))) * 2))
+        for i in range(segments + 1):
+            angle = angle1 + (angle2 - angle1) * i / segments
+            self.line_to(x + radius * math.cos(angle), y + radius * math.sin(angle))
+
+    def close_path(self):
+        if self._points:
+            start = self._points[0]
+            self._end_polygon(True)
+            self._current_point = start
+
+    def _end_polygon(self, closed):
+        if len(self._points) > 1:
+            self._shapes.append(("polygon", numpy.array(self._points, dtype=numpy.float64), closed))
+        self._points = []
+
+    def _path(self):
+        self._end_polygon(False)
+        return self._shapes
+
+    # Drawing
+
+    def paint(self):
+        height, width = self._data.shape[:2]
+        if self._source[0] == "surface":
+            box = self._clip(*self._surface_extents(self._source[1]))
+            if box is None:
+                return
+        else:
+            box = 0, 0, width, height
+        self._composite(box, None)
+
+    def fill(self):
+        self.fill_preserve()
+        self.new_path()
+
+    def fill_preserve(self):
+        coverage = self._coverage(self._path(), stroke=False)
+        if coverage is not None:
+            self._composite(*coverage)
+
+    def stroke(self):
+        self.stroke_preserve()
+        self.new_path()
+
+    def stroke_preserve(self):
+        coverage = self._coverage(self._path(), stroke=True)
+        if coverage is not None:
+            self._composite(*coverage)
+
+    def show_text(self, text):
+        raise NotImplementedError("NumpyContext can not draw text, game has to set requires_cairo")
+
+    # Rasterization
+
+    def _clip(self, x0, y0, x1, y1):
+        """
+        @return: pixel box (left, top, right, bottom) covering the area on the surface, None if it is outside
+        """
+        height, width = self._data.shape[:2]
+        box = max(0, math.floor(x0)), max(0, math.floor(y0)), min(width, math.ceil(x1)), min(height, math.ceil(y1))
+        if box[0] >= box[2] or box[1] >= box[3]:
+            return None
+        return box
+
+    def _coverage(self, shapes, stroke):
+        """
+        @return: (pixel box, coverage array (height, width) of 0...1, None if fully covered), None if nothing is covered
+        """
+        half_width = self._line_width * abs(self._matrix[0]) / 2 if stroke else 0.0
+        boxes = [(shape, self._clip(*self._extents(shape, half_width))) for shape in shapes]
+        boxes = [(shape, box) for shape, box in boxes if box is not None]
+        if not boxes:
+            return None
+        if len(boxes) == 1:
+            shape, box = boxes[0]
+            return box, self._shape_coverage(shape, box, stroke, half_width)
+
+        box = (
+            min(b[0] for _, b in boxes), min(b[1] for _, b in boxes),
+            max(b[2] for _, b in boxes), max(b[3] for _, b in boxes)
+        )
+        coverage = numpy.zeros((box[3] - box[1], box[2] - box[0]), dtype=numpy.float32)
+        for shape, shape_box in boxes:
+            shape_coverage = self._shape_coverage(shape, shape_box, stroke, half_width)
+            area = coverage[shape_box[1] - box[1]:shape_box[3] - box[1], shape_box[0] - box[0]:shape_box[2] - box[0]]
+            if shape_coverage is None:
+                area[...] = 1
+            else:
+                numpy.maximum(area, shape_coverage, out=area)
+        return box, coverage
+
+    @staticmethod
+    def _extents(shape, half_width):
+        if shape[0] == "rect":
+            _, x0, y0, x1, y1 = shape
+        elif shape[0] == "circle":
+            _, x, y, radius = shape
+            x0, y0, x1, y1 = x - radius, y - radius, x + radius, y + radius
+        else:
+            points = shape[1]
+            (x0, y0), (x1, y1) = points.min(axis=0), points.max(axis=0)
+        return x0 - half_width, y0 - half_width, x1 + half_width, y1 + half_width
+
+    def _shape_coverage(self, shape, box, stroke, half_width):
+        if shape[0] == "rect":
+            _, x0, y0, x1, y1 = shape
+            coverage = self._rect_coverage(box, x0 - half_width, y0 - half_width, x1 + half_width, y1 + half_width)
+            if stroke and x1 - x0 > 2 * half_width and y1 - y0 > 2 * half_width:
+                coverage -= self._rect_coverage(box, x0 + half_width, y0 + half_width, x1 - half_width, y1 - half_width)
+            if coverage.min() >= 1:
+                return None
+            return coverage
+
+        if shape[0] == "circle":
+            return self._circle_coverage(box, shape[1], shape[2], shape[3], stroke, half_width)
+
+        xs, ys = self._sample_points(box)
+        if stroke:
+            inside = self._polygon_stroke(shape[1], shape[2], xs, ys, half_width)
+        else:
+            inside = self._polygon_fill(shape[1], xs, ys)
+        n = NumpyContext.samples
+        return inside.reshape(box[3] - box[1], n, box[2] - box[0], n).mean(axis=(1, 3), dtype=numpy.float32)
+
+    @staticmethod
+    def _rect_coverage(box, x0, y0, x1, y1):
+        left, top, right, bottom = box
+        columns = numpy.arange(left, right, dtype=numpy.float32)
+        rows = numpy.arange(top, bottom, dtype=numpy.float32)
+        coverage_x = numpy.clip(numpy.minimum(columns + 1, x1) - numpy.maximum(columns, x0), 0, 1)
+        coverage_y = numpy.clip(numpy.minimum(rows + 1, y1) - numpy.maximum(rows, y0), 0, 1)
+        return numpy.outer(coverage_y, coverage_x)
+
+    @staticmethod
+    def _circle_coverage(box, x, y, radius, stroke, half_width):
+        """
+        Pixels that are completely inside or outside are decided by their center, only pixels on the edge are sampled
+        """
+        left, top, right, bottom = box
+        dx = numpy.arange(left, right, dtype=numpy.float32) + 0.5 - x
+        dy = numpy.arange(top, bottom, dtype=numpy.float32)[:, None] + 0.5 - y
+        if stroke:
+            depth = half_width - numpy.abs(numpy.hypot(dx, dy) - radius)  # Distance from the edge, > 0 inside
+        else:
+            depth = radius - numpy.hypot(dx, dy)
+        coverage = (depth > 0).astype(numpy.float32)
+        rows, columns = numpy.nonzero(numpy.abs(depth) < 0.71)  # Half of pixel diagonal
+        if len(rows):
+            n = NumpyContext.samples
+            offsets = (numpy.arange(n, dtype=numpy.float32) + 0.5) / n - 0.5
+            distance = numpy.hypot(
+                dx[columns][:, None, None] + offsets, dy[rows, 0][:, None, None] + offsets[:, None]
+            )
+            if stroke:
+                inside = numpy.abs(distance - radius) <= half_width
+            else:
+                inside = distance <= radius
+            coverage[rows, columns] = inside.mean(axis=(1, 2))
+        if coverage.min() >= 1:
+            return None
+        return coverage
+
+    @staticmethod
+    def _sample_points(box):
+        """
+        @return: x (1, width * samples) and y (height * samples, 1) coordinates of sample points in the box
+        """
+        left, top, right, bottom = box
+        n = NumpyContext.samples
+        offsets = (numpy.arange(n) + 0.5) / n
+        xs = (numpy.arange(left, right)[:, None] + offsets).reshape(1, -1)
+        ys = (numpy.arange(top, bottom)[:, None] + offsets).reshape(-1, 1)
+        return xs, ys
+
+    @staticmethod
+    def _polygon_fill(points, xs, ys):
+        """
+        Non-zero winding rule (polygon is closed implicitly)
+        """
+        winding = numpy.zeros((ys.shape[0], xs.shape[1]), dtype=numpy.int16)
+        for (xa, ya), (xb, yb) in zip(points, numpy.roll(points, -1, axis=0)):
+            if ya == yb:
+                continue
+            side = (xb - xa) * (ys - ya) - (xs - xa) * (yb - ya)  # > 0 - sample is left of the edge
+            if ya < yb:
+                crossing = (ya <= ys) & (ys < yb)
+                winding += crossing & (side > 0)
+            else:
+                crossing = (yb <= ys) & (ys < ya)
+                winding -= crossing & (side < 0)
+        return winding != 0
+
+    @staticmethod
+    def _polygon_stroke(points, closed, xs, ys, half_width):
+        inside = numpy.zeros((ys.shape[0], xs.shape[1]), dtype=bool)
+        ends = numpy.roll(points, -1, axis=0) if closed else points[1:]
+        for (xa, ya), (xb, yb) in zip(points, ends):
+            dx, dy = xb - xa, yb - ya
+            length_squared = dx * dx + dy * dy
+            if length_squared == 0:
+                t = 0
+            else:
+                t = numpy.clip(((xs - xa) * dx + (ys - ya) * dy) / length_squared, 0, 1)
+            inside |= (xs - xa - t * dx) ** 2 + (ys - ya - t * dy) ** 2 <= half_width * half_width
+        return inside
+
+    # Compositing
+
+    @staticmethod
+    def _surface_extents(source):
+        scale_x, scale_y, offset_x, offset_y = source.matrix
+        height, width = source.pixels.shape[:2]
+        x0, x1 = sorted((offset_x, offset_x + width * scale_x))
+        y0, y1 = sorted((offset_y, offset_y + height * scale_y))
+        return x0, y0, x1, y1
+
+    def _source_pixels(self, box):
+        """
+        @return: premultiplied source colors (0...255) in the box - array (height, width, 4) or one color (4,)
+        """
+        kind = self._source[0]
+        left, top, right, bottom = box
+        if kind == "solid":
+            return self._source[1]
+
+        if kind == "linear":
+            _, (x0, y0, x1, y1), offsets, colors = self._source
+            dx, dy = x1 - x0, y1 - y0
+            xs = numpy.arange(left, right, dtype=numpy.float32) + 0.5 - x0
+            ys = numpy.arange(top, bottom, dtype=numpy.float32)[:, None] + 0.5 - y0
+            t = (xs * dx + ys * dy) / ((dx * dx + dy * dy) or 1)
+            # Colors are interpolated between stops around t (pad outside, equal offsets make a hard edge)
+            high = numpy.clip(numpy.searchsorted(offsets, t, side="right"), 0, len(offsets) - 1)
+            low = numpy.maximum(high - 1, 0)
+            span = offsets[high] - offsets[low]
+            weight = numpy.clip((t - offsets[low]) / numpy.where(span > 0, span, 1), 0, 1)
+            weight = numpy.where(span > 0, weight, 1)[..., None]
+            color = colors[low] * (1 - weight) + colors[high] * weight
+            color[..., list(RGBA_BYTES[:3])] *= color[..., _ALPHA, None]
+            return color * 255
+
+        source = self._source[1]
+        scale_x, scale_y, offset_x, offset_y = source.matrix
+        pixels = source.pixels
+        if scale_x == scale_y == 1 and offset_x == int(offset_x) and offset_y == int(offset_y):
+            # Unscaled and pixel aligned (sprites) - plain copy
+            result = numpy.zeros((bottom - top, right - left, 4), dtype=numpy.float32)
+            src_left, src_top = left - int(offset_x), top - int(offset_y)
+            x0, y0 = max(0, src_left), max(0, src_top)
+            x1, y1 = min(pixels.shape[1], src_left + right - left), min(pixels.shape[0], src_top + bottom - top)
+            if x0 < x1 and y0 < y1:
+                result[y0 - src_top:y1 - src_top, x0 - src_left:x1 - src_left] = pixels[y0:y1, x0:x1]
+            return result
+        columns = numpy.floor((numpy.arange(left, right) + 0.5 - offset_x) / scale_x).astype(numpy.intp)
+        rows = numpy.floor((numpy.arange(top, bottom) + 0.5 - offset_y) / scale_y).astype(numpy.intp)
+        valid = ((rows >= 0) & (rows < pixels.shape[0]))[:, None] & ((columns >= 0) & (columns < pixels.shape[1]))
+        result = pixels[numpy.clip(rows, 0, pixels.shape[0] - 1)[:, None], numpy.clip(columns, 0, pixels.shape[1] - 1)]
+        return numpy.where(valid[..., None], result, 0).astype(numpy.float32)
+
+    def _composite(self, box, coverage):
+        """
+        Source OVER surface in the box, weighted by coverage (None - fully covered)
+        """
+        left, top, right, bottom = box
+        destination = self._data[top:bottom, left:right]
+        source = self._source_pixels(box)
+        if coverage is None and source.ndim == 1 and source[_ALPHA] >= 255:
+            destination[...] = source  # Opaque solid color replaces everything
+            return
+        if coverage is not None:
+            coverage = coverage[..., None]
+            source = source * coverage
+        transparency = 1 - source[..., _ALPHA, None] / 255
+        result = destination * transparency + source
+        numpy.clip(result + 0.5, 0, 255, out=result)
+        destination[...] = result
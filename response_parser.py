@@ -0,0 +1,94 @@
+__author__ = 'Mark Laane'
+
+from collections import namedtuple
+import logging
+import re
+
+from ledBoard import Board
+
+
+# One response from a board: id of the board, Board.Command code and payload bytes
+Response = namedtuple("Response", ["id", "code", "data"])
+
+
+def _byte_class(values):
+    return b"".join(b"\\x%02x" % value for value in values)
+
+
+_codes = _byte_class(Board.command_codes)
+_data = b"[^<>\\x80-\\xff" + _codes + b"]"  # Anything that is not id, code or echo mark
+
+# Complete echo frame or complete response (id, payload, code)
+_frame_pattern = re.compile(b"<[^>]*>|([\\x80-\\xfe])(" + _data + b"*)([" + _codes + b"])")
+# Response that has not been completely received yet
+_partial_pattern = re.compile(b"[\\x80-\\xfe]" + _data + b"*\\Z")
+
+_commands = {command.value: command for command in Board.Command}
+
+
+class ResponseParser():
+    """
+    Incremental parser for data received from bus.
+
+    Whole chunks returned by serial read() are scanned with regular expressions,
+    so echo of sent commands (<...>) is skipped in bulk, not byte by byte.
+    Only incomplete response at the end of a chunk is kept for the next call.
+    """
+    max_buffer_size = 300  # Same as command buffer on the board
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._in_echo = False  # Last chunk ended inside echo frame
+
+    def feed(self, data):
+        """
+        Parses next chunk of received data
+
+        @param data: bytes received from serial
+        @return: list of complete Responses
+        """
+        buffer = self._buffer
+        start = 0
+        if self._in_echo:
+            start = data.find(b">") + 1
+            if start == 0:
+                return []  # Whole chunk is echo
+        buffer += data[start:] if start else data
+
+        # Echo frame may be cut off at the end of chunk - it is skipped in next call
+        echo_start = buffer.rfind(b"<")
+        if echo_start < 0 or buffer.find(b">", echo_start) >= 0:
+            echo_start = len(buffer)
+            self._in_echo = False
+        else:
+            self._in_echo = True
+
+        responses = []
+        end = 0
+        for match in _frame_pattern.finditer(buffer, 0, echo_start):
+            if match.start() != end:
+                self._discard(buffer, end, match.start())
+            end = match.end()
+            board_id = match.group(1)
+            if board_id is not None:
+                responses.append(Response(board_id[0], _commands[match.group(3)[0]], match.group(2)))
+
+        partial = None
+        if not self._in_echo:
+            partial = _partial_pattern.search(buffer, end)
+        partial_start = echo_start if partial is None else partial.start()
+        if partial_start != end:
+            self._discard(buffer, end, partial_start)
+
+        if partial is None:
+            del buffer[:]
+        else:
+            del buffer[:partial_start]
+            if len(buffer) > ResponseParser.max_buffer_size:
+                self._discard(buffer, 0, len(buffer))
+                del buffer[:]
+        return responses
+
+    @staticmethod
+    def _discard(buffer, start, end):
+        logging.error("incomplete data from bus: {}".format(bytes(buffer[start:end])))
@@ -0,0 +1,214 @@
+__author__ = 'Mark Laane'
+
+import logging
+import mmap
+import struct
+import threading
+import time
+
+import numpy
+
+from ledBoard import COMMAND_OVERHEAD
+from frame_encoder import FrameEncoder
+
+
+class ShowFile():
+    """
+    Compiled show: LED commands of every board for every frame, ready to be written to the bus as they are.
+
+    File layout (little endian):
+        header - magic, version, number of boards, number of frames, packet stride, duration (seconds)
+        board ids - uint8 per board
+        timestamps - float64 per frame, time (seconds from the start of the show) frame is displayed at
+        dirty - uint8 per frame and board, board's packet differs from the previous frame
+        packets - stride bytes per frame and board, complete <id data cmd> command
+
+    File is memory-mapped, packets are read straight from the mapping.
+    """
+    magic = b"LEDSHOW\0"
+    version = 1
+    _header = struct.Struct("<8sHHIHd")
+    stride = FrameEncoder.packet_size + COMMAND_OVERHEAD  # Bytes of one LED data command
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n_boards, n_frames, stride, self.duration = ShowFile._header.unpack_from(self._mmap)
+        if magic != ShowFile.magic or version != ShowFile.version or stride != ShowFile.stride:
+            self._mmap.close()
+            raise ValueError("'{}' is not a show file of version {}".format(path, ShowFile.version))
+
+        offsets = ShowFile.layout(n_boards, n_frames)
+        self.board_ids = numpy.frombuffer(self._mmap, dtype=numpy.uint8, count=n_boards, offset=offsets[0])
+        self.timestamps = numpy.frombuffer(self._mmap, dtype="<f8", count=n_frames, offset=offsets[1])
+        self.dirty = numpy.frombuffer(self._mmap, dtype=bool, count=n_frames * n_boards, offset=offsets[2]).reshape(
+            n_frames, n_boards
+        )
+        self.packets = numpy.frombuffer(
+            self._mmap, dtype=numpy.uint8, count=n_frames * n_boards * stride, offset=offsets[3]
+        ).reshape(n_frames, n_boards, stride)
+        self.board_rows = {int(board_id): row for row, board_id in enumerate(self.board_ids)}  # board id -> row
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def closed(self):
+        return self.packets is None
+
+    @staticmethod
+    def layout(n_boards, n_frames):
+        """
+        @return: offsets of board ids, timestamps, dirty flags and packets
+        """
+        board_ids = ShowFile._header.size
+        timestamps = board_ids + n_boards
+        dirty = timestamps + 8 * n_frames
+        packets = dirty + n_frames * n_boards
+        return board_ids, timestamps, dirty, packets
+
+    def packet(self, index, row):
+        """
+        @return: memoryview of LED data command of board at given row in frame index
+        """
+        return self.packets[index, row].data
+
+    def dirty_between(self, first_index, last_index):
+        """
+        @return: boolean array of boards whose packet changed after frame first_index up to last_index,
+            None if frames are not consecutive (everything has to be sent)
+        """
+        if first_index is None or not first_index < last_index:
+            return None
+        return self.dirty[first_index + 1:last_index + 1].any(axis=0)
+
+    def close(self):
+        self.board_ids = self.timestamps = self.dirty = self.packets = None  # Views must go before the mapping
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass  # Bus still holds a frame, mapping is closed when it is released
+
+
+class ShowWriter():
+    """
+    Writes a show file frame by frame.
+
+    with ShowWriter(path, board_ids, n_frames) as writer:
+        writer.add(timestamp, commands)
+    """
+
+    def __init__(self, path, board_ids, n_frames):
+        """
+        @param board_ids: ids of the boards, in the order their commands are given to add()
+        @param n_frames: number of frames that will be added
+        """
+        if n_frames < 1:
+            raise ValueError("Show must have at least one frame, {} given".format(n_frames))
+        self._file = open(path, "wb")
+        self._n_frames = n_frames
+        self._offsets = ShowFile.layout(len(board_ids), n_frames)
+        self._timestamps = numpy.zeros(n_frames, dtype="<f8")
+        self._dirty = numpy.zeros((n_frames, len(board_ids)), dtype=bool)
+        self._previous = None
+        self._index = 0
+        self._file.write(bytes(self._offsets[3]))  # Header and tables are written when all frames are known
+        self._file.seek(self._offsets[0])
+        self._file.write(bytes(board_ids))
+        self._file.seek(self._offsets[3])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, *args):
+        if exception_type is not None:
+            self._file.close()  # Incomplete show
+            return
+        self.close()
+
+    def add(self, timestamp, commands):
+        """
+        @param timestamp: time (seconds from the start of the show) frame is displayed at
+        @param commands: numpy array (boards, ShowFile.stride) of LED data commands
+        """
+        if self._previous is None:
+            self._dirty[self._index] = True
+        else:
+            self._dirty[self._index] = (commands != self._previous).any(axis=1)
+        self._previous = commands.copy()
+        self._timestamps[self._index] = timestamp
+        self._file.write(commands.tobytes())
+        self._index += 1
+
+    def close(self, duration=None):
+        """
+        @param duration: length of the show (seconds), default - one frame period after the last frame
+            (show of a single frame has no frame period, it's duration is 0 and it is not looped)
+        """
+        if self._file.closed:
+            return
+        if self._index != self._n_frames:
+            raise ValueError("{} frames added, {} expected".format(self._index, self._n_frames))
+        if duration is None:
+            period = self._timestamps[-1] - self._timestamps[-2] if self._n_frames > 1 else 0
+            duration = self._timestamps[-1] + period
+        n_boards = self._dirty.shape[1]
+        self._file.seek(0)
+        self._file.write(ShowFile._header.pack(
+            ShowFile.magic, ShowFile.version, n_boards, self._n_frames, ShowFile.stride, duration
+        ))
+        self._file.seek(self._offsets[1])
+        self._file.write(self._timestamps.tobytes())
+        self._file.write(self._dirty.tobytes())
+        self._file.close()
+
+
+class ShowPlayer():
+    """
+    Plays a compiled show on buses: at the time of every frame, buses are told to write it's packets.
+    Nothing is rendered or encoded.
+    """
+    loop = True  # Start from the beginning when show ends
+
+    def __init__(self, show, board_buses):
+        self.show = show
+        self.board_buses = board_buses
+        self.skipped_frames = 0  # Frames not sent because player was late
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="Show Player")
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        logging.debug("Playing show {}".format(self.show.path))
+        timestamps = self.show.timestamps
+        start = time.perf_counter()
+        index = 0
+        while not self._stop.is_set():
+            if index == len(timestamps):
+                if not ShowPlayer.loop or self.show.duration <= 0:
+                    break  # (Show without duration would be restarted right away, over and over again)
+                start += self.show.duration
+                index = 0
+
+            wait_time = start + timestamps[index] - time.perf_counter()
+            if wait_time > 0 and self._stop.wait(wait_time):
+                break
+            # If late, jump to the newest frame that is due
+            due = int(numpy.searchsorted(timestamps, time.perf_counter() - start, side="right")) - 1
+            if due > index:
+                self.skipped_frames += due - index
+                index = due
+
+            next_time = timestamps[index + 1] if index + 1 < len(timestamps) else self.show.duration
+            deadline = time.time() + max(0.0, start + next_time - time.perf_counter())
+            for bus in self.board_buses:
+                bus.show_frame(self.show, index, deadline)
+            index += 1
+        logging.debug("Show {} stopped".format(self.show.path))
@@ -10,4 +10,85 @@ class Timer(object):
     def __exit__(self, *args):
         self.end = time.time()
         self.seconds = self.end - self.start
-        self.milliseconds = self.seconds * 1000
\ No newline at end of file
+        self.milliseconds = self.seconds * 1000
+
+
+class StageTimer(object):
+    """
+    Measures a stage that is run repeatedly (with StageTimer: ...).
+    Keeps duration of the last run, moving average and maximum.
+    """
+    smoothing = 0.1  # Weight of the last run in moving average
+
+    def __init__(self):
+        self.count = 0
+        self.last = 0.0  # All durations are in seconds
+        self.average = 0.0
+        self.maximum = 0.0
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.last = time.perf_counter() - self._start
+        if self.count == 0:
+            self.average = self.last
+        else:
+            self.average += StageTimer.smoothing * (self.last - self.average)
+        self.maximum = max(self.maximum, self.last)
+        self.count += 1
+
+
+class DeadlineSleeper(object):
+    """
+    Sleeps until a deadline (time.perf_counter) with sub-millisecond precision.
+
+    OS sleep can overshoot by a scheduler tick, so it is only used until spin_threshold before the deadline,
+    rest of the wait is spent spinning (yielding to other threads on every turn).
+    Overshoot of every wait is counted in a histogram.
+    """
+    spin_threshold = 0.001  # Seconds before deadline when sleeping stops and spinning starts
+    histogram_bins = (10, 20, 50, 100, 200, 500, 1000)  # Upper bounds of histogram bins in microseconds
+
+    def __init__(self):
+        self.waits = 0
+        self.histogram = [0] * (len(DeadlineSleeper.histogram_bins) + 1)  # Last bin counts everything above
+        self.max_overshoot = 0.0  # Seconds
+
+    def sleep_until(self, deadline):
+        """
+        @param deadline: time (time.perf_counter()) to return at
+        """
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            return
+        while remaining > DeadlineSleeper.spin_threshold:
+            time.sleep(remaining - DeadlineSleeper.spin_threshold)
+            remaining = deadline - time.perf_counter()
+        while remaining > 0:
+            time.sleep(0)  # Lets other threads run (GIL is released)
+            remaining = deadline - time.perf_counter()
+        self._record(-remaining)
+
+    def _record(self, overshoot):
+        self.waits += 1
+        self.max_overshoot = max(self.max_overshoot, overshoot)
+        overshoot_us = overshoot * 1000000
+        for i, upper_bound in enumerate(DeadlineSleeper.histogram_bins):
+            if overshoot_us < upper_bound:
+                self.histogram[i] += 1
+                return
+        self.histogram[-1] += 1
+
+    def snapshot(self):
+        """
+        @return: dictionary of wait statistics (histogram is a list of (upper bound in us or None, count))
+        """
+        bounds = list(DeadlineSleeper.histogram_bins) + [None]
+        return {
+            "waits": self.waits,
+            "max overshoot": self.max_overshoot,
+            "histogram": list(zip(bounds, self.histogram))
+        }